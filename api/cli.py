@@ -0,0 +1,213 @@
+"""Encrypt, decrypt, sign or verify JSONL files in bulk, with the handlers of the API but without HTTP.
+
+Each line of the input is processed as a record of the matching ``/stream`` endpoint, and the output has one
+``{"status": ..., "body": ...}`` line per record, in the input order. Run with ``python -m api.cli``, see ``--help`` for
+options.
+"""
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from http import HTTPStatus
+import multiprocessing
+from os import cpu_count
+import sys
+from time import monotonic
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .config.fields import BatchFields
+from .controllers.batch import ItemOperation, iter_lines, process_line
+from .controllers.encryption import EncryptionHandler
+from .controllers.signature import SignatureHandler
+from .helpers.codecs import default_codec
+from .helpers.crypters import get_crypter
+from .helpers.signer import HMACSigner
+from .services.encryption import decrypt_item, encrypt_item
+from .services.signature import sign_item, verify_item
+
+COMMANDS = ("encrypt", "decrypt", "sign", "verify")
+ERROR_MESSAGES = {
+    "encrypt": "Unable to encrypt payload",
+    "decrypt": "Unable to decrypt payload",
+    "sign": "Unable to sign payload",
+    "verify": "Unable to verify payload"
+}
+READ_SIZE = 1024 * 1024
+# Batches waiting for a worker, per worker, bounding the memory used whatever the input size
+QUEUED_BATCHES_PER_WORKER = 4
+
+# Operations built once per process, as handlers are long-lived
+_operations: Dict[str, ItemOperation] = {}
+
+
+def get_operation(command: str) -> ItemOperation:
+    """Return the operation run on each record for a command, built on first use in the current process.
+
+    :param str command: One of ``COMMANDS``
+    """
+    if command not in _operations:
+        if command == "encrypt":
+            _operations[command] = partial(encrypt_item, EncryptionHandler(crypter=get_crypter()))
+        elif command == "decrypt":
+            _operations[command] = partial(decrypt_item, EncryptionHandler(crypter=get_crypter()))
+        elif command == "sign":
+            _operations[command] = partial(sign_item, SignatureHandler(signer=HMACSigner()))
+        else:
+            _operations[command] = partial(verify_item, SignatureHandler(signer=HMACSigner()))
+    return _operations[command]
+
+
+def process_records(lines: List[bytes], command: str) -> Tuple[bytes, int, int]:
+    """Process a batch of JSON lines, run by the worker processes.
+
+    :param list lines: Raw JSON lines, blank lines are skipped
+    :param str command: One of ``COMMANDS``
+
+    :return: The NDJSON result lines, the number of records and the number of failed records
+    """
+    operation, error_message = get_operation(command), ERROR_MESSAGES[command]
+    output, failures = [], 0
+    for line in lines:
+        if not line.strip():
+            continue
+        result = process_line(line, operation, error_message)
+        failures += result[BatchFields.status] >= HTTPStatus.BAD_REQUEST
+        output.append(default_codec.encode(result))
+    output.append(b"")
+    return b"\n".join(output), len(output) - 1, failures
+
+
+def iter_batches(stream: BinaryIO, batch_size: int) -> Iterator[Tuple[List[bytes], int]]:
+    """Read a JSONL stream by buffered chunks and group its lines in batches of about ``batch_size`` bytes.
+
+    :param stream: A readable binary stream
+    :param int batch_size: Minimum size in bytes of each batch but the last one
+
+    :return: An iterator of batches, as a list of lines and their size in bytes
+    """
+    batch, size = [], 0
+    for line in iter_lines(stream, READ_SIZE):
+        batch.append(line)
+        size += len(line) + 1
+        if size >= batch_size:
+            yield batch, size
+            batch, size = [], 0
+    if batch:
+        yield batch, size
+
+
+def run_batches(command: str, batches: Iterable[Tuple[List[bytes], int]],
+                workers: int) -> Iterator[Tuple[bytes, int, int, int]]:
+    """Process batches across ``workers`` processes and yield their results in the input order.
+
+    At most ``QUEUED_BATCHES_PER_WORKER`` batches per worker are read ahead, so that a slow output does not fill the
+    memory with pending results.
+
+    :param str command: One of ``COMMANDS``
+    :param batches: Batches of lines and their size, see ``iter_batches``
+    :param int workers: Number of processes, 1 processes the batches in the current process
+
+    :return: An iterator of the output, number of records, number of failures and input size of each batch
+    """
+    if workers <= 1:
+        for lines, size in batches:
+            yield *process_records(lines, command), size
+        return
+
+    # Workers are spawned as in the offloader, each one builds its own handlers
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending = deque()
+        for lines, size in batches:
+            pending.append((executor.submit(process_records, lines, command), size))
+            if len(pending) >= workers * QUEUED_BATCHES_PER_WORKER:
+                future, size = pending.popleft()
+                yield *future.result(), size
+        while pending:
+            future, size = pending.popleft()
+            yield *future.result(), size
+
+
+class Progress:
+    """Count processed records and bytes, and report the throughput on ``stream`` every ``interval`` seconds.
+
+    :param str command: The command, written in reports
+    :param stream: Text stream of the reports
+    :param float interval: Minimum number of seconds between two reports, 0 disables periodic reports
+    """
+
+    def __init__(self, command: str, stream=sys.stderr, interval: float = 1):
+        self.command = command
+        self.stream = stream
+        self.interval = interval
+        self.records = self.failures = self.size = 0
+        self.start = self._last_report = monotonic()
+
+    def update(self, records: int, failures: int, size: int):
+        """Add the records of a processed batch and report if ``interval`` elapsed since the last report."""
+        self.records += records
+        self.failures += failures
+        self.size += size
+        if self.interval and monotonic() - self._last_report >= self.interval:
+            self.report()
+
+    def report(self, final: bool = False):
+        """Write the records count and throughput so far."""
+        self._last_report = monotonic()
+        elapsed = max(self._last_report - self.start, 1e-9)
+        print(f"{self.command}{' done' if final else ''}: {self.records} records ({self.failures} failed), "
+              f"{self.size / 1e6:.1f} MB in {elapsed:.1f} s, {self.records / elapsed:.0f} records/s, "
+              f"{self.size / 1e6 / elapsed:.1f} MB/s", file=self.stream, flush=True)
+
+
+def run(command: str, source: BinaryIO, target: BinaryIO, workers: int, batch_size: int,
+        progress: Optional[Progress] = None) -> Progress:
+    """Process every record of ``source`` and write the results to ``target``.
+
+    :param str command: One of ``COMMANDS``
+    :param source: Readable binary stream of JSON lines
+    :param target: Writable binary stream of the NDJSON results
+    :param int workers: Number of processes
+    :param int batch_size: Size in bytes of the batches sent to the processes
+    :param Progress progress: The progress reporter, defaults to one without periodic reports
+
+    :return: The progress, with the final counts
+    """
+    progress = progress or Progress(command, interval=0)
+    for output, records, failures, size in run_batches(command, iter_batches(source, batch_size), workers):
+        target.write(output)
+        progress.update(records, failures, size)
+    target.flush()
+    return progress
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    """Parse the command line and process the input file.
+
+    :return: The exit status, 1 if any record failed
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("command", choices=COMMANDS)
+    parser.add_argument("input", help="Path of the JSONL input file, - for the standard input")
+    parser.add_argument("-o", "--output", default="-", help="Path of the NDJSON output file, - for the standard output")
+    parser.add_argument("-w", "--workers", type=int, default=cpu_count() or 1, help="Number of processes")
+    parser.add_argument("--batch-size", type=int, default=256 * 1024,
+                        help="Size in bytes of the batches of lines sent to the processes")
+    parser.add_argument("--progress-interval", type=float, default=1,
+                        help="Seconds between two progress reports on the standard error, 0 to disable them")
+    options = parser.parse_args(args)
+
+    source = sys.stdin.buffer if options.input == "-" else open(options.input, "rb", buffering=READ_SIZE)
+    target = sys.stdout.buffer if options.output == "-" else open(options.output, "wb", buffering=READ_SIZE)
+    progress = Progress(options.command, interval=options.progress_interval)
+    try:
+        run(options.command, source, target, options.workers, options.batch_size, progress)
+    finally:
+        for stream in (source, target):
+            if stream not in (sys.stdin.buffer, sys.stdout.buffer):
+                stream.close()
+    progress.report(final=True)
+    return 1 if progress.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
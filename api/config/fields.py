@@ -2,3 +2,14 @@ class SignatureFields:
     """Field names used in signature endpoints payloads."""
     signature = "signature"
     data = "data"
+    # Merkle signatures
+    root = "root"
+    proofs = "proofs"
+    update = "update"
+
+
+class BatchFields:
+    """Field names used in batch endpoints responses."""
+    results = "results"
+    status = "status"
+    body = "body"
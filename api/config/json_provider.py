@@ -0,0 +1,27 @@
+from typing import Any, Union
+
+from flask import has_request_context, request
+from flask.json.provider import JSONProvider
+
+from ..helpers.codecs import RootJSONCodec, default_codec
+from ..helpers.metrics import MetricNames, metrics
+
+
+class CodecJSONProvider(JSONProvider):
+    """Flask JSON provider delegating requests parsing and responses serialization to a JSON codec.
+
+    Set it with ``app.json = CodecJSONProvider(app)``.
+    """
+    codec: RootJSONCodec = default_codec
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        """Serialize data as JSON with the codec, timed as the ``serialise`` stage of the current route."""
+        if not metrics.enabled or not has_request_context():
+            return self.codec.encode(obj).decode("utf-8")
+        route = (request.endpoint or "").rpartition(".")[2]
+        with metrics.timer(MetricNames.stage_seconds, route=route, stage="serialise"):
+            return self.codec.encode(obj).decode("utf-8")
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        """Deserialize data as JSON with the codec."""
+        return self.codec.decode(s)
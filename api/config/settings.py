@@ -1,10 +1,107 @@
-from os import environ
+import json
+from os import cpu_count, environ
+from pathlib import Path
 
 
-# Swagger and API spec
+# Swagger and API spec. The spec is prebuilt by `flask build-spec` into API_SPEC_FILE
 ROOT_URL = "/api"
 SWAGGER_URL = f"{ROOT_URL}/docs"
 API_URL = f"{ROOT_URL}/swagger.json"
+API_SPEC_FILE = environ.get("API_SPEC_FILE", str(Path(__file__).parent / "openapi.json"))
 
 # Load project environment variables
 HMAC_SECRET = environ.get("HMAC_SECRET", "")
+
+# HMAC key ring, as a JSON document {"active": "<key id>", "keys": {"<key id>": "<secret>", ...}} given inline or as a
+# file. The file is reloaded when it changes, checked at most every HMAC_KEYS_RELOAD_INTERVAL seconds. HMAC_SECRET,
+# when set, stays in the ring as the legacy key, whose signatures have no key id
+HMAC_KEYS = environ.get("HMAC_KEYS", "")
+HMAC_KEYS_FILE = environ.get("HMAC_KEYS_FILE", "")
+HMAC_KEYS_RELOAD_INTERVAL = float(environ.get("HMAC_KEYS_RELOAD_INTERVAL", 5))
+
+# Encryption algorithm, one of "base64" (obfuscation only), "aes-256-gcm" or "chacha20-poly1305". The key of the
+# latter two is 32 bytes, base64 encoded, and its id is written in ciphertexts
+CRYPTER = environ.get("CRYPTER", "base64")
+ENCRYPTION_KEY = environ.get("ENCRYPTION_KEY", "")
+ENCRYPTION_KEY_ID = environ.get("ENCRYPTION_KEY_ID", "default")
+# Envelope of encrypted strings, "legacy" for the "--- BEGIN CRYPTED MESSAGE ---" sentinel or "compact" for the
+# versioned "~#E1<algorithm id>:" prefix. Both are decrypted whatever the setting
+ENVELOPE_FORMAT = environ.get("ENVELOPE_FORMAT", "legacy")
+
+# JSON backend, one of "auto", "orjson" or "stdlib". "auto" picks orjson when it is installed
+JSON_BACKEND = environ.get("JSON_BACKEND", "auto")
+
+# Batch endpoints
+BATCH_MAX_ITEMS = int(environ.get("BATCH_MAX_ITEMS", 1000))
+NDJSON_MIMETYPE = "application/x-ndjson"
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Request body size limits in bytes, 0 meaning no limit. Streamed NDJSON endpoints have their own limit, unlimited by
+# default as they are read by chunks. /sign and /verify accept larger documents, up to SIGNATURE_MAX_CONTENT_LENGTH.
+# MAX_CONTENT_LENGTHS overrides the limit of some routes, as a JSON object of limits by route, the name of the view such
+# as {"verify": 1048576, "encrypt_stream": 1073741824}
+MAX_CONTENT_LENGTH = int(environ.get("MAX_CONTENT_LENGTH", 64 * 1024 * 1024))
+STREAM_MAX_CONTENT_LENGTH = int(environ.get("STREAM_MAX_CONTENT_LENGTH", 0))
+SIGNATURE_MAX_CONTENT_LENGTH = int(environ.get("SIGNATURE_MAX_CONTENT_LENGTH", 256 * 1024 * 1024))
+MAX_CONTENT_LENGTHS = {
+    "sign": SIGNATURE_MAX_CONTENT_LENGTH,
+    "verify": SIGNATURE_MAX_CONTENT_LENGTH,
+    **json.loads(environ.get("MAX_CONTENT_LENGTHS", "{}"))
+}
+
+# Signature cache, disabled when max entries is 0. TTL is in seconds, 0 means no expiry
+SIGNATURE_CACHE_MAX_ENTRIES = int(environ.get("SIGNATURE_CACHE_MAX_ENTRIES", 0))
+SIGNATURE_CACHE_MAX_BYTES = int(environ.get("SIGNATURE_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+SIGNATURE_CACHE_TTL = float(environ.get("SIGNATURE_CACHE_TTL", 0))
+
+# Index of verified (data, signature) pairs, answering repeated /verify requests without HMAC. Disabled when max entries
+# is 0. TTL is in seconds, 0 means no expiry. When shared, the index is in shared memory, common to the worker processes
+# forked after the application is loaded
+VERIFIED_INDEX_MAX_ENTRIES = int(environ.get("VERIFIED_INDEX_MAX_ENTRIES", 0))
+VERIFIED_INDEX_TTL = float(environ.get("VERIFIED_INDEX_TTL", 300))
+VERIFIED_INDEX_SHARED = environ.get("VERIFIED_INDEX_SHARED", "").lower() in ("1", "true", "yes")
+
+# Signatures of request bodies above this size (in bytes) are computed over the canonical form streamed by chunks into
+# the HMAC, instead of building it in memory. Streaming saves memory but is several times slower, 0 disables it
+CANONICAL_STREAM_THRESHOLD_BYTES = int(environ.get("CANONICAL_STREAM_THRESHOLD_BYTES", 0))
+CANONICAL_STREAM_CHUNK_SIZE = 64 * 1024
+
+# ASGI serving mode, number of threads running the (CPU-bound) WSGI application
+ASGI_WORKER_THREADS = int(environ.get("ASGI_WORKER_THREADS", min(32, (cpu_count() or 1) + 4)))
+
+# gunicorn deployment, see gunicorn.conf.py. The profile is "single", "sync", "gthread" or "async", worker and thread
+# counts are derived from the number of CPUs when 0
+GUNICORN_PROFILE = environ.get("GUNICORN_PROFILE", "single")
+GUNICORN_WORKERS = int(environ.get("GUNICORN_WORKERS", 0))
+GUNICORN_THREADS = int(environ.get("GUNICORN_THREADS", 0))
+
+# Process pool offload for large payloads, disabled when the threshold (in bytes of request body) is 0
+OFFLOAD_THRESHOLD_BYTES = int(environ.get("OFFLOAD_THRESHOLD_BYTES", 0))
+OFFLOAD_MAX_WORKERS = int(environ.get("OFFLOAD_MAX_WORKERS", cpu_count() or 1))
+
+# Above this size (in bytes of request body), the depth-1 values of /encrypt and /decrypt payloads are processed in
+# parallel by the offload process pool, in chunks of about the same size. 0 disables parallel processing
+PARALLEL_FIELDS_THRESHOLD_BYTES = int(environ.get("PARALLEL_FIELDS_THRESHOLD_BYTES", 0))
+
+# Metrics, exposed on /api/metrics when enabled. With several worker processes, each worker flushes its metrics in
+# METRICS_DIR every METRICS_FLUSH_INTERVAL seconds so that any worker can serve them all
+METRICS_ENABLED = environ.get("METRICS_ENABLED", "").lower() in ("1", "true", "yes")
+METRICS_DIR = environ.get("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(environ.get("METRICS_FLUSH_INTERVAL", 5))
+
+# Wire formats of request and response bodies, negotiated with the Content-Type and Accept headers
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+CBOR_MIMETYPE = "application/cbor"
+
+# Compression of responses (zstd, br or gzip, negotiated with Accept-Encoding) and decompression of request bodies
+# (Content-Encoding). Responses smaller than COMPRESSION_MIN_SIZE bytes are sent as such. Decompressed request bodies
+# are limited to COMPRESSION_MAX_DECOMPRESSED_BYTES
+COMPRESSION_ENABLED = environ.get("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_SIZE = int(environ.get("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_MAX_DECOMPRESSED_BYTES = int(environ.get("COMPRESSION_MAX_DECOMPRESSED_BYTES", 64 * 1024 * 1024))
+COMPRESSION_LEVELS = {
+    "gzip": int(environ.get("COMPRESSION_GZIP_LEVEL", 6)),
+    "zstd": int(environ.get("COMPRESSION_ZSTD_LEVEL", 3)),
+    "br": int(environ.get("COMPRESSION_BROTLI_LEVEL", 4))
+}
@@ -0,0 +1,122 @@
+from http import HTTPStatus
+from json import JSONDecodeError
+from logging import getLogger
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+from ..config.fields import BatchFields
+from ..config.settings import BATCH_MAX_ITEMS, STREAM_CHUNK_SIZE
+from ..helpers.codecs import default_codec
+
+
+logger = getLogger(__name__)
+
+ItemOperation = Callable[[Any], Tuple[Union[str, dict], HTTPStatus]]
+
+
+def validate_batch(payload: Any) -> Optional[Tuple[dict, HTTPStatus]]:
+    """Check that a batch payload is a JSON array within the size limit.
+
+    :param payload: The JSON payload received by a batch endpoint
+
+    :return: ``None`` if the batch is valid, otherwise a tuple with the error and http status for flask response
+    """
+    if not isinstance(payload, list):
+        return {"error": "Input is not a valid JSON array"}, HTTPStatus.BAD_REQUEST
+    if len(payload) > BATCH_MAX_ITEMS:
+        return {"error": f"Batch exceeds {BATCH_MAX_ITEMS} items"}, HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    return None
+
+
+def process_item(item: Any, operation: ItemOperation, error_message: str) -> dict:
+    """Run ``operation`` on a single batch item and wrap its outcome.
+
+    Any unexpected exception raised by the operation is caught, so that it only fails the current item. It is reported
+    as an `INTERNAL SERVER ERROR` item with ``error_message``.
+
+    :param item: A single item of the batch, as received by the endpoint
+    :param operation: A callable returning a tuple ``(result, status)``, as the handlers methods do
+    :param str error_message: Error message used when the operation raises
+
+    :return: A dictionary with the item ``status`` code and its ``body``
+    """
+    try:
+        result, status = operation(item)
+    except Exception as e:
+        logger.error("Error when processing batch item: %s", repr(e))
+        result, status = {"error": error_message}, HTTPStatus.INTERNAL_SERVER_ERROR
+    return {BatchFields.status: int(status), BatchFields.body: result}
+
+
+def process_batch(items: List[Any], operation: ItemOperation, error_message: str) -> Tuple[dict, HTTPStatus]:
+    """Run ``operation`` on every item of a batch and collect per-item results.
+
+    Items are processed independently and in order: a failing item does not prevent the next ones from being processed.
+    The batch itself always succeeds, the outcome of each item is given by its own ``status``.
+
+    :param list items: The items of the batch
+    :param operation: A callable returning a tuple ``(result, status)``, as the handlers methods do
+    :param str error_message: Error message used for items whose operation raises
+
+    :return: A tuple containing the result and the corresponding http status for flask response
+    """
+    results = [process_item(item, operation, error_message) for item in items]
+    return {BatchFields.results: results}, HTTPStatus.OK
+
+
+def iter_lines(stream: BinaryIO, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Read a binary stream by chunks and yield its lines, without the line terminator.
+
+    Only the current chunk and the pending incomplete line are held in memory, whatever the stream size. The pieces of
+    a line spanning several chunks are kept apart and joined once, when its terminator is read, so that a long record
+    costs time linear in its size rather than one copy of the pending bytes per chunk.
+
+    :param stream: A readable binary stream, such as ``request.stream``
+    :param int chunk_size: Number of bytes read from the stream at once
+    """
+    pending = []
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if b"\n" not in chunk:
+            pending.append(chunk)
+            continue
+        lines = chunk.split(b"\n")
+        pending.append(lines[0])
+        lines[0] = b"".join(pending)
+        pending = [lines.pop()]
+        yield from lines
+    if any(pending):
+        yield b"".join(pending)
+
+
+def process_stream(lines: Iterable[bytes], operation: ItemOperation, error_message: str) -> Iterator[bytes]:
+    """Run ``operation`` on every NDJSON line and yield one NDJSON result line per record.
+
+    Blank lines are skipped. A line that is not valid JSON yields a `BAD REQUEST` result instead of stopping the
+    stream, as any other failing item of a batch.
+
+    :param lines: An iterable of raw JSON lines, see ``iter_lines``
+    :param operation: A callable returning a tuple ``(result, status)``, as the handlers methods do
+    :param str error_message: Error message used for records whose operation raises
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        yield default_codec.encode(process_line(line, operation, error_message)) + b"\n"
+
+
+def process_line(line: bytes, operation: ItemOperation, error_message: str) -> dict:
+    """Decode a single NDJSON line and run ``operation`` on it, see ``process_item``.
+
+    :param bytes line: A raw JSON line
+    :param operation: A callable returning a tuple ``(result, status)``, as the handlers methods do
+    :param str error_message: Error message used when the operation raises
+
+    :return: A dictionary with the record ``status`` code and its ``body``, `BAD REQUEST` if the line is not valid JSON
+    """
+    try:
+        item = default_codec.decode(line)
+    except (JSONDecodeError, UnicodeDecodeError):
+        return {BatchFields.status: int(HTTPStatus.BAD_REQUEST), BatchFields.body: {"error": "Invalid JSON line"}}
+    return process_item(item, operation, error_message)
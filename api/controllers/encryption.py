@@ -2,9 +2,13 @@ from binascii import Error as BinasciiError
 from http import HTTPStatus
 from json import JSONDecodeError
 from logging import getLogger
-from typing import Tuple
+from typing import Any, List, Optional, Tuple, Union
 
-from ..helpers.crypters import RootCrypter
+from ..config.settings import ENVELOPE_FORMAT
+from ..helpers.crypters import KNOWN_ALGORITHM_IDS, Ciphertext, DecryptionError, RootCrypter
+from ..helpers.metrics import MetricNames, metrics
+from ..helpers.offload import ProcessOffloader, balanced_chunks, estimate_size
+from ..helpers.selectors import children, select_all
 
 
 class EncryptionHandler:
@@ -16,67 +20,307 @@ class EncryptionHandler:
 
     When asked to decrypt a value, it removes the marker then delegates the decryption to the crypter.
 
+    The marker is either the legacy ``SENTINEL``, or the compact envelope ``~#E<version><algorithm id>:``, 6 characters
+    instead of 29, whose algorithm id is the ``ALGORITHM_ID`` of the crypter. Both are decrypted, ``envelope`` tells
+    which one encrypted values get. A string shaped like an envelope but with an unknown version or algorithm id was
+    not encrypted by this API, and is returned as is like any clear value.
+
+    For binary wire formats, encrypted values are rather kept as raw bytes wrapped in ``Ciphertext``, which is
+    detected by its type instead of a marker.
+
     :param RootCrypter crypter: An instance of a class inheriting from `RootCrypter`, containing `encrypt`
     and `decrypt` methods.
+    :param ProcessOffloader offloader: Optional process pool used for payloads above its size threshold
+    :param int parallel_threshold: Payloads above this size in bytes have their first-level items encrypted and
+    decrypted in parallel in the offloader pool, see ``encrypt_parallel``. 0 disables it
+    :param str envelope: ``legacy`` or ``compact``, the marker of encrypted strings, defaults to ``ENVELOPE_FORMAT``
     """
     SENTINEL = "--- BEGIN CRYPTED MESSAGE ---"
+    ENVELOPE_MAGIC = "~#E"
+    ENVELOPE_VERSION = "1"
+    # Length of "~#E<version><algorithm id>:"
+    ENVELOPE_SIZE = len(ENVELOPE_MAGIC) + 3
+    ENVELOPES = ("legacy", "compact")
+    DECRYPTION_ERRORS = (JSONDecodeError, UnicodeDecodeError, BinasciiError, UnicodeEncodeError, DecryptionError)
 
-    def __init__(self, crypter: RootCrypter):
+    def __init__(self, crypter: RootCrypter, offloader: Optional[ProcessOffloader] = None, parallel_threshold: int = 0,
+                 envelope: str = ENVELOPE_FORMAT):
+        if envelope not in self.ENVELOPES:
+            raise ValueError(f"Unknown envelope format: {envelope}")
         self.crypter = crypter
+        self.offloader = offloader
+        self.parallel_threshold = parallel_threshold
+        self.envelope = envelope
+        self.prefix = self.SENTINEL
+        if envelope == "compact":
+            self.prefix = f"{self.ENVELOPE_MAGIC}{self.ENVELOPE_VERSION}{crypter.ALGORITHM_ID}:"
         self.logger = getLogger(__name__)
 
+    def __getstate__(self) -> dict:
+        """Pickle the handler without its offloader, to send it to the offload processes."""
+        return {"crypter": self.crypter, "envelope": self.envelope}
+
+    def __setstate__(self, state: dict):
+        """Rebuild a handler received by an offload process."""
+        self.__init__(**state)
+
+    def find_ciphertext(self, s: str) -> int:
+        """Return the position of the encrypted string in `s`, after the sentinel or envelope, or -1 if `s` is clear.
+
+        :param str s: Possibly encrypted string as received by ``decrypt`` endpoint
+        :raise DecryptionError: If `s` has a compact envelope of another algorithm of this API than the crypter's
+        """
+        if s.startswith(self.ENVELOPE_MAGIC) and len(s) >= self.ENVELOPE_SIZE and s[self.ENVELOPE_SIZE - 1] == ":":
+            version, algorithm_id = s[len(self.ENVELOPE_MAGIC)], s[len(self.ENVELOPE_MAGIC) + 1]
+            if version != self.ENVELOPE_VERSION or algorithm_id not in KNOWN_ALGORITHM_IDS:
+                return -1
+            if algorithm_id != self.crypter.ALGORITHM_ID:
+                raise DecryptionError(f"Value was encrypted with algorithm {algorithm_id!r}, "
+                                      f"not {self.crypter.ALGORITHM_ID!r}")
+            return self.ENVELOPE_SIZE
+        return len(self.SENTINEL) if s.startswith(self.SENTINEL) else -1
+
     def detect_encrypted_string(self, s: str) -> Tuple[bool, str]:
-        """Check if the input has a sentinel and return the appropriate string.
+        """Check if the input has a sentinel or envelope and return the appropriate string.
 
         :param str s: Possibly encrypted string as received by ``decrypt`` endpoint
 
-        If the input contains the sentinel, it will be recognized a encrypted. In that case,
+        If the input contains the sentinel or envelope, it will be recognized a encrypted. In that case,
         the method returns a tuple `True, <string-without-sentinel>`.
 
         If the input is clear, it returns a tuple `False, <input string>`.
+
+        :raise DecryptionError: If `s` has a compact envelope of another algorithm of this API than the crypter's
         """
-        if len(s) < len(self.SENTINEL) or not s.startswith(self.SENTINEL):
+        offset = self.find_ciphertext(s)
+        if offset < 0:
             return False, s
         else:
-            return True, s[len(self.SENTINEL):]
+            return True, s[offset:]
+
+    def encrypt_value(self, value: Any, raw: bool = False) -> Union[str, Ciphertext]:
+        """Encrypt a single value.
+
+        :param value: Any json-serializable value
+        :param bool raw: Return the raw encrypted bytes as a ``Ciphertext``, instead of a prefixed string
+
+        :return: The encrypted value
+        """
+        if raw:
+            return Ciphertext(self.crypter.encrypt_bytes(value))
+        return self.crypter.encrypt_prefixed(value, self.prefix)
+
+    def decrypt_value(self, value: Any) -> Tuple[bool, Any]:
+        """Decrypt a single value if it is encrypted.
+
+        :param value: A sentinel or envelope prefixed string or a ``Ciphertext`` is decrypted, any other value is clear
+
+        :return: A tuple with whether the value was encrypted and the decrypted (or clear) value
+        :raise: One of ``DECRYPTION_ERRORS`` when the encrypted value is malformed
+        """
+        if isinstance(value, Ciphertext):
+            return True, self.crypter.decrypt_bytes(value.data)
+        if not isinstance(value, str):
+            return False, value
 
-    def encrypt_payload(self, payload: dict) -> Tuple[dict, HTTPStatus]:
+        offset = self.find_ciphertext(value)
+        if offset < 0:
+            return False, value
+        return True, self.crypter.decrypt_from(value, offset)
+
+    def encrypt_payload(self, payload: dict, size_hint: Optional[int] = None,
+                        selectors: Optional[List[str]] = None, raw: bool = False) -> Tuple[dict, HTTPStatus]:
         """Encrypt first-level items of input dictionary.
 
         :param dict payload: JSON input to encrypt
+        :param int size_hint: Approximate size of the payload in bytes. Above the offloader threshold, encryption
+        runs in the offload process pool
+        :param list selectors: Path selectors of the values to encrypt at any depth, see ``encrypt_selected``. By
+        default, all first-level values are encrypted
+        :param bool raw: Return encrypted values as ``Ciphertext`` raw bytes, for binary wire formats
 
         :return: A tuple containing the result and the corresponding http status for flask response
         """
+        if not selectors and self.should_parallelise(payload, size_hint):
+            return self.encrypt_parallel(payload, raw=raw)
+        if self.offloader is not None and self.offloader.should_offload(size_hint):
+            return self.offloader.run(_encrypt_payload, self, payload, selectors, raw)
+        if selectors:
+            return self.encrypt_selected(payload, selectors, raw=raw), HTTPStatus.OK
+
         encrypted = {}
         for key, value in payload.items():
-            encrypted[key] = self.SENTINEL + self.crypter.encrypt(value)
+            encrypted[key] = self.encrypt_value(value, raw=raw)
         return encrypted, HTTPStatus.OK
 
-    def decrypt_payload(self, payload: dict) -> Tuple[dict, HTTPStatus]:
+    def decrypt_payload(self, payload: dict, size_hint: Optional[int] = None, deep: bool = False,
+                        fields: Optional[List[str]] = None, only: bool = False) -> Tuple[dict, HTTPStatus]:
         """Decrypt first-level items of input dictionary.
 
-        The method detects encrypted value with the presence of the sentinel marker. Non string items and non encrypted
-        strings are returned as such. If decryption fails on any encrypted string, a `BAD REQUEST` is returned.
+        The method detects encrypted value with the presence of the sentinel marker, or as ``Ciphertext`` raw bytes.
+        Other items and non encrypted strings are returned as such. If decryption fails on any encrypted value, a `BAD
+        REQUEST` is returned.
 
         :param dict payload: JSON input to encrypt
+        :param int size_hint: Approximate size of the payload in bytes. Above the offloader threshold, decryption
+        runs in the offload process pool. With ``fields``, the estimated size of the selected items is used if smaller
+        :param bool deep: Decrypt encrypted values at any depth, see ``decrypt_deep``
+        :param list fields: Only decrypt the first-level items with these keys, the other ones are returned as such.
+        Keys missing from the payload are ignored
+        :param bool only: With ``fields``, return only the decrypted items
 
         :return: A tuple containing the result and the corresponding http status for flask response
         """
-        decrypted = {}
-        for key, value in payload.items():
-            if not isinstance(value, str):
-                decrypted[key] = value
-                continue
+        if fields is not None:
+            selected = {key: payload[key] for key in fields if key in payload}
+            # The size of the whole body would offload the decryption of a few small values
+            if size_hint is not None and len(selected) < len(payload):
+                size_hint = min(size_hint, estimate_size(selected))
+            decrypted, status = self.decrypt_payload(selected, size_hint=size_hint, deep=deep)
+            if only or status != HTTPStatus.OK:
+                return decrypted, status
+            # Keys of the payload keep their order, with the decrypted values
+            return {**payload, **decrypted}, status
 
-            is_encrypted, string_value = self.detect_encrypted_string(value)
-            if not is_encrypted:
-                decrypted[key] = string_value
-                continue
+        if not deep and self.should_parallelise(payload, size_hint):
+            return self.decrypt_parallel(payload)
+        if self.offloader is not None and self.offloader.should_offload(size_hint):
+            return self.offloader.run(_decrypt_payload, self, payload, deep)
+        if deep:
+            return self.decrypt_deep(payload)
 
-            # At this point we know the value has been encrypted
+        decrypted = {}
+        for key, value in payload.items():
             try:
-                decrypted[key] = self.crypter.decrypt(string_value)
-            except (JSONDecodeError, UnicodeDecodeError, BinasciiError, UnicodeEncodeError) as e:
-                self.logger.error("Unable to decrypt value for %s: %s", key, repr(e))
-                return {"error": "One or more items were not properly encrypted"}, HTTPStatus.BAD_REQUEST
+                _, decrypted[key] = self.decrypt_value(value)
+            except self.DECRYPTION_ERRORS as e:
+                return self.decryption_failed(key, e)
         return decrypted, HTTPStatus.OK
+
+    def should_parallelise(self, payload: dict, size_hint: Optional[int]) -> bool:
+        """Tell whether the first-level items of a payload are processed in parallel.
+
+        :param dict payload: The payload to encrypt or decrypt
+        :param int size_hint: Approximate size of the payload in bytes
+        """
+        return (self.offloader is not None and self.parallel_threshold > 0 and size_hint is not None
+                and size_hint >= self.parallel_threshold and len(payload) > 1)
+
+    def encrypt_parallel(self, payload: dict, raw: bool = False) -> Tuple[dict, HTTPStatus]:
+        """Encrypt first-level items of input dictionary in parallel, in the offloader process pool.
+
+        Items are split in one chunk per process, of about the same size (see ``balanced_chunks``), and each chunk is
+        encrypted by a process as ``encrypt_payload`` would. The output keeps the keys order of the payload.
+
+        :param dict payload: JSON input to encrypt
+        :param bool raw: Return encrypted values as ``Ciphertext`` raw bytes, for binary wire formats
+
+        :return: A tuple containing the result and the corresponding http status for flask response
+        """
+        encrypted = {}
+        for chunk in self.offloader.run_chunks(_encrypt_fields, balanced_chunks(payload, self.offloader.workers),
+                                               self, raw):
+            encrypted.update(chunk)
+        return {key: encrypted[key] for key in payload}, HTTPStatus.OK
+
+    def decrypt_parallel(self, payload: dict) -> Tuple[dict, HTTPStatus]:
+        """Decrypt first-level items of input dictionary in parallel, in the offloader process pool.
+
+        Chunks are built as in ``encrypt_parallel``. If decryption fails on any encrypted value, a `BAD REQUEST` is
+        returned, as ``decrypt_payload`` does.
+
+        :param dict payload: JSON input to decrypt
+
+        :return: A tuple containing the result and the corresponding http status for flask response
+        """
+        decrypted = {}
+        for chunk, failure in self.offloader.run_chunks(_decrypt_fields,
+                                                        balanced_chunks(payload, self.offloader.workers), self):
+            if failure is not None:
+                return self.decryption_failed(*failure)
+            decrypted.update(chunk)
+        return {key: decrypted[key] for key in payload}, HTTPStatus.OK
+
+    def encrypt_selected(self, payload: dict, selectors: List[str], raw: bool = False) -> dict:
+        """Encrypt the values matched by path selectors, at any depth, in place.
+
+        Each matched value is encrypted as a whole and replaced by its encrypted string, the rest of the document is
+        left clear. When a matched value is nested in another matched value, the outer one is encrypted.
+
+        :param dict payload: JSON input to encrypt, modified in place
+        :param list selectors: JSONPath-like selectors such as ``$.users[*].password``, see ``parse_selector``
+        :param bool raw: Replace matched values by ``Ciphertext`` raw bytes, for binary wire formats
+
+        :return: The payload with matched values encrypted
+        """
+        for container, key in select_all(payload, selectors):
+            container[key] = self.encrypt_value(container[key], raw=raw)
+        return payload
+
+    def decrypt_deep(self, payload: dict) -> Tuple[dict, HTTPStatus]:
+        """Decrypt encrypted values at any depth of the payload, in place.
+
+        The document is walked iteratively, so that its depth is not limited by the recursion limit. Decrypted values
+        are not walked again.
+
+        :param dict payload: JSON input to decrypt, modified in place
+
+        :return: A tuple containing the result and the corresponding http status for flask response
+        """
+        stack = [payload]
+        while stack:
+            for container, key in children(stack.pop()):
+                value = container[key]
+                if isinstance(value, (dict, list)):
+                    stack.append(value)
+                    continue
+
+                try:
+                    is_encrypted, decrypted = self.decrypt_value(value)
+                except self.DECRYPTION_ERRORS as e:
+                    return self.decryption_failed(key, e)
+                if is_encrypted:
+                    container[key] = decrypted
+        return payload, HTTPStatus.OK
+
+    def decryption_failed(self, key, error: Exception) -> Tuple[dict, HTTPStatus]:
+        """Log and count a decryption error, and return the `BAD REQUEST` response.
+
+        :param key: The key of the value that could not be decrypted
+        :param Exception error: The decryption error
+        """
+        self.logger.error("Unable to decrypt value for %s: %s", key, repr(error))
+        # binascii errors are all named "Error", named as imported here instead
+        cause = "BinasciiError" if isinstance(error, BinasciiError) else type(error).__name__
+        metrics.increment(MetricNames.errors_total, route="decrypt", cause=cause)
+        return {"error": "One or more items were not properly encrypted"}, HTTPStatus.BAD_REQUEST
+
+
+def _encrypt_payload(handler: EncryptionHandler, payload: dict, selectors: Optional[List[str]],
+                     raw: bool) -> Tuple[dict, HTTPStatus]:
+    """Encrypt a payload inline, run by the offload processes."""
+    return handler.encrypt_payload(payload, selectors=selectors, raw=raw)
+
+
+def _decrypt_payload(handler: EncryptionHandler, payload: dict, deep: bool) -> Tuple[dict, HTTPStatus]:
+    """Decrypt a payload inline, run by the offload processes."""
+    return handler.decrypt_payload(payload, deep=deep)
+
+
+def _encrypt_fields(chunk: dict, handler: EncryptionHandler, raw: bool) -> dict:
+    """Encrypt a chunk of first-level items, run by the offload processes."""
+    return {key: handler.encrypt_value(value, raw=raw) for key, value in chunk.items()}
+
+
+def _decrypt_fields(chunk: dict, handler: EncryptionHandler) -> Tuple[dict, Optional[Tuple[Any, Exception]]]:
+    """Decrypt a chunk of first-level items, run by the offload processes.
+
+    :return: The decrypted items, and the key and error of the first value that could not be decrypted, if any
+    """
+    decrypted = {}
+    for key, value in chunk.items():
+        try:
+            _, decrypted[key] = handler.decrypt_value(value)
+        except handler.DECRYPTION_ERRORS as e:
+            return decrypted, (key, e)
+    return decrypted, None
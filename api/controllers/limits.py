@@ -0,0 +1,106 @@
+from functools import wraps
+from http import HTTPStatus
+import io
+from typing import BinaryIO, Callable, Optional
+
+from flask import request
+
+from ..config.settings import MAX_CONTENT_LENGTH, MAX_CONTENT_LENGTHS
+from ..helpers.metrics import MetricNames, metrics
+from ..helpers.streams import CappedReader
+
+# Number of bytes read ahead of the view to find the first significant byte of a JSON body
+PEEK_SIZE = 512
+JSON_WHITESPACE = b" \t\r\n"
+
+
+class PrefixedStream(io.RawIOBase):
+    """Readable stream replaying bytes already read from a stream, then reading the rest of it.
+
+    :param bytes prefix: The bytes read ahead from ``stream``
+    :param stream: The stream to read once the prefix is consumed
+    """
+
+    def __init__(self, prefix: bytes, stream: BinaryIO):
+        self.prefix = prefix
+        self.stream = stream
+
+    def readable(self) -> bool:
+        """Tell that the stream is readable."""
+        return True
+
+    def readinto(self, buffer) -> int:
+        """Read up to ``len(buffer)`` bytes into ``buffer``, from the prefix first, 0 at the end of the stream."""
+        if self.prefix:
+            size = min(len(buffer), len(self.prefix))
+            buffer[:size] = self.prefix[:size]
+            self.prefix = self.prefix[size:]
+            return size
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def peek_first_byte(environ: dict, content_length: Optional[int]) -> Optional[bytes]:
+    """Return the first non-whitespace byte of the request body, without consuming it.
+
+    Up to ``PEEK_SIZE`` bytes are read from ``wsgi.input``, which is replaced by a stream replaying them, so that the
+    application reads the whole body as sent.
+
+    :param dict environ: The WSGI environment of a request whose body was not read yet
+    :param int content_length: The request Content-Length, ``None`` when unknown
+
+    :return: The first significant byte, ``b""`` for an empty or blank body, ``None`` if it is not within the first
+    bytes or the body cannot be read ahead safely
+    """
+    # Without length, the body can only be read ahead if the server marks its end
+    if content_length is None and not environ.get("wsgi.input_terminated"):
+        return None
+    size = PEEK_SIZE if content_length is None else min(PEEK_SIZE, content_length)
+    stream, prefix = environ["wsgi.input"], b""
+    while len(prefix) < size:
+        chunk = stream.read(size - len(prefix))
+        if not chunk:
+            break
+        prefix += chunk
+    environ["wsgi.input"] = PrefixedStream(prefix, stream)
+
+    significant = prefix.lstrip(JSON_WHITESPACE)
+    if significant:
+        return significant[:1]
+    return b"" if len(prefix) < size or content_length == len(prefix) else None
+
+
+def limit_request(max_length: int = MAX_CONTENT_LENGTH, first_byte: Optional[bytes] = None,
+                  error: str = "Input is not a valid JSON") -> Callable:
+    """Decorate a view to reject oversized or malformed bodies before they are read and parsed.
+
+    The size limit of the route is ``MAX_CONTENT_LENGTHS[<route>]``, or ``max_length``, 0 meaning no limit. Bodies
+    whose Content-Length exceed it get a `REQUEST ENTITY TOO LARGE` right away, and bodies without length, such as
+    chunked or compressed ones, get it as soon as more is read. JSON bodies whose first significant byte is not
+    ``first_byte`` get a `BAD REQUEST` with ``error``, as the view would after parsing them.
+
+    :param int max_length: Default size limit of the route in bytes
+    :param bytes first_byte: Expected first non-whitespace byte of JSON bodies, such as ``b"{"`` for objects
+    :param str error: Error message of malformed bodies, the one of the view
+    """
+    def decorator(view: Callable) -> Callable:
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            route = (request.endpoint or "").rpartition(".")[2]
+            limit = MAX_CONTENT_LENGTHS.get(route, max_length)
+            content_length = request.content_length
+            if limit and content_length is not None and content_length > limit:
+                metrics.increment(MetricNames.errors_total, route=route, cause="too_large")
+                return {"error": f"Body exceeds {limit} bytes"}, HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+            if limit and content_length is None:
+                request.environ["wsgi.input"] = CappedReader(request.environ["wsgi.input"], limit)
+
+            if first_byte is not None and request.is_json:
+                found = peek_first_byte(request.environ, content_length)
+                if found is not None and found != first_byte:
+                    metrics.increment(MetricNames.errors_total, route=route, cause="invalid_input")
+                    return {"error": error}, HTTPStatus.BAD_REQUEST
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,74 @@
+from http import HTTPStatus
+from typing import Any, Optional, Tuple, Union
+
+from flask import Response, current_app, request
+from werkzeug.exceptions import BadRequest, UnsupportedMediaType
+
+from ..config.settings import JSON_MIMETYPE
+from ..helpers.formats import WIRE_FORMATS, RootWireFormat, get_wire_format
+from ..helpers.metrics import MetricNames, metrics
+
+
+def get_payload(silent: bool = False) -> Tuple[Any, Optional[RootWireFormat]]:
+    """Parse the request body according to its Content-Type.
+
+    JSON bodies are parsed by flask's ``get_json``. Binary bodies raise the same errors ``get_json`` would: `BAD
+    REQUEST` when they are malformed, and `UNSUPPORTED MEDIA TYPE` when the library of their format is not installed.
+
+    :param bool silent: Return ``None`` instead of raising on malformed bodies, as ``get_json`` does
+
+    :return: A tuple with the parsed payload and the binary wire format of the request, ``None`` for JSON
+    """
+    wire_format = get_wire_format(request.mimetype)
+    if wire_format is None:
+        return request.get_json(silent=silent), None
+    if not wire_format.available:
+        raise UnsupportedMediaType(f"{wire_format.mimetype} is not supported by this server")
+    try:
+        return wire_format.decode(request.get_data()), wire_format
+    except Exception as e:
+        if silent:
+            return None, wire_format
+        raise BadRequest(f"Failed to decode {wire_format.mimetype} body") from e
+
+
+def get_response_format(request_format: Optional[RootWireFormat]) -> Optional[RootWireFormat]:
+    """Pick the wire format of the response from the Accept header.
+
+    Without an Accept header, or on equal preference, the response is written in the format of the request. Formats
+    whose library is not installed are never picked.
+
+    :param RootWireFormat request_format: The wire format of the request, ``None`` for JSON
+
+    :return: The binary wire format of the response, ``None`` for JSON
+    """
+    accept = request.accept_mimetypes
+    if not accept.provided:
+        return request_format
+
+    offers = [request_format.mimetype] if request_format is not None else []
+    offers += [JSON_MIMETYPE] + [mimetype for mimetype, wire_format in WIRE_FORMATS.items() if wire_format.available]
+    return get_wire_format(accept.best_match(list(dict.fromkeys(offers)), default=JSON_MIMETYPE))
+
+
+def make_payload_response(result: Union[str, dict], status: HTTPStatus,
+                          wire_format: Optional[RootWireFormat]) -> Union[Response, Tuple[Any, HTTPStatus]]:
+    """Serialize a handler result in the negotiated wire format.
+
+    JSON objects are serialized here as flask would, so that values with no JSON form, which binary requests can
+    carry, raise a ``TypeError`` in the view rather than once the view returned.
+
+    :param result: The result as returned by the handlers
+    :param HTTPStatus status: The http status of the result
+    :param RootWireFormat wire_format: The wire format of the response, ``None`` for JSON
+    """
+    if wire_format is None:
+        if isinstance(result, dict):
+            return current_app.json.response(result), status
+        return result, status
+    if status == HTTPStatus.NO_CONTENT:
+        return Response(status=status)
+    route = (request.endpoint or "").rpartition(".")[2]
+    with metrics.timer(MetricNames.stage_seconds, route=route, stage="serialise"):
+        body = wire_format.encode(result)
+    return Response(body, status=status, mimetype=wire_format.mimetype)
@@ -0,0 +1,101 @@
+from gzip import compress
+from hashlib import sha256
+import json
+from logging import getLogger
+import os
+from threading import Lock
+from typing import Callable, NamedTuple, Optional
+
+from flask import Request, Response
+
+from ..config.settings import JSON_MIMETYPE
+
+
+class SpecBody(NamedTuple):
+    """The serialized OpenAPI document, its gzip compressed form and its ETag."""
+    raw: bytes
+    gzipped: bytes
+    etag: str
+
+
+class OpenAPIDocument:
+    """Serve the OpenAPI document from a prebuilt JSON artifact, with an ETag, conditional GET and gzip.
+
+    The document is loaded on first request, not when the application starts, so that workers boot without parsing
+    the YAML docstrings of the views. It is read from ``path``, written at build time by ``flask build-spec``. When
+    the artifact is missing, or stale because its stamp differs from ``fingerprint``, it is built once with ``build``
+    instead. The bytes, their gzip compressed form and the ETag are then computed once and served as such to every
+    request.
+
+    :param str path: Path of the prebuilt JSON artifact
+    :param build: Callable returning the OpenAPI document, when the artifact is missing or stale
+    :param fingerprint: Callable returning the fingerprint of the current sources, which the artifact must hold under
+    ``fingerprint_key``. Artifacts are not checked without it
+    :param str fingerprint_key: Key of the fingerprint in the document
+    """
+    # Clients revalidate with the ETag, the document changes with the deployed code
+    CACHE_CONTROL = "no-cache"
+
+    def __init__(self, path: str, build: Callable[[], dict], fingerprint: Optional[Callable[[], str]] = None,
+                 fingerprint_key: str = "x-source-fingerprint"):
+        self.path = path
+        self.build = build
+        self.fingerprint = fingerprint
+        self.fingerprint_key = fingerprint_key
+        self.logger = getLogger(__name__)
+        self._body = None
+        self._lock = Lock()
+
+    @property
+    def body(self) -> SpecBody:
+        """The serialized document, loaded on first use."""
+        if self._body is None:
+            with self._lock:
+                if self._body is None:
+                    self._body = self.load()
+        return self._body
+
+    def load(self) -> SpecBody:
+        """Read the artifact, or build the document if it is missing or stale, and prepare its gzip form and ETag."""
+        raw = self.read_artifact()
+        if raw is None:
+            raw = json.dumps(self.build(), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        # mtime is fixed so that the compressed bytes only depend on the document
+        return SpecBody(raw=raw, gzipped=compress(raw, mtime=0), etag=sha256(raw).hexdigest()[:32])
+
+    def read_artifact(self) -> Optional[bytes]:
+        """Return the bytes of the artifact, ``None`` if it is missing or was built from other sources."""
+        if not os.path.isfile(self.path):
+            self.logger.warning("OpenAPI artifact %s is missing, building it, run `flask build-spec` at build time",
+                                self.path)
+            return None
+        with open(self.path, "rb") as file:
+            raw = file.read()
+        if self.fingerprint is not None:
+            try:
+                stamp = json.loads(raw).get(self.fingerprint_key)
+            except (ValueError, AttributeError):
+                stamp = None
+            if stamp != self.fingerprint():
+                self.logger.warning("OpenAPI artifact %s is stale, building it, run `flask build-spec` at build time",
+                                    self.path)
+                return None
+        return raw
+
+    def response(self, request: Request) -> Response:
+        """Build the response to a request of the document, `NOT MODIFIED` if the client has the same version.
+
+        :param Request request: The request, whose Accept-Encoding and If-None-Match headers are honoured
+        """
+        body = self.body
+        if "gzip" in request.accept_encodings:
+            # Each encoding is a different representation, with its own ETag
+            response = Response(body.gzipped, mimetype=JSON_MIMETYPE)
+            response.headers["Content-Encoding"] = "gzip"
+            response.set_etag(body.etag + "-gzip")
+        else:
+            response = Response(body.raw, mimetype=JSON_MIMETYPE)
+            response.set_etag(body.etag)
+        response.headers["Cache-Control"] = self.CACHE_CONTROL
+        response.vary.add("Accept-Encoding")
+        return response.make_conditional(request)
@@ -0,0 +1,85 @@
+from threading import Lock
+from typing import Optional
+
+from flask import Flask, current_app, has_app_context
+
+from .encryption import EncryptionHandler
+from .signature import SignatureHandler
+from ..config.settings import (CANONICAL_STREAM_THRESHOLD_BYTES, OFFLOAD_MAX_WORKERS, OFFLOAD_THRESHOLD_BYTES,
+                               PARALLEL_FIELDS_THRESHOLD_BYTES, SIGNATURE_CACHE_MAX_BYTES, SIGNATURE_CACHE_MAX_ENTRIES,
+                               SIGNATURE_CACHE_TTL,
+                               VERIFIED_INDEX_MAX_ENTRIES, VERIFIED_INDEX_SHARED, VERIFIED_INDEX_TTL)
+from ..helpers.cache import SignatureCache, VerifiedIndex
+from ..helpers.crypters import RootCrypter, get_crypter
+from ..helpers.metrics import MetricNames, metrics
+from ..helpers.offload import ProcessOffloader
+from ..helpers.signer import HMACSigner, RootSigner
+
+
+class HandlerRegistry:
+    """The HandlerRegistry holds the long-lived handlers shared by all requests.
+
+    Handlers and their algorithm helpers are stateless, or thread-safe, so a single instance of each is built when the
+    application starts instead of at every request.
+
+    :param RootCrypter crypter: The encryption algorithm helper, defaults to the one selected by ``CRYPTER``
+    :param RootSigner signer: The signature algorithm helper, defaults to `HMACSigner`
+
+    The signature handler gets a `SignatureCache` if ``SIGNATURE_CACHE_MAX_ENTRIES`` is set, and a `VerifiedIndex` if
+    ``VERIFIED_INDEX_MAX_ENTRIES`` is set. Both handlers share a `ProcessOffloader` if ``OFFLOAD_THRESHOLD_BYTES`` or
+    ``PARALLEL_FIELDS_THRESHOLD_BYTES`` is set.
+    """
+    EXTENSION_NAME = "handlers"
+
+    def __init__(self, crypter: Optional[RootCrypter] = None, signer: Optional[RootSigner] = None):
+        self.signature_cache = None
+        if SIGNATURE_CACHE_MAX_ENTRIES > 0:
+            self.signature_cache = SignatureCache(
+                max_entries=SIGNATURE_CACHE_MAX_ENTRIES,
+                max_bytes=SIGNATURE_CACHE_MAX_BYTES,
+                ttl=SIGNATURE_CACHE_TTL
+            )
+            metrics.add_collector(MetricNames.cache, self.signature_cache.stats,
+                                  counters=("hits", "misses", "evictions"))
+        self.verified_index = None
+        if VERIFIED_INDEX_MAX_ENTRIES > 0:
+            self.verified_index = VerifiedIndex(max_entries=VERIFIED_INDEX_MAX_ENTRIES, ttl=VERIFIED_INDEX_TTL,
+                                                shared=VERIFIED_INDEX_SHARED)
+            # A shared table has the same slots in every worker
+            metrics.add_collector(MetricNames.verified_index, self.verified_index.stats, counters=("hits", "misses"),
+                                  shared=("slots",) if VERIFIED_INDEX_SHARED else ())
+        self.offloader = None
+        if OFFLOAD_THRESHOLD_BYTES > 0 or PARALLEL_FIELDS_THRESHOLD_BYTES > 0:
+            self.offloader = ProcessOffloader(threshold=OFFLOAD_THRESHOLD_BYTES, max_workers=OFFLOAD_MAX_WORKERS)
+        self.encryption = EncryptionHandler(crypter=crypter or get_crypter(), offloader=self.offloader,
+                                            parallel_threshold=PARALLEL_FIELDS_THRESHOLD_BYTES)
+        self.signature = SignatureHandler(signer=signer or HMACSigner(), cache=self.signature_cache,
+                                          offloader=self.offloader, stream_threshold=CANONICAL_STREAM_THRESHOLD_BYTES,
+                                          verified_index=self.verified_index)
+
+    def init_app(self, app: Flask):
+        """Attach the registry to a Flask application.
+
+        :param Flask app: The application whose requests will use this registry
+        """
+        app.extensions[self.EXTENSION_NAME] = self
+
+
+_default_registry = None
+_default_registry_lock = Lock()
+
+
+def get_registry() -> HandlerRegistry:
+    """Return the registry attached to the current application.
+
+    Outside of an application that called ``init_app``, a process-wide default registry is built on first use.
+    """
+    global _default_registry
+    if has_app_context() and HandlerRegistry.EXTENSION_NAME in current_app.extensions:
+        return current_app.extensions[HandlerRegistry.EXTENSION_NAME]
+
+    if _default_registry is None:
+        with _default_registry_lock:
+            if _default_registry is None:
+                _default_registry = HandlerRegistry()
+    return _default_registry
@@ -1,10 +1,15 @@
 from http import HTTPStatus
-import json
 from logging import getLogger
-from typing import Tuple, Union
+from typing import Any, Optional, Tuple, Union
 
 from ..config.fields import SignatureFields
-from ..helpers.signer import RootSigner
+from ..config.settings import CANONICAL_STREAM_CHUNK_SIZE
+from ..helpers.cache import SignatureCache, VerifiedIndex
+from ..helpers.codecs import RootJSONCodec, default_codec
+from ..helpers.merkle import MerkleTree, ProofError
+from ..helpers.metrics import MetricNames, metrics
+from ..helpers.offload import ProcessOffloader
+from ..helpers.signer import RootSigner, UnknownKeyError
 
 
 class SignatureHandler:
@@ -14,53 +19,276 @@ class SignatureHandler:
     the algorithm used.
 
     :param RootSigner signer: An instance of a class inheriting from `RootSigner`, containing a `signature` method.
+    :param RootJSONCodec codec: The JSON codec used to build the canonical form, defaults to the configured JSON backend
+    :param SignatureCache cache: Optional cache of signatures, answering repeated signature requests without parsing
+    nor signing, see ``signature_cache_key``
+    :param ProcessOffloader offloader: Optional process pool used for payloads above its size threshold
+    :param int stream_threshold: Payloads above this size in bytes are signed by streaming their canonical form, see
+    ``generate_signature``. 0 disables streaming
+    :param VerifiedIndex verified_index: Optional index of verified requests, answering repeated verifications without
+    parsing nor signing, see ``verified_key``
+
+    Merkle signatures, see ``sign_merkle``, sign the root of a `MerkleTree` of the object members instead of its
+    canonical form, so that members can be verified one by one.
     """
+    # Prepended to Merkle roots before signing them, no canonical JSON starts with it
+    MERKLE_PREFIX = "merkle:"
 
-    def __init__(self, signer: RootSigner):
+    def __init__(self, signer: RootSigner, codec: Optional[RootJSONCodec] = None,
+                 cache: Optional[SignatureCache] = None, offloader: Optional[ProcessOffloader] = None,
+                 stream_threshold: int = 0, verified_index: Optional[VerifiedIndex] = None):
         self.signer = signer
+        self.codec = codec or default_codec
+        self.cache = cache
+        self.offloader = offloader
+        self.stream_threshold = stream_threshold
+        self.verified_index = verified_index
         self.logger = getLogger(__name__)
 
+    def __getstate__(self) -> dict:
+        """Pickle the handler without its cache, index and offloader, to send it to the offload processes."""
+        return {"signer": self.signer, "codec": self.codec, "stream_threshold": self.stream_threshold}
+
+    def __setstate__(self, state: dict):
+        """Rebuild a handler received by an offload process."""
+        self.__init__(**state)
+
     def canonicalise(self, payload: dict) -> str:
         """Create a canonical string representation of the json payload.
 
         :param dict payload: The input payload validated as JSON object
         """
-        return json.dumps(payload, separators=(",", ":"), indent=None, sort_keys=True, ensure_ascii=False)
+        return self.codec.canonical(payload)
 
-    def generate_signature(self, payload: dict) -> str:
+    def generate_signature(self, payload: dict, size_hint: Optional[int] = None, key_id: Optional[str] = None) -> str:
         """Generate string signature of payload.
 
         :param dict payload: The input payload validated as JSON object
+        :param int size_hint: Approximate size of the payload in bytes. Above the offloader threshold, the signature
+        is generated in the offload process pool. Above the stream threshold, the canonical form is streamed by chunks
+        to the signer, instead of being built in memory
+        :param str key_id: The id of the signing key, defaults to the signer active key
+        :raise UnknownKeyError: If the key is not known by the signer
 
         The generated signature is independent of the keys order.
         """
-        canonical = self.canonicalise(payload)
-        return self.signer.signature(canonical)
+        if self.offloader is not None and self.offloader.should_offload(size_hint):
+            return self.offloader.run(_generate_signature, self, payload, key_id, size_hint)
+        if self.stream_threshold and size_hint is not None and size_hint >= self.stream_threshold:
+            chunks = self.codec.iter_canonical(payload, CANONICAL_STREAM_CHUNK_SIZE)
+            return self.signer.signature_chunks(chunks, key_id=key_id)
+
+        return self._sign(self.canonicalise(payload), key_id)
 
-    def sign_payload(self, payload: dict) -> Tuple[dict, HTTPStatus]:
+    def _sign(self, canonical: str, key_id: Optional[str]) -> str:
+        """Sign a canonical form, passing the key id to the signer only when given."""
+        if key_id is None:
+            return self.signer.signature(canonical)
+        return self.signer.signature(canonical, key_id=key_id)
+
+    def sign_payload(self, payload: dict, size_hint: Optional[int] = None,
+                     cache_key: Optional[bytes] = None) -> Tuple[dict, HTTPStatus]:
         """Generate the signature and prepare Flask response.
 
+        With a ``cache_key``, the signature is stored in the signature cache, see ``signature_cache_key``.
+
         :param dict payload: Any JSON validated payload
+        :param int size_hint: Approximate size of the payload in bytes, see ``generate_signature``
+        :param bytes cache_key: The key of the request in the signature cache, as returned by ``signature_cache_key``
+
+        :return: A tuple containing the result and the corresponding http status for flask response
+        """
+        if cache_key is None:
+            signature = self.generate_signature(payload, size_hint=size_hint)
+        else:
+            # Read before signing, so that a signature made while keys rotate is dropped instead of cached
+            generation = self.signer.key_fingerprint
+            signature = self.generate_signature(payload, size_hint=size_hint)
+            self.cache.set(cache_key, signature, generation)
+        return {SignatureFields.signature: signature}, HTTPStatus.OK
+
+    def verify_payload(self, payload: dict, size_hint: Optional[int] = None,
+                       verified_key: Optional[bytes] = None) -> Tuple[Union[str, dict], HTTPStatus]:
+        """Verify the data given against the signature.
+
+        Generate the signature from `data` with the key the given `signature` was made with, and compare them. If
+        they match, an empty string is returned with a `NO CONTENT` response. If they don't, or if the key is
+        unknown, a `BAD REQUEST` is returned.
+
+        With a ``verified_key``, the request is recorded in the verified index when it verifies, see ``verified_key``.
+
+        :param dict payload: The payload containing `data` and `signature` fields
+        :param int size_hint: Approximate size of the payload in bytes, see ``generate_signature``
+        :param bytes verified_key: The key of the request in the verified index, as returned by ``verified_key``
 
         :return: A tuple containing the result and the corresponding http status for flask response
         """
+        given = payload[SignatureFields.signature]
+        key_id = self.signer.split_signature(given)[0] if isinstance(given, str) else None
+        try:
+            if key_id is None:
+                signature = self.generate_signature(payload[SignatureFields.data], size_hint=size_hint)
+            else:
+                signature = self.generate_signature(payload[SignatureFields.data], size_hint=size_hint, key_id=key_id)
+        except UnknownKeyError:
+            metrics.increment(MetricNames.errors_total, route="verify", cause="unknown_key")
+            return {"error": "Invalid signature or data"}, HTTPStatus.BAD_REQUEST
+
+        if signature != given:
+            metrics.increment(MetricNames.errors_total, route="verify", cause="invalid_signature")
+            return {"error": "Invalid signature or data"}, HTTPStatus.BAD_REQUEST
+        if verified_key is not None:
+            self.verified_index.add(verified_key)
+        return "", HTTPStatus.NO_CONTENT
+
+    def signature_cache_key(self, body: bytes, mimetype: str) -> Optional[bytes]:
+        """Return the key of a signature request in the signature cache, if the handler has one.
+
+        A request whose key is in the cache, see ``cached_signature``, was already signed with the current keys, and
+        can be answered before parsing its body.
+
+        :param bytes body: The raw request body
+        :param str mimetype: The media type of the body
+        """
+        if self.cache is None:
+            return None
+        return self.cache.digest(body, mimetype)
+
+    def cached_signature(self, cache_key: Optional[bytes]) -> Optional[str]:
+        """Return the cached signature of a request, or ``None`` if it was not signed with the current keys.
+
+        :param bytes cache_key: The key returned by ``signature_cache_key``
+        """
+        if cache_key is None:
+            return None
+        return self.cache.get(cache_key, self.signer.key_fingerprint)
+
+    def verified_key(self, body: bytes, mimetype: str) -> Optional[bytes]:
+        """Return the key of a verification request in the verified index, if the handler has one.
+
+        A request whose key is in the index, see ``is_verified``, was already verified with the current keys, and can
+        be answered before parsing its body.
+
+        :param bytes body: The raw request body
+        :param str mimetype: The media type of the body
+        """
+        if self.verified_index is None:
+            return None
+        return self.verified_index.key(body, mimetype, self.signer.key_fingerprint)
+
+    def is_verified(self, verified_key: Optional[bytes]) -> bool:
+        """Tell whether a request was already verified, from its key in the verified index.
+
+        :param bytes verified_key: The key returned by ``verified_key``
+        """
+        return verified_key is not None and self.verified_index.contains(verified_key)
+
+    def merkle_signature(self, root: bytes, key_id: Optional[str] = None) -> str:
+        """Sign a Merkle root.
+
+        :param bytes root: The root hash
+        :param str key_id: The id of the signing key, defaults to the signer active key
+        :raise UnknownKeyError: If the key is not known by the signer
+        """
+        return self._sign(self.MERKLE_PREFIX + root.hex(), key_id)
+
+    def sign_merkle(self, payload: Any) -> Tuple[dict, HTTPStatus]:
+        """Sign the Merkle root of a JSON object, and return the inclusion proofs of its members.
+
+        :param dict payload: Any JSON validated payload, a `BAD REQUEST` is returned if it is not an object
+
+        :return: A tuple containing the result and the corresponding http status for flask response
+        """
+        if not isinstance(payload, dict):
+            return {"error": "Merkle signatures require a JSON object"}, HTTPStatus.BAD_REQUEST
+        tree = MerkleTree(payload, self.codec)
         output = {
-            SignatureFields.signature: self.generate_signature(payload)
+            SignatureFields.signature: self.merkle_signature(tree.root),
+            SignatureFields.root: tree.root.hex(),
+            SignatureFields.proofs: tree.proofs()
         }
         return output, HTTPStatus.OK
 
-    def verify_payload(self, payload: dict) -> Tuple[Union[str, dict], HTTPStatus]:
-        """Verify the data given against the signature.
+    def verify_merkle(self, payload: dict) -> Tuple[Union[str, dict], HTTPStatus]:
+        """Verify a Merkle signature, over a whole object or over some of its members.
 
-        Generate the signature from `data`, and compare to the given `signature`. If they match, an empty string
-        is returned with a `NO CONTENT` response. If they don't, a `BAD REQUEST` is returned.
+        Without `proofs`, the root is recomputed from the whole `data` object. With `proofs`, `data` holds only some
+        members, each one checked against the given `root` with its inclusion proof, in O(log n) hashes. Either way,
+        the root is then checked against the `signature`.
 
-        :param dict payload: The payload containing `data` and `signature` fields
+        :param dict payload: The payload containing `data` and `signature` fields, and `root` and `proofs` fields for
+        a partial verification
 
         :return: A tuple containing the result and the corresponding http status for flask response
         """
-        signature = self.generate_signature(payload[SignatureFields.data])
+        try:
+            root, key_id = self._merkle_root(payload)
+            signature = self.merkle_signature(root, key_id)
+        except (ProofError, UnknownKeyError) as e:
+            self.logger.info("Merkle verification failed: %s", repr(e))
+            metrics.increment(MetricNames.errors_total, route="verify", cause="invalid_proof")
+            return {"error": "Invalid signature, data or proofs"}, HTTPStatus.BAD_REQUEST
+
         if signature != payload[SignatureFields.signature]:
-            return {"error": "Invalid signature or data"}, HTTPStatus.BAD_REQUEST
-        else:
-            return "", HTTPStatus.NO_CONTENT
+            metrics.increment(MetricNames.errors_total, route="verify", cause="invalid_signature")
+            return {"error": "Invalid signature, data or proofs"}, HTTPStatus.BAD_REQUEST
+        return "", HTTPStatus.NO_CONTENT
+
+    def update_merkle(self, payload: dict) -> Tuple[dict, HTTPStatus]:
+        """Re-sign a Merkle-signed object after changing the value of one member, in O(log n) hashes.
+
+        The previous value of the member is verified as ``verify_merkle`` does, then the new root is computed from the
+        new value with the same inclusion proof, and signed with the active key. The proof of the changed member stays
+        valid, the proofs of the other members have to be requested again.
+
+        :param dict payload: The payload of a partial verification of a single member, with the new value of the
+        member in an `update` object
+
+        :return: A tuple containing the result and the corresponding http status for flask response
+        """
+        update = payload.get(SignatureFields.update)
+        data = payload.get(SignatureFields.data)
+        single = isinstance(update, dict) and isinstance(data, dict) and len(update) == 1
+        if not single or update.keys() != data.keys():
+            return {"error": "Update exactly one member, given with its previous value"}, HTTPStatus.BAD_REQUEST
+
+        status = self.verify_merkle(payload)[1]
+        if status != HTTPStatus.NO_CONTENT:
+            return {"error": "Invalid signature, data or proofs"}, HTTPStatus.BAD_REQUEST
+
+        [(key, value)] = update.items()
+        proof = payload[SignatureFields.proofs][key]
+        root = MerkleTree.root_from_proof(MerkleTree.leaf_hash(self.codec, key, value), proof)
+        output = {
+            SignatureFields.signature: self.merkle_signature(root),
+            SignatureFields.root: root.hex(),
+            SignatureFields.proofs: {key: proof}
+        }
+        return output, HTTPStatus.OK
+
+    def _merkle_root(self, payload: dict) -> Tuple[bytes, Optional[str]]:
+        """Return the root proven by a verification payload, and the key id of its signature."""
+        data, given = payload[SignatureFields.data], payload[SignatureFields.signature]
+        if not isinstance(data, dict) or not isinstance(given, str):
+            raise ProofError("Merkle signatures require a JSON object and a string signature")
+        key_id = self.signer.split_signature(given)[0]
+        if SignatureFields.proofs not in payload:
+            return MerkleTree(data, self.codec).root, key_id
+
+        proofs, root = payload[SignatureFields.proofs], payload.get(SignatureFields.root)
+        try:
+            root = bytes.fromhex(root)
+        except (TypeError, ValueError) as e:
+            raise ProofError("Root must be an hexadecimal string") from e
+        if not data or not isinstance(proofs, dict):
+            raise ProofError("Partial verification requires members and their proofs")
+        for key, value in data.items():
+            if MerkleTree.root_from_proof(MerkleTree.leaf_hash(self.codec, key, value), proofs.get(key)) != root:
+                raise ProofError(f"Member {key!r} does not match the root")
+        return root, key_id
+
+
+def _generate_signature(handler: SignatureHandler, payload: dict, key_id: Optional[str],
+                        size_hint: Optional[int]) -> str:
+    """Generate a signature inline, run by the offload processes."""
+    return handler.generate_signature(payload, size_hint=size_hint, key_id=key_id)
@@ -0,0 +1,196 @@
+from collections import OrderedDict
+from hashlib import blake2b
+import mmap
+import struct
+from threading import Lock
+from time import monotonic
+from typing import Hashable, Optional
+
+
+class SignatureCache:
+    """Bounded and thread-safe LRU cache of signatures, keyed by a digest of the raw request body.
+
+    A body identical to a signed one holds the same payload, hence has the same signature with the same keys, so a
+    cached signature is looked up before parsing the body: a hit costs one hash of the body, instead of parsing,
+    canonicalising and signing.
+
+    The cache is bounded both in number of entries and in bytes. When a bound is exceeded, least recently used entries
+    are evicted first. Entries older than ``ttl`` seconds are considered missing.
+
+    The cache is bound to a key ``generation`` (see ``bind``): when the signing key changes, the cache is emptied so
+    that no signature made with a previous key can be served. ``get`` and ``set`` take the generation of the caller and
+    check it in the same locked section as the entry, so that a key rotation cannot slip between them.
+
+    :param int max_entries: Maximum number of cached signatures
+    :param int max_bytes: Maximum total size of cached digests and signatures
+    :param float ttl: Time to live of entries in seconds, 0 for no expiry
+    """
+    DIGEST_SIZE = 16
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._generation = None
+        self._lock = Lock()
+
+    def digest(self, body: bytes, mimetype: str) -> bytes:
+        """Compute the cache key of a request.
+
+        :param bytes body: The raw request body
+        :param str mimetype: The media type of the body, as the same bytes may be parsed differently
+        """
+        digest = blake2b(body, digest_size=self.DIGEST_SIZE, person=b"signature-cache")
+        digest.update(b"\0" + mimetype.encode("utf-8"))
+        return digest.digest()
+
+    def bind(self, generation: Hashable):
+        """Empty the cache if the key generation changed since the last call.
+
+        :param generation: Any value identifying the signing key, such as its fingerprint
+        """
+        with self._lock:
+            self._bind(generation)
+
+    def get(self, key: bytes, generation: Hashable) -> Optional[str]:
+        """Return the cached signature for ``key``, or ``None`` if it is missing or expired.
+
+        The cache is first bound to ``generation``, see ``bind``.
+
+        :param bytes key: A digest as returned by ``digest``
+        :param generation: The key generation of the caller
+        """
+        with self._lock:
+            self._bind(generation)
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and entry[1] < monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: bytes, signature: str, generation: Hashable):
+        """Cache a signature, evicting least recently used entries if needed.
+
+        The signature is dropped if the cache was bound to another generation since ``generation`` was read: the keys
+        were rotated while signing.
+
+        :param bytes key: A digest as returned by ``digest``
+        :param str signature: The signature of the digested body
+        :param generation: The key generation read before signing
+        """
+        size = len(key) + len(signature)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (signature, monotonic() + self.ttl, size)
+            self.size_bytes += size
+            while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """Return the cache counters and current size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.size_bytes
+        }
+
+    def _bind(self, generation: Hashable):
+        """Empty the cache if the key generation changed, the lock must be held by the caller."""
+        if generation != self._generation:
+            self._entries.clear()
+            self.size_bytes = 0
+            self._generation = generation
+
+    def _remove(self, key: bytes):
+        """Remove an entry, the lock must be held by the caller."""
+        _, _, size = self._entries.pop(key)
+        self.size_bytes -= size
+
+
+class VerifiedIndex:
+    """Fixed-size index of already verified requests, to answer repeated verifications without parsing nor signing.
+
+    Each verified request is reduced to a 128-bit BLAKE2b key over its body, its media type and the fingerprint of the
+    signing keys, so that a key rotation invalidates all entries at once. A body identical to a verified one holds the
+    same data and signature, hence verifies the same way with the same keys. Keys are stored in a direct-mapped table
+    of ``max_entries`` slots: a lookup reads a single slot, and an insertion overwrites whatever entry was in its slot.
+
+    With ``shared``, the table lives in an anonymous shared memory mapping, inherited by the processes forked after the
+    index is built, such as the workers of a preloaded application. Slots are read and written without lock: a torn
+    slot holds a mix of two verified keys, which can only match a request whose own key has the same two halves.
+
+    :param int max_entries: Number of slots of the table
+    :param float ttl: Time to live of entries in seconds, 0 for no expiry
+    :param bool shared: Allocate the table in shared memory instead of the process memory
+    """
+    DIGEST_SIZE = 16
+    SLOT = struct.Struct(f"{DIGEST_SIZE}sd")
+
+    def __init__(self, max_entries: int, ttl: float = 0, shared: bool = False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        size = max_entries * self.SLOT.size
+        self._table = mmap.mmap(-1, size) if shared else bytearray(size)
+
+    def key(self, body: bytes, mimetype: str, fingerprint: str) -> bytes:
+        """Compute the index key of a request.
+
+        :param bytes body: The raw request body
+        :param str mimetype: The media type of the body, as the same bytes may be parsed differently
+        :param str fingerprint: The fingerprint of the signing keys, see ``RootSigner.key_fingerprint``
+        """
+        digest = blake2b(body, digest_size=self.DIGEST_SIZE, person=b"verified-index")
+        digest.update(b"\0" + mimetype.encode("utf-8") + b"\0" + fingerprint.encode("utf-8"))
+        return digest.digest()
+
+    def contains(self, key: bytes) -> bool:
+        """Tell whether a request was verified, and not expired.
+
+        :param bytes key: A key as returned by ``key``
+        """
+        stored, expiry = self.SLOT.unpack_from(self._table, self._offset(key))
+        if stored == key and (not self.ttl or expiry >= monotonic()):
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, key: bytes):
+        """Record a verified request, replacing the entry in its slot.
+
+        :param bytes key: A key as returned by ``key``
+        """
+        self.SLOT.pack_into(self._table, self._offset(key), key, monotonic() + self.ttl)
+
+    def stats(self) -> dict:
+        """Return the lookup counters of this process and the number of slots."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "slots": self.max_entries
+        }
+
+    def _offset(self, key: bytes) -> int:
+        """Return the offset of the slot of a key in the table."""
+        return int.from_bytes(key[:8], "little") % self.max_entries * self.SLOT.size
@@ -0,0 +1,187 @@
+import json
+from typing import Any, Iterator, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from ..config.settings import JSON_BACKEND
+
+
+class RootJSONCodec:
+    """Root class for JSON codecs.
+
+    A codec serializes to the compact form (no whitespace, no ASCII escaping), and to the canonical form used for
+    signatures, which additionally sorts keys recursively.
+    """
+    name = "root"
+
+    def encode(self, obj: Any) -> bytes:
+        """Serialize ``obj`` to compact UTF-8 encoded JSON.
+
+        To be overridden in child classes.
+        """
+        pass
+
+    def decode(self, data: Union[bytes, str]) -> Any:
+        """Deserialize a JSON document.
+
+        To be overridden in child classes.
+        """
+        pass
+
+    def canonical(self, obj: Any) -> str:
+        """Serialize ``obj`` to its canonical JSON string.
+
+        To be overridden in child classes.
+        """
+        pass
+
+    def iter_canonical(self, obj: Any, chunk_size: int) -> Iterator[bytes]:
+        """Serialize ``obj`` to its canonical form as UTF-8 encoded chunks, without building the whole string.
+
+        To be overridden in child classes.
+        """
+        pass
+
+
+class StdlibJSONCodec(RootJSONCodec):
+    """Implement the JSON codec with the standard library ``json`` module.
+
+    Its canonical output is the reference one, as signatures have always been generated over it.
+    """
+    name = "stdlib"
+
+    def encode(self, obj: Any) -> bytes:
+        """Serialize ``obj`` to compact UTF-8 encoded JSON.
+
+        :param obj: Any json-serializable value
+        """
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def decode(self, data: Union[bytes, str]) -> Any:
+        """Deserialize a JSON document.
+
+        :param data: JSON document, as text or UTF-8 encoded bytes
+        """
+        return json.loads(data)
+
+    def canonical(self, obj: Any) -> str:
+        """Serialize ``obj`` to its most compact form with recursively sorted keys.
+
+        :param obj: Any json-serializable value
+        """
+        return json.dumps(obj, separators=(",", ":"), indent=None, sort_keys=True, ensure_ascii=False)
+
+    def iter_canonical(self, obj: Any, chunk_size: int) -> Iterator[bytes]:
+        """Serialize ``obj`` to its canonical form as UTF-8 encoded chunks of about ``chunk_size`` bytes.
+
+        The pieces of ``JSONEncoder.iterencode`` are buffered up to ``chunk_size`` characters, so that memory does not
+        depend on the size of ``obj``. The concatenated chunks are byte-identical to ``canonical``, but the pure Python
+        iterative encoder is several times slower than the one-shot one.
+
+        :param obj: Any json-serializable value
+        :param int chunk_size: Approximate size of the chunks, in characters
+        """
+        encoder = json.JSONEncoder(separators=(",", ":"), indent=None, sort_keys=True, ensure_ascii=False)
+        buffer, buffered = [], 0
+        for piece in encoder.iterencode(obj):
+            buffer.append(piece)
+            buffered += len(piece)
+            if buffered >= chunk_size:
+                yield "".join(buffer).encode("utf-8")
+                buffer, buffered = [], 0
+        if buffer:
+            yield "".join(buffer).encode("utf-8")
+
+
+class OrjsonCodec(StdlibJSONCodec):
+    """Implement the JSON codec with ``orjson``, falling back to the standard library when output would differ.
+
+    orjson and the standard library agree on strings escaping and keys ordering, but not on floats formatting
+    (``1e-07`` against ``1e-7``, ``NaN`` against ``null``), and orjson refuses integers above 64 bits. The canonical
+    form is then delegated to the standard library whenever the payload holds a float or a big integer, so that
+    signatures stay byte-identical.
+
+    orjson also decodes integers above 64 bits as floats, losing their digits. Documents that may hold one, a run of at
+    least 19 digits, are decoded by the standard library. So are the documents orjson rejects, such as those holding the
+    ``NaN`` and ``Infinity`` constants the standard library accepts. The compact form, like the canonical one, falls
+    back when orjson writes a null, which may stand for a non-finite float.
+
+    Both checks look for numbers in the serialized document, and may match strings, such as ``"v1.2"``, whose
+    documents then go through the standard library for nothing but with the same result.
+    """
+    name = "orjson"
+    # Numbers are found in serialized documents with substring searches, much faster than a regular expression or a
+    # walk of the payload, once digits are translated to 0 and exponents to e. orjson writes floats as a digit followed
+    # by a dot or an exponent, and integers that do not fit in 64 bits have at least 19 digits
+    NUMBERS_TABLE = bytes.maketrans(b"123456789E", b"000000000e")
+    FLOAT_MARKERS = (b"0.", b"0e")
+    BIG_INTEGER_DIGITS = b"0" * 19
+
+    def encode(self, obj: Any) -> bytes:
+        """Serialize ``obj`` to compact UTF-8 encoded JSON.
+
+        :param obj: Any json-serializable value
+        """
+        try:
+            serialized = orjson.dumps(obj)
+        except TypeError:
+            return super().encode(obj)
+        # Non-finite floats are written as null, as in the canonical form
+        if b"null" in serialized:
+            return super().encode(obj)
+        return serialized
+
+    def decode(self, data: Union[bytes, str]) -> Any:
+        """Deserialize a JSON document.
+
+        :param data: JSON document, as text or UTF-8 encoded bytes
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8", "surrogatepass")
+        if self.BIG_INTEGER_DIGITS in data.translate(self.NUMBERS_TABLE):
+            return super().decode(data)
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError as error:
+            try:
+                return super().decode(data)
+            except UnicodeDecodeError:
+                # Keep raising a JSONDecodeError on invalid UTF-8, as the standard library does on text
+                raise error from None
+
+    def canonical(self, obj: Any) -> str:
+        """Serialize ``obj`` to its most compact form with recursively sorted keys.
+
+        :param obj: Any json-serializable value
+        """
+        try:
+            serialized = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            return super().canonical(obj)
+        # Non-finite floats are written as null. Strings holding such markers also fall back, with the same output
+        numbers = serialized.translate(self.NUMBERS_TABLE)
+        if b"null" in serialized or any(marker in numbers for marker in self.FLOAT_MARKERS):
+            return super().canonical(obj)
+        return serialized.decode("utf-8")
+
+
+def get_codec(backend: Optional[str] = None) -> RootJSONCodec:
+    """Return the JSON codec for the given backend.
+
+    :param str backend: One of ``auto``, ``orjson`` or ``stdlib``, defaults to the ``JSON_BACKEND`` setting. ``auto``
+    picks orjson when it is installed
+    """
+    backend = backend or JSON_BACKEND
+    if backend == "stdlib" or (backend == "auto" and orjson is None):
+        return StdlibJSONCodec()
+    if backend in ("auto", "orjson"):
+        if orjson is None:
+            raise ImportError("orjson JSON backend is selected but orjson is not installed")
+        return OrjsonCodec()
+    raise ValueError(f"Unknown JSON backend: {backend}")
+
+
+default_codec = get_codec()
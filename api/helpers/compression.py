@@ -0,0 +1,338 @@
+from gzip import GzipFile
+import io
+from logging import getLogger
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import zlib
+
+from werkzeug.datastructures import Accept
+from werkzeug.exceptions import BadRequest, UnsupportedMediaType
+from werkzeug.http import parse_accept_header
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from ..config.settings import (COMPRESSION_LEVELS, COMPRESSION_MAX_DECOMPRESSED_BYTES, COMPRESSION_MIN_SIZE,
+                               NDJSON_MIMETYPE)
+from .streams import CappedReader
+
+
+class RootEncoding:
+    """Root class for the content codings of request and response bodies.
+
+    A coding builds incremental compressors, and readers decompressing a stream, so that bodies are processed by
+    chunks.
+    """
+    name = "root"
+
+    @property
+    def available(self) -> bool:
+        """Whether the library of the coding is installed."""
+        return True
+
+    def compressor(self, level: Optional[int] = None):
+        """Return an object with ``compress(data)``, ``flush()`` and ``finish()`` methods returning compressed bytes.
+
+        To be overridden in child classes.
+        """
+        pass
+
+    def reader(self, stream: BinaryIO) -> BinaryIO:
+        """Return a readable stream of the decompressed ``stream``, whose reads never return more than asked.
+
+        To be overridden in child classes.
+        """
+        pass
+
+
+class _ZlibCompressor:
+    """Adapt a zlib compression object to the compressor interface."""
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, wbits=31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class GzipEncoding(RootEncoding):
+    """The ``gzip`` content coding, with the standard library ``zlib``."""
+    name = "gzip"
+
+    def compressor(self, level: Optional[int] = None) -> _ZlibCompressor:
+        """Return a gzip compressor."""
+        return _ZlibCompressor(6 if level is None else level)
+
+    def reader(self, stream: BinaryIO) -> GzipFile:
+        """Return a reader of the gzip decompressed ``stream``."""
+        return GzipFile(fileobj=stream, mode="rb")
+
+
+class _ZstdCompressor:
+    """Adapt a zstandard compression object to the compressor interface."""
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+class ZstdEncoding(RootEncoding):
+    """The ``zstd`` content coding, if ``zstandard`` is installed."""
+    name = "zstd"
+
+    @property
+    def available(self) -> bool:
+        """Whether ``zstandard`` is installed."""
+        return zstandard is not None
+
+    def compressor(self, level: Optional[int] = None) -> _ZstdCompressor:
+        """Return a zstd compressor."""
+        return _ZstdCompressor(3 if level is None else level)
+
+    def reader(self, stream: BinaryIO) -> BinaryIO:
+        """Return a reader of the zstd decompressed ``stream``."""
+        return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+
+
+class _BrotliCompressor:
+    """Adapt a brotli compressor to the compressor interface."""
+
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _BrotliReader(io.RawIOBase):
+    """Readable stream of a brotli decompressed stream.
+
+    The output of each call to the decompressor is bounded, so that a small compressed chunk cannot expand in memory
+    beyond a few reads.
+
+    :param stream: The compressed stream
+    :param int chunk_size: Size of the compressed chunks read from ``stream``
+    """
+
+    def __init__(self, stream: BinaryIO, chunk_size: int = 64 * 1024):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self._decompressor = brotli.Decompressor()
+        self._output = b""
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._output and not self._decompressor.is_finished():
+            data = b""
+            if not self._eof and self._decompressor.can_accept_more_data():
+                data = self.stream.read(self.chunk_size)
+                self._eof = not data
+            self._output = self._decompressor.process(data, output_buffer_limit=max(len(buffer), self.chunk_size))
+            # Output may still be buffered once the input is exhausted, until a call yields nothing
+            if self._eof and not self._output and not self._decompressor.is_finished():
+                raise brotli.error("Truncated brotli stream")
+        size = min(len(buffer), len(self._output))
+        buffer[:size] = self._output[:size]
+        self._output = self._output[size:]
+        return size
+
+
+class BrotliEncoding(RootEncoding):
+    """The ``br`` content coding, if ``brotli`` is installed."""
+    name = "br"
+
+    @property
+    def available(self) -> bool:
+        """Whether ``brotli`` is installed."""
+        return brotli is not None
+
+    def compressor(self, level: Optional[int] = None) -> _BrotliCompressor:
+        """Return a brotli compressor."""
+        return _BrotliCompressor(4 if level is None else level)
+
+    def reader(self, stream: BinaryIO) -> _BrotliReader:
+        """Return a reader of the brotli decompressed ``stream``."""
+        return _BrotliReader(stream)
+
+
+# By order of preference of the server, when the client accepts several codings with the same quality
+ENCODINGS: Dict[str, RootEncoding] = {
+    encoding.name: encoding for encoding in (ZstdEncoding(), BrotliEncoding(), GzipEncoding())
+}
+
+
+class DecompressingStream(CappedReader):
+    """Readable stream decompressing a request body on the fly, with a bound on the decompressed size.
+
+    :param stream: The compressed request body
+    :param RootEncoding encoding: The content coding of the body
+    :param int max_size: Maximum size of the decompressed body, above which `REQUEST ENTITY TOO LARGE` is raised
+    """
+
+    def __init__(self, stream: BinaryIO, encoding: RootEncoding, max_size: int):
+        super().__init__(encoding.reader(stream), max_size, error="Decompressed body is larger than {limit} bytes")
+        self.encoding = encoding
+
+    def read_source(self, size: int) -> bytes:
+        """Decompress up to ``size`` bytes of the body, empty at its end."""
+        try:
+            return self.stream.read(size)
+        except Exception as e:
+            raise BadRequest(f"Failed to decode {self.encoding.name} body") from e
+
+
+class CompressionMiddleware:
+    """WSGI middleware decompressing request bodies and compressing responses.
+
+    Request bodies with a ``Content-Encoding`` of ``gzip``, ``zstd`` or ``br`` are decompressed on the fly as the
+    application reads them, up to ``max_decompressed_size`` bytes. Other codings get an `UNSUPPORTED MEDIA TYPE`.
+
+    Responses are compressed with the preferred coding of the ``Accept-Encoding`` header among the available ones,
+    when their media type is compressible, they are not already encoded, and their size is unknown or at least
+    ``min_size`` bytes. They are compressed chunk by chunk as the application yields them, without buffering. Chunks
+    of streamed responses, whose size is unknown, are flushed as they come, so that clients receive them without
+    delay.
+
+    :param app: The WSGI application
+    :param int min_size: Minimum size of compressed responses in bytes
+    :param dict levels: Compression level by coding name, defaults to each coding default
+    :param int max_decompressed_size: Maximum size of decompressed request bodies in bytes
+    """
+    COMPRESSIBLE_TYPES = ("application/json", NDJSON_MIMETYPE, "application/javascript", "text/")
+
+    def __init__(self, app: Callable, min_size: int = COMPRESSION_MIN_SIZE, levels: Optional[Dict[str, int]] = None,
+                 max_decompressed_size: int = COMPRESSION_MAX_DECOMPRESSED_BYTES):
+        self.app = app
+        self.min_size = min_size
+        self.levels = COMPRESSION_LEVELS if levels is None else levels
+        self.max_decompressed_size = max_decompressed_size
+        self.offers = [name for name, encoding in ENCODINGS.items() if encoding.available]
+        self.logger = getLogger(__name__)
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
+        """Run the application with a decompressed request body, and compress its response."""
+        content_encoding = environ.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        if content_encoding and content_encoding != "identity":
+            encoding = ENCODINGS.get(content_encoding)
+            if encoding is None or not encoding.available:
+                error = UnsupportedMediaType(f"Content-Encoding {content_encoding} is not supported")
+                return error(environ, start_response)
+            environ["wsgi.input"] = io.BufferedReader(
+                DecompressingStream(environ["wsgi.input"], encoding, self.max_decompressed_size)
+            )
+            # The decompressed size is unknown, the body is read up to the end of the stream
+            environ["wsgi.input_terminated"] = True
+            environ.pop("CONTENT_LENGTH", None)
+            environ.pop("HTTP_CONTENT_ENCODING", None)
+
+        accept = parse_accept_header(environ.get("HTTP_ACCEPT_ENCODING"), Accept)
+        encoding_name = accept.best_match(self.offers) if accept else None
+        if encoding_name is None:
+            return self.app(environ, start_response)
+
+        state = {}
+
+        def compressing_start_response(status: str, headers: List[Tuple[str, str]], exc_info=None):
+            if self.should_compress(status, headers):
+                state["compressor"] = ENCODINGS[encoding_name].compressor(self.levels.get(encoding_name))
+                state["streamed"] = not any(name.lower() == "content-length" for name, _ in headers)
+                headers = self.compressed_headers(headers, encoding_name)
+            elif self.is_compressible(headers):
+                headers = headers + [("Vary", "Accept-Encoding")]
+            return start_response(status, headers, exc_info)
+
+        app_iter = self.app(environ, compressing_start_response)
+        return _CompressingIterator(app_iter, state)
+
+    def is_compressible(self, headers: List[Tuple[str, str]]) -> bool:
+        """Tell whether the media type of a response is compressible."""
+        content_type = next((value for name, value in headers if name.lower() == "content-type"), "")
+        return content_type.startswith(self.COMPRESSIBLE_TYPES)
+
+    def should_compress(self, status: str, headers: List[Tuple[str, str]]) -> bool:
+        """Tell whether a response is compressed, from its status and headers."""
+        if status[:3] in ("204", "304") or not self.is_compressible(headers):
+            return False
+        for name, value in headers:
+            name = name.lower()
+            if name == "content-encoding":
+                return False
+            if name == "content-length" and int(value) < self.min_size:
+                return False
+        return True
+
+    @staticmethod
+    def compressed_headers(headers: List[Tuple[str, str]], encoding_name: str) -> List[Tuple[str, str]]:
+        """Return the headers of a compressed response.
+
+        The length is unknown before compression, and strong ETags of the uncompressed body become weak.
+        """
+        compressed = []
+        for name, value in headers:
+            lower = name.lower()
+            if lower == "content-length":
+                continue
+            if lower == "etag" and not value.startswith("W/"):
+                value = "W/" + value
+            compressed.append((name, value))
+        compressed += [("Content-Encoding", encoding_name), ("Vary", "Accept-Encoding")]
+        return compressed
+
+
+class _CompressingIterator:
+    """Iterate over a response, compressed if ``start_response`` picked a compressor in ``state``."""
+
+    def __init__(self, app_iter: Iterable[bytes], state: dict):
+        self.app_iter = app_iter
+        self.state = state
+
+    def __iter__(self) -> Iterator[bytes]:
+        compressor = None
+        for chunk in self.app_iter:
+            # start_response is called by the application before its first chunk
+            compressor = self.state.get("compressor")
+            if compressor is None:
+                yield chunk
+                continue
+            output = compressor.compress(chunk)
+            if self.state["streamed"]:
+                output += compressor.flush()
+            if output:
+                yield output
+        compressor = self.state.get("compressor")
+        if compressor is not None:
+            yield compressor.finish()
+
+    def close(self):
+        """Close the response of the application, as required by WSGI."""
+        if hasattr(self.app_iter, "close"):
+            self.app_iter.close()
@@ -1,10 +1,54 @@
-from base64 import b64encode, b64decode
+from base64 import b64decode
+from binascii import a2b_base64, b2a_base64
+from itertools import chain
 import json
-from typing import Any
+from os import urandom
+from typing import Any, Callable, Iterator, Optional, Union
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+except ImportError:
+    InvalidTag = AESGCM = ChaCha20Poly1305 = None
+
+from ..config.settings import CRYPTER, ENCRYPTION_KEY, ENCRYPTION_KEY_ID
+from .codecs import RootJSONCodec, default_codec
+
+
+class DecryptionError(ValueError):
+    """Raised when an encrypted value is malformed, was encrypted with an unknown key, or fails authentication."""
+
+
+class Ciphertext:
+    """Raw bytes of an encrypted value, as carried by binary wire formats instead of a sentinel-prefixed string.
+
+    :param bytes data: The encrypted bytes, as returned by ``encrypt_bytes``
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Ciphertext) and other.data == self.data
+
+    def __hash__(self) -> int:
+        return hash(self.data)
+
+    def __repr__(self) -> str:
+        return f"Ciphertext({self.data!r})"
 
 
 class RootCrypter:
-    """Root class for crypting algorithms classes."""
+    """Root class for crypting algorithms classes.
+
+    ``encrypt_bytes`` and ``decrypt_bytes`` work on the raw encrypted bytes, used by binary wire formats, while
+    ``encrypt`` and ``decrypt`` work on their text form, used in JSON.
+
+    ``ALGORITHM_ID`` is the single character identifying the algorithm in compact envelopes, so that a value is not
+    decrypted with another algorithm than the one that encrypted it.
+    """
+    ALGORITHM_ID = "?"
 
     def encrypt(self, s: Any) -> str:
         """Encrypt input `s`, return a string.
@@ -20,20 +64,281 @@ class RootCrypter:
         """
         pass
 
+    def encrypt_prefixed(self, s: Any, prefix: str) -> str:
+        """Encrypt input `s`, return a string starting with `prefix`.
+
+        Child classes can override it to join the prefix to the encrypted bytes, before they are decoded to a string.
+        """
+        return prefix + self.encrypt(s)
+
+    def decrypt_from(self, s: str, offset: int) -> Any:
+        """Decrypt the encrypted string starting at `offset` in `s`, return the original object.
+
+        Child classes can override it to read the encrypted string from `offset`, instead of slicing it off `s`.
+        """
+        return self.decrypt(s[offset:])
+
+    def encrypt_bytes(self, s: Any) -> bytes:
+        """Encrypt input `s`, return the raw encrypted bytes.
+
+        To be overridden in child classes.
+        """
+        pass
+
+    def decrypt_bytes(self, data: bytes) -> Any:
+        """Decrypt raw encrypted bytes, return the original object.
+
+        To be overridden in child classes.
+        """
+        pass
+
 
 class Base64Crypter(RootCrypter):
-    """Implement a base64 obfuscation to mimic encryption."""
+    """Implement a base64 obfuscation to mimic encryption.
+
+    Values are serialized as they always were, with the spaces of the standard library ``json.dumps``, so that the same
+    value is always encrypted to the same string.
+
+    :param RootJSONCodec codec: The JSON codec used to deserialize values, defaults to the configured JSON backend
+    """
+    ALGORITHM_ID = "b"
+
+    def __init__(self, codec: Optional[RootJSONCodec] = None):
+        self.codec = codec or default_codec
 
     def encrypt(self, s: Any) -> str:
         """Obfuscate json input using base64 encoding.
 
         :param s: any json-serializable value
         """
-        return b64encode(json.dumps(s, ensure_ascii=False).encode("utf-8")).decode("ascii")
+        return b2a_base64(self.encrypt_bytes(s), newline=False).decode("ascii")
 
     def decrypt(self, s: str) -> Any:
         """Base64 decode string input and return as a json object.
 
         :param str s: base64-encoded string
         """
-        return json.loads(b64decode(s.encode("ascii"), validate=True))
+        return self.decrypt_from(s, 0)
+
+    def encrypt_prefixed(self, s: Any, prefix: str) -> str:
+        """Obfuscate json input using base64 encoding, and prepend `prefix`.
+
+        The prefix is joined to the base64 bytes before they are decoded to a string, which saves building an
+        intermediate string, not a copy: the serialized value, its base64 bytes, the joined bytes and the result are
+        each allocated once.
+
+        :param s: any json-serializable value
+        :param str prefix: ASCII prefix of the result
+        """
+        return (prefix.encode("ascii") + b2a_base64(self.encrypt_bytes(s), newline=False)).decode("ascii")
+
+    def decrypt_from(self, s: str, offset: int) -> Any:
+        """Base64 decode string input from `offset` and return as a json object.
+
+        The whole string is encoded to bytes once, then its base64 text is decoded through a view of those bytes, so
+        that it is not copied a second time by slicing off the prefix.
+
+        :param str s: string holding a base64-encoded value from `offset`
+        :param int offset: position of the base64-encoded value in `s`
+        """
+        return self.decrypt_bytes(a2b_base64(memoryview(s.encode("ascii"))[offset:], strict_mode=True))
+
+    def encrypt_bytes(self, s: Any) -> bytes:
+        """Serialize json input, the raw bytes that ``encrypt`` base64 encodes.
+
+        :param s: any json-serializable value
+        """
+        return json.dumps(s, ensure_ascii=False).encode("utf-8")
+
+    def decrypt_bytes(self, data: bytes) -> Any:
+        """Deserialize raw bytes as returned by ``encrypt_bytes``.
+
+        :param bytes data: serialized json value
+        """
+        return self.codec.decode(data)
+
+
+class AEADCrypter(RootCrypter):
+    """Implement authenticated encryption with AES-256-GCM or ChaCha20-Poly1305.
+
+    Values are encrypted with the STREAM construction: the serialized value is split into segments, each one encrypted
+    with a nonce made of a random prefix, the segment counter and a last-segment flag, so that segments cannot be
+    reordered, dropped or truncated. Segments are encrypted and base64-encoded one at a time, then joined into the
+    text, so that only their base64 form is held as a whole. They are decoded and decrypted one at a time from the
+    base64 text into a plaintext buffer allocated at its final size, so that decrypting holds neither the raw
+    ciphertext nor a copy of the text as a whole.
+
+    The ciphertext is self-describing. It starts with a header, authenticated with every segment, holding the
+    algorithm id, the key id and the nonce prefix::
+
+        algorithm id (1 byte) | key id length (1 byte) | key id | nonce prefix (7 bytes) | zero padding
+
+    :param bytes key: The 256-bit key, defaults to the base64-decoded ``ENCRYPTION_KEY`` environment variable
+    :param str key_id: The id of the key written in ciphertexts, defaults to the ``ENCRYPTION_KEY_ID`` environment
+    variable
+    :param str algorithm: One of ``ALGORITHMS``
+    :param RootJSONCodec codec: The JSON codec used to serialize values, defaults to the configured JSON backend
+    """
+    ALGORITHMS = {"aes-256-gcm": 1, "chacha20-poly1305": 2}
+    # Compact envelope ids of the algorithms, see ``RootCrypter``
+    ALGORITHM_IDS = {"aes-256-gcm": "a", "chacha20-poly1305": "c"}
+    KEY_SIZE = 32
+    TAG_SIZE = 16
+    NONCE_PREFIX_SIZE = 7
+    # Size of a ciphertext segment, a multiple of 3 so that each segment is encoded to whole base64 quads
+    SEGMENT_SIZE = 64 * 1023
+
+    def __init__(self, key: Optional[bytes] = None, key_id: Optional[str] = None, algorithm: str = "aes-256-gcm",
+                 codec: Optional[RootJSONCodec] = None):
+        if AESGCM is None:
+            raise ImportError(f"{algorithm} crypter is selected but cryptography is not installed")
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError(f"Unknown encryption algorithm: {algorithm}")
+        key = b64decode(ENCRYPTION_KEY) if key is None else key
+        if len(key) != self.KEY_SIZE:
+            raise ValueError(f"Encryption key must be {self.KEY_SIZE} bytes long, set ENCRYPTION_KEY as base64")
+        self.key_id = ENCRYPTION_KEY_ID if key_id is None else key_id
+        if len(self.key_id.encode("ascii")) > 255:
+            raise ValueError("Encryption key id must be at most 255 characters long")
+
+        self.algorithm = algorithm
+        self.algorithm_id = self.ALGORITHMS[algorithm]
+        self.ALGORITHM_ID = self.ALGORITHM_IDS[algorithm]
+        self.codec = codec or default_codec
+        self._key = key
+        self._aead = (AESGCM if algorithm == "aes-256-gcm" else ChaCha20Poly1305)(key)
+
+    def __reduce__(self):
+        """Pickle the crypter by its key, as AEAD objects cannot be pickled."""
+        return AEADCrypter, (self._key, self.key_id, self.algorithm, self.codec)
+
+    def encrypt(self, s: Any) -> str:
+        """Encrypt json input, return the base64-encoded ciphertext.
+
+        :param s: any json-serializable value
+        """
+        return self.encrypt_prefixed(s, "")
+
+    def decrypt(self, s: str) -> Any:
+        """Decrypt a base64-encoded ciphertext and return it as a json object.
+
+        :param str s: base64-encoded ciphertext
+        """
+        return self.decrypt_from(s, 0)
+
+    def encrypt_prefixed(self, s: Any, prefix: str) -> str:
+        """Encrypt json input, return the base64-encoded ciphertext prepended with `prefix`.
+
+        :param s: any json-serializable value
+        :param str prefix: ASCII prefix of the result
+        """
+        pieces = (b2a_base64(piece, newline=False) for piece in self._seal(self.codec.encode(s)))
+        return b"".join(chain((prefix.encode("ascii"),), pieces)).decode("ascii")
+
+    def decrypt_from(self, s: str, offset: int) -> Any:
+        """Decrypt the base64-encoded ciphertext starting at `offset` in `s`, and return it as a json object.
+
+        Each segment is decoded from its own slice of `s`, which is never encoded or copied as a whole.
+
+        :param str s: string holding a base64-encoded ciphertext from `offset`
+        :param int offset: position of the ciphertext in `s`
+        """
+        length = len(s) - offset
+        if not length or length % 4:
+            raise DecryptionError("Ciphertext is not properly padded base64")
+        if not s.isascii():
+            raise DecryptionError("Ciphertext is not base64")
+
+        def read(start: int, end: int) -> bytes:
+            # Segments start on multiples of 3 bytes, hence on whole base64 quads
+            return a2b_base64(s[offset + start // 3 * 4:offset - (-end // 3) * 4], strict_mode=True)
+
+        size = length // 4 * 3 - (s[-1] == "=") - (s[-2] == "=")
+        return self.codec.decode(self._open(read, size))
+
+    def encrypt_bytes(self, s: Any) -> bytes:
+        """Encrypt json input, return the raw ciphertext.
+
+        :param s: any json-serializable value
+        """
+        return b"".join(self._seal(self.codec.encode(s)))
+
+    def decrypt_bytes(self, data: bytes) -> Any:
+        """Decrypt a raw ciphertext as returned by ``encrypt_bytes``.
+
+        :param bytes data: raw ciphertext
+        """
+        view = memoryview(data)
+        return self.codec.decode(self._open(lambda start, end: view[start:end], len(view)))
+
+    def _header(self, nonce_prefix: bytes) -> bytes:
+        key_id = self.key_id.encode("ascii")
+        header = bytes((self.algorithm_id, len(key_id))) + key_id + nonce_prefix
+        return header + bytes(-len(header) % 3)
+
+    def _nonce(self, nonce_prefix: bytes, index: int, last: bool) -> bytes:
+        return nonce_prefix + index.to_bytes(4, "big") + (b"\x01" if last else b"\x00")
+
+    def _seal(self, plaintext: bytes) -> Iterator[bytes]:
+        """Yield the header then the encrypted segments of a plaintext."""
+        nonce_prefix = urandom(self.NONCE_PREFIX_SIZE)
+        header = self._header(nonce_prefix)
+        yield header
+
+        view, chunk = memoryview(plaintext), self.SEGMENT_SIZE - self.TAG_SIZE
+        count = max(1, -(-len(view) // chunk))
+        for index in range(count):
+            nonce = self._nonce(nonce_prefix, index, index == count - 1)
+            yield self._aead.encrypt(nonce, view[index * chunk:(index + 1) * chunk], header)
+
+    def _open(self, read: Callable[[int, int], Union[bytes, memoryview]], size: int) -> bytearray:
+        """Decrypt a ciphertext of ``size`` bytes, read by segments with ``read(start, end)``.
+
+        Segments are decrypted into a plaintext buffer allocated at its final size, instead of one growing with them.
+        """
+        head = bytes(read(0, 3)) if size >= 3 else b""
+        if len(head) < 3:
+            raise DecryptionError("Ciphertext is too short")
+        algorithm_id, key_id_size = head[:2]
+        header_size = 2 + key_id_size + self.NONCE_PREFIX_SIZE
+        header_size += -header_size % 3
+        if algorithm_id != self.algorithm_id:
+            raise DecryptionError(f"Ciphertext algorithm {algorithm_id} is not {self.algorithm}")
+        if size < header_size + self.TAG_SIZE:
+            raise DecryptionError("Ciphertext is too short")
+
+        header = bytes(read(0, header_size))
+        if header[2:2 + key_id_size] != self.key_id.encode("ascii"):
+            raise DecryptionError("Ciphertext was encrypted with an unknown key")
+        nonce_prefix = header[2 + key_id_size:2 + key_id_size + self.NONCE_PREFIX_SIZE]
+
+        count = max(1, -(-(size - header_size) // self.SEGMENT_SIZE))
+        # A last segment shorter than a tag fails authentication before anything is written
+        plaintext, position = bytearray(max(0, size - header_size - count * self.TAG_SIZE)), 0
+        for index in range(count):
+            start = header_size + index * self.SEGMENT_SIZE
+            nonce = self._nonce(nonce_prefix, index, index == count - 1)
+            try:
+                segment = self._aead.decrypt(nonce, read(start, min(start + self.SEGMENT_SIZE, size)), header)
+            except InvalidTag as e:
+                raise DecryptionError("Ciphertext failed authentication") from e
+            plaintext[position:position + len(segment)] = segment
+            position += len(segment)
+        return plaintext
+
+
+# Ids of the algorithms of all the crypters, a compact envelope with any other id was not written by this API
+KNOWN_ALGORITHM_IDS = frozenset((Base64Crypter.ALGORITHM_ID, *AEADCrypter.ALGORITHM_IDS.values()))
+
+
+def get_crypter(name: Optional[str] = None) -> RootCrypter:
+    """Return the crypter for the given name.
+
+    :param str name: ``base64`` or one of the ``AEADCrypter`` algorithms, defaults to the ``CRYPTER`` setting
+    """
+    name = name or CRYPTER
+    if name == "base64":
+        return Base64Crypter()
+    if name in AEADCrypter.ALGORITHMS:
+        return AEADCrypter(algorithm=name)
+    raise ValueError(f"Unknown crypter: {name}")
@@ -0,0 +1,131 @@
+from typing import Any, Dict, Optional
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+from ..config.settings import CBOR_MIMETYPE, MSGPACK_MIMETYPE
+from .crypters import Ciphertext
+
+
+class RootWireFormat:
+    """Root class for binary wire formats of request and response bodies.
+
+    Binary formats carry encrypted values as raw bytes, wrapped in ``Ciphertext`` and marked with an extension type or
+    a tag, instead of sentinel-prefixed base64 strings.
+    """
+    mimetype = ""
+
+    @property
+    def available(self) -> bool:
+        """Whether the library implementing the format is installed.
+
+        To be overridden in child classes.
+        """
+        return False
+
+    def encode(self, obj: Any) -> bytes:
+        """Serialize ``obj``.
+
+        To be overridden in child classes.
+        """
+        pass
+
+    def decode(self, data: bytes) -> Any:
+        """Deserialize a document.
+
+        To be overridden in child classes.
+        """
+        pass
+
+
+class MsgpackFormat(RootWireFormat):
+    """Implement MessagePack, with ciphertexts as the ``CIPHERTEXT_EXT`` extension type."""
+    mimetype = MSGPACK_MIMETYPE
+    CIPHERTEXT_EXT = 1
+
+    @property
+    def available(self) -> bool:
+        """Whether ``msgpack`` is installed."""
+        return msgpack is not None
+
+    def encode(self, obj: Any) -> bytes:
+        """Serialize ``obj`` to MessagePack.
+
+        :param obj: Any json-serializable value, possibly holding ``Ciphertext`` values
+        """
+        return msgpack.packb(obj, default=self._default)
+
+    def decode(self, data: bytes) -> Any:
+        """Deserialize a MessagePack document.
+
+        :param bytes data: MessagePack document
+        """
+        return msgpack.unpackb(data, ext_hook=self._ext_hook)
+
+    def _default(self, obj: Any) -> Any:
+        if isinstance(obj, Ciphertext):
+            return msgpack.ExtType(self.CIPHERTEXT_EXT, obj.data)
+        raise TypeError(f"Object of type {type(obj).__name__} is not MessagePack serializable")
+
+    def _ext_hook(self, code: int, data: bytes) -> Any:
+        if code == self.CIPHERTEXT_EXT:
+            return Ciphertext(data)
+        return msgpack.ExtType(code, data)
+
+
+class CBORFormat(RootWireFormat):
+    """Implement CBOR, with ciphertexts as the ``CIPHERTEXT_TAG`` tag."""
+    mimetype = CBOR_MIMETYPE
+    # From the first come first served range of the IANA CBOR tags registry
+    CIPHERTEXT_TAG = 40_401
+
+    @property
+    def available(self) -> bool:
+        """Whether ``cbor2`` is installed."""
+        return cbor2 is not None
+
+    def encode(self, obj: Any) -> bytes:
+        """Serialize ``obj`` to CBOR.
+
+        :param obj: Any json-serializable value, possibly holding ``Ciphertext`` values
+        """
+        return cbor2.dumps(obj, default=self._default)
+
+    def decode(self, data: bytes) -> Any:
+        """Deserialize a CBOR document.
+
+        :param bytes data: CBOR document
+        """
+        return cbor2.loads(data, tag_hook=self._tag_hook)
+
+    def _default(self, encoder: Any, obj: Any):
+        if isinstance(obj, Ciphertext):
+            encoder.encode(cbor2.CBORTag(self.CIPHERTEXT_TAG, obj.data))
+            return
+        raise TypeError(f"Object of type {type(obj).__name__} is not CBOR serializable")
+
+    def _tag_hook(self, tag: Any, immutable: bool) -> Any:
+        if tag.tag == self.CIPHERTEXT_TAG:
+            return Ciphertext(tag.value)
+        return tag
+
+
+WIRE_FORMATS: Dict[str, RootWireFormat] = {
+    MSGPACK_MIMETYPE: MsgpackFormat(),
+    CBOR_MIMETYPE: CBORFormat(),
+}
+
+
+def get_wire_format(mimetype: str) -> Optional[RootWireFormat]:
+    """Return the binary wire format of a mimetype, None for JSON and unknown mimetypes.
+
+    :param str mimetype: The mimetype, without parameters
+    """
+    return WIRE_FORMATS.get(mimetype)
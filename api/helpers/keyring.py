@@ -0,0 +1,133 @@
+from hashlib import sha256
+import hmac
+import json
+from logging import getLogger
+import os
+from threading import Lock
+from time import monotonic
+from typing import Dict, Optional, Tuple
+
+from ..config.settings import HMAC_KEYS, HMAC_KEYS_FILE, HMAC_KEYS_RELOAD_INTERVAL, HMAC_SECRET
+
+
+class KeyRing:
+    """Hold the HMAC keys by id, each one as a pre-keyed HMAC object, and the id of the key used to sign.
+
+    Keys are read from a JSON document ``{"active": "<key id>", "keys": {"<key id>": "<secret>", ...}}``, given
+    inline or as a file. When read from a file, the file modification time is checked every ``reload_interval``
+    seconds, and new keys are loaded without restart. An invalid file is logged and the current keys are kept.
+
+    The ``LEGACY_KEY_ID`` key, the empty string, signs without key id, so that signatures made before key ids stay
+    valid. It is the key given as ``secret``.
+
+    :param str secret: The legacy key, added to the ring when not empty
+    :param str keys: Inline JSON document of keys
+    :param str path: Path of a JSON document of keys, reloaded when it changes
+    :param float reload_interval: Minimum number of seconds between two checks of the file
+    """
+    ENCODING = "utf-8"
+    LEGACY_KEY_ID = ""
+    FINGERPRINT_LABEL = b"key-fingerprint"
+
+    def __init__(self, secret: str = "", keys: str = "", path: str = "", reload_interval: float = 5):
+        self.logger = getLogger(__name__)
+        self.secret = secret
+        self.path = path
+        self.reload_interval = reload_interval
+        # Increased at each (re)load, so that users can detect a change
+        self.version = 0
+        self._lock = Lock()
+        self._mtime = None
+        self._next_check = monotonic() + reload_interval
+
+        document = json.loads(keys) if keys else {}
+        if path:
+            document, self._mtime = self._read_file()
+        self._load(document)
+
+    @classmethod
+    def from_settings(cls) -> "KeyRing":
+        """Build the key ring from the ``HMAC_SECRET``, ``HMAC_KEYS`` and ``HMAC_KEYS_FILE`` environment variables."""
+        return cls(secret=HMAC_SECRET, keys=HMAC_KEYS, path=HMAC_KEYS_FILE, reload_interval=HMAC_KEYS_RELOAD_INTERVAL)
+
+    def __getstate__(self) -> dict:
+        """Pickle the current keys, as HMAC objects and locks cannot be pickled."""
+        return {"secret": self.secret, "keys": json.dumps(self._document)}
+
+    def __setstate__(self, state: dict):
+        """Rebuild a key ring received by another process, without reloading."""
+        self.__init__(**state)
+
+    @property
+    def active_id(self) -> str:
+        """The id of the key used to sign."""
+        self.maybe_reload()
+        return self._state[1]
+
+    @property
+    def fingerprint(self) -> str:
+        """Identify the keys and the active key without revealing them, so that caches can detect a key change."""
+        self.maybe_reload()
+        return self._state[2]
+
+    def get(self, key_id: Optional[str] = None) -> Tuple[str, Optional["hmac.HMAC"]]:
+        """Return a key id and its pre-keyed HMAC object, to be copied before use.
+
+        :param str key_id: The key id, defaults to the active key
+
+        :return: A tuple with the key id and the HMAC object, ``None`` for an unknown key
+        """
+        self.maybe_reload()
+        keys, active_id, _ = self._state
+        key_id = active_id if key_id is None else key_id
+        return key_id, keys.get(key_id)
+
+    def maybe_reload(self):
+        """Reload the keys file if it changed since last load, at most every ``reload_interval`` seconds."""
+        if not self.path or monotonic() < self._next_check or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = monotonic() + self.reload_interval
+            if os.stat(self.path).st_mtime_ns == self._mtime:
+                return
+            document, mtime = self._read_file()
+            self._load(document)
+            self._mtime = mtime
+            self.logger.info("Reloaded HMAC keys from %s, active key is %r", self.path, self._state[1])
+        except (OSError, ValueError) as e:
+            self.logger.error("Unable to reload HMAC keys from %s, keeping current keys: %s", self.path, repr(e))
+        finally:
+            self._lock.release()
+
+    def _read_file(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, encoding=self.ENCODING) as file:
+            return json.load(file), mtime
+
+    def _load(self, document: dict):
+        """Validate a document of keys and swap the current keys with it."""
+        secrets: Dict[str, str] = dict(document.get("keys", {}))
+        for key_id, secret in secrets.items():
+            if not key_id or ":" in key_id or not isinstance(secret, str) or not secret:
+                raise ValueError(f"Invalid HMAC key {key_id!r}, ids must be non empty without ':'")
+        if self.secret or not secrets:
+            if not self.secret:
+                self.logger.warning("HMAC_SECRET is not set, signature algorithm is vulnerable.")
+            secrets[self.LEGACY_KEY_ID] = self.secret
+
+        active_id = document.get("active", self.LEGACY_KEY_ID if self.LEGACY_KEY_ID in secrets else None)
+        if active_id not in secrets:
+            raise ValueError(f"Active HMAC key {active_id!r} is not in the keys")
+
+        keys = {key_id: hmac.new(key=secret.encode(self.ENCODING), digestmod=sha256)
+                for key_id, secret in secrets.items()}
+        fingerprint = sha256(active_id.encode(self.ENCODING))
+        for key_id in sorted(keys):
+            mac = keys[key_id].copy()
+            mac.update(self.FINGERPRINT_LABEL)
+            fingerprint.update(b"\0" + key_id.encode(self.ENCODING) + b"\0" + mac.digest())
+
+        self._document = {"active": active_id, "keys": {k: v for k, v in secrets.items() if k != self.LEGACY_KEY_ID}}
+        # A single assignment, so that concurrent readers see either the old or the new keys
+        self._state = (keys, active_id, fingerprint.hexdigest()[:32])
+        self.version += 1
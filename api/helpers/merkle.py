@@ -0,0 +1,98 @@
+from functools import cached_property
+from hashlib import sha256
+from typing import Any, Dict, List
+
+from .codecs import RootJSONCodec
+
+
+class ProofError(ValueError):
+    """Raised when an inclusion proof is malformed."""
+
+
+class MerkleTree:
+    """Merkle tree over the members of a JSON object, to sign it by its root and verify members one by one.
+
+    Leaves are the members sorted by key, hashed as ``sha256(0x00 | canonical key | ":" | canonical value)``. Nodes are
+    hashed as ``sha256(0x01 | left | right)``, the prefixes preventing a leaf from being taken for a node. A node
+    without sibling is promoted as such to the upper level. The root of an empty object is ``sha256(0x02)``.
+
+    An inclusion proof is the list of sibling hashes from a leaf up to the root, each with its side, so that the root
+    can be recomputed from a single member with O(log n) hashes.
+
+    :param dict document: The JSON object
+    :param RootJSONCodec codec: The JSON codec building the canonical form of keys and values
+    """
+    LEFT = "left"
+    RIGHT = "right"
+
+    def __init__(self, document: dict, codec: RootJSONCodec):
+        self.codec = codec
+        self.keys = sorted(document)
+        self._index = {key: index for index, key in enumerate(self.keys)}
+        self.levels: List[List[bytes]] = [[self.leaf_hash(codec, key, document[key]) for key in self.keys]]
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            upper = [self.node_hash(level[index], level[index + 1]) for index in range(0, len(level) - 1, 2)]
+            if len(level) % 2:
+                upper.append(level[-1])
+            self.levels.append(upper)
+
+    @property
+    def root(self) -> bytes:
+        """The root hash of the tree."""
+        return self.levels[-1][0] if self.keys else sha256(b"\x02").digest()
+
+    @staticmethod
+    def leaf_hash(codec: RootJSONCodec, key: str, value: Any) -> bytes:
+        """Hash a member of the JSON object."""
+        member = f"{codec.canonical(key)}:{codec.canonical(value)}"
+        return sha256(b"\x00" + member.encode("utf-8")).digest()
+
+    @staticmethod
+    def node_hash(left: bytes, right: bytes) -> bytes:
+        """Hash two sibling nodes."""
+        return sha256(b"\x01" + left + right).digest()
+
+    @cached_property
+    def _hex_levels(self) -> List[List[str]]:
+        """The hashes of the levels below the root as hexadecimal strings, shared by all proofs."""
+        return [[node.hex() for node in level] for level in self.levels[:-1]]
+
+    def proof(self, key: str) -> List[Dict[str, str]]:
+        """Return the inclusion proof of a member, as a list of ``{"side": ..., "hash": <hex>}`` from the leaf up.
+
+        :param str key: The key of the member
+        """
+        proof, index = [], self._index[key]
+        for level in self._hex_levels:
+            sibling = index ^ 1
+            if sibling < len(level):
+                proof.append({"side": self.LEFT if sibling < index else self.RIGHT, "hash": level[sibling]})
+            index //= 2
+        return proof
+
+    def proofs(self) -> Dict[str, List[Dict[str, str]]]:
+        """Return the inclusion proofs of all members, by key."""
+        return {key: self.proof(key) for key in self.keys}
+
+    @classmethod
+    def root_from_proof(cls, leaf: bytes, proof: Any) -> bytes:
+        """Recompute the root hash from a leaf hash and its inclusion proof.
+
+        :param bytes leaf: The leaf hash, see ``leaf_hash``
+        :param list proof: The inclusion proof, as returned by ``proof``
+        :raise ProofError: If the proof is malformed
+        """
+        if not isinstance(proof, list):
+            raise ProofError("Proof must be a list")
+        node = leaf
+        for step in proof:
+            try:
+                sibling = bytes.fromhex(step["hash"])
+                side = step["side"]
+            except (TypeError, KeyError, ValueError) as e:
+                raise ProofError(f"Invalid proof step {step!r}") from e
+            if len(sibling) != len(node) or side not in (cls.LEFT, cls.RIGHT):
+                raise ProofError(f"Invalid proof step {step!r}")
+            node = cls.node_hash(sibling, node) if side == cls.LEFT else cls.node_hash(node, sibling)
+        return node
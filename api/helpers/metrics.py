@@ -0,0 +1,358 @@
+from bisect import bisect_left
+from glob import glob
+import json
+from logging import getLogger
+import os
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import Callable, Collection, Dict, Iterable, Optional, Tuple
+
+from ..config.settings import METRICS_DIR, METRICS_ENABLED, METRICS_FLUSH_INTERVAL
+
+
+LabelsKey = Tuple[Tuple[str, str], ...]
+
+
+class MetricNames:
+    """Names and help texts of the metrics exposed by the API."""
+    stage_seconds = "api_stage_duration_seconds"
+    payload_bytes = "api_payload_size_bytes"
+    errors_total = "api_errors_total"
+    cache = "api_signature_cache"
+    verified_index = "api_verified_index"
+
+    help = {
+        stage_seconds: "Time spent in each stage of a request (cache, index, parse, crypter, hmac, serialise)",
+        payload_bytes: "Size of request payloads",
+        errors_total: "Errors by route and cause",
+        cache: "Signature cache entries and size",
+        f"{cache}_total": "Signature cache hits, misses and evictions",
+        verified_index: "Verified signatures index slots",
+        f"{verified_index}_total": "Verified signatures index hits and misses"
+    }
+
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = tuple(2 ** exponent for exponent in range(8, 28, 2))
+
+
+class _NullTimer:
+    """Timer doing nothing, returned when metrics are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _Timer:
+    """Context manager observing its duration in a histogram."""
+
+    def __init__(self, metrics: "Metrics", name: str, labels: LabelsKey):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics._observe(self.name, self.labels, perf_counter() - self.start, LATENCY_BUCKETS)
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """In-process metrics store with Prometheus text rendering.
+
+    Histograms and counters are identified by a name and labels. When disabled, every method returns immediately, so
+    that instrumentation costs a single attribute check.
+
+    To aggregate several worker processes without an external service, each process writes a snapshot of its metrics
+    in ``directory`` at most every ``flush_interval`` seconds (see ``maybe_flush``). ``collect`` then merges the
+    snapshots of the running processes, and removes those of exited ones.
+
+    :param bool enabled: Whether metrics are recorded
+    :param str directory: Directory shared by worker processes, empty for a single process
+    :param float flush_interval: Minimum time in seconds between two snapshots of a process
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, directory: str = METRICS_DIR,
+                 flush_interval: float = METRICS_FLUSH_INTERVAL):
+        self.enabled = enabled
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.logger = getLogger(__name__)
+        self._histograms: Dict[Tuple[str, LabelsKey], dict] = {}
+        self._counters: Dict[Tuple[str, LabelsKey], float] = {}
+        self._collectors: Dict[str, Tuple[Callable[[], Dict[str, float]], Collection[str], Collection[str]]] = {}
+        self._last_flush = monotonic()
+        self._lock = Lock()
+
+    def timer(self, name: str, **labels: str):
+        """Return a context manager observing its duration in the ``name`` histogram.
+
+        :param str name: The histogram name
+        :param labels: The histogram labels
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, tuple(sorted(labels.items())))
+
+    def observe_size(self, name: str, size: Optional[int], **labels: str):
+        """Observe a size in bytes in the ``name`` histogram.
+
+        :param str name: The histogram name
+        :param int size: The observed size, ignored if ``None``
+        :param labels: The histogram labels
+        """
+        if not self.enabled or size is None:
+            return
+        self._observe(name, tuple(sorted(labels.items())), size, SIZE_BUCKETS)
+
+    def increment(self, name: str, amount: float = 1, **labels: str):
+        """Increment the ``name`` counter.
+
+        :param str name: The counter name
+        :param float amount: The increment
+        :param labels: The counter labels
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def counters(self) -> Dict[Tuple[str, LabelsKey], float]:
+        """Return a copy of the counters of this process, by name and labels."""
+        with self._lock:
+            return dict(self._counters)
+
+    def add_counters(self, counters: Dict[Tuple[str, LabelsKey], float]):
+        """Add counts recorded elsewhere, such as in an offload process, to the counters of this process.
+
+        :param dict counters: Amounts by counter name and labels, as returned by ``counters``
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            for key, amount in counters.items():
+                self._counters[key] = self._counters.get(key, 0) + amount
+
+    def add_collector(self, name: str, collector: Callable[[], Dict[str, float]], counters: Collection[str] = (),
+                      shared: Collection[str] = ()):
+        """Register a callable returning metric values of this process, read at each snapshot.
+
+        Each key of the returned dictionary is exported as the ``type`` label of the ``name`` gauge, or of the
+        ``<name>_total`` counter for the keys listed in ``counters``. Counters and gauges are summed across processes,
+        but for ``shared`` gauges, whose value is the same in every process, such as the size of a table in shared
+        memory, of which the maximum is kept. Ratios are left to the queries, from the summed counters.
+
+        :param str name: The metric name
+        :param collector: A callable returning values by type, such as ``SignatureCache.stats``
+        :param counters: The types whose values are cumulative counts, such as hits
+        :param shared: The types of gauges whose value is shared by processes
+        """
+        self._collectors[name] = (collector, counters, shared)
+
+    def _observe(self, name: str, labels: LabelsKey, value: float, buckets: Tuple[float, ...]):
+        """Record a value in a histogram, creating it with ``buckets`` if needed."""
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": list(buckets), "counts": [0] * len(buckets),
+                                                     "sum": 0.0, "count": 0}
+            index = bisect_left(histogram["buckets"], value)
+            if index < len(buckets):
+                histogram["counts"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def snapshot(self) -> dict:
+        """Return a JSON-serializable copy of the metrics of this process.
+
+        Gauges are listed with the aggregation of their values across processes, ``sum`` or ``max``.
+        """
+        counters, gauges = [], []
+        for name, (collector, counter_types, shared_types) in self._collectors.items():
+            for value_type, value in collector().items():
+                labels = (("type", value_type),)
+                if value_type in counter_types:
+                    counters.append([f"{name}_total", labels, value])
+                else:
+                    gauges.append([name, labels, value, "max" if value_type in shared_types else "sum"])
+        with self._lock:
+            return {
+                "histograms": [[name, labels, dict(histogram, counts=list(histogram["counts"]))]
+                               for (name, labels), histogram in self._histograms.items()],
+                "counters": [[name, labels, value] for (name, labels), value in self._counters.items()] + counters,
+                "gauges": gauges
+            }
+
+    def snapshot_path(self, pid: Optional[int] = None) -> str:
+        """Return the path of the snapshot file of a process.
+
+        :param int pid: The process id, defaults to the current process
+        """
+        return os.path.join(self.directory, f"metrics-{pid or os.getpid()}.json")
+
+    def remove_snapshot(self, pid: int):
+        """Remove the snapshot of an exited process, such as a gunicorn worker.
+
+        :param int pid: The process id
+        """
+        if not self.directory:
+            return
+        try:
+            os.remove(self.snapshot_path(pid))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.warning("Unable to remove metrics snapshot of process %s: %s", pid, repr(e))
+
+    def clear_snapshots(self):
+        """Remove the snapshots of the shared directory, left by the processes of a previous run."""
+        if not self.directory:
+            return
+        for path in glob(os.path.join(self.directory, "metrics-*.json*")):
+            try:
+                os.remove(path)
+            except OSError as e:
+                self.logger.warning("Unable to remove metrics snapshot %s: %s", path, repr(e))
+
+    def flush(self):
+        """Write the snapshot of this process in the shared directory."""
+        if not self.enabled or not self.directory:
+            return
+        path = self.snapshot_path()
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w") as snapshot_file:
+            json.dump(self.snapshot(), snapshot_file)
+        os.replace(temporary_path, path)
+        self._last_flush = monotonic()
+
+    def maybe_flush(self):
+        """Write the snapshot of this process if the flush interval has elapsed since the last one."""
+        if self.enabled and self.directory and monotonic() - self._last_flush >= self.flush_interval:
+            try:
+                self.flush()
+            except OSError as e:
+                self.logger.warning("Unable to flush metrics: %s", repr(e))
+
+    def collect(self) -> dict:
+        """Merge the live metrics of this process with the snapshots of the other running processes.
+
+        Snapshots of processes that exited without being removed, for instance killed workers, are removed instead of
+        being merged.
+        """
+        snapshots = [self.snapshot()]
+        if self.directory:
+            own_path = self.snapshot_path()
+            for path in glob(os.path.join(self.directory, "metrics-*.json")):
+                if path == own_path:
+                    continue
+                pid = os.path.basename(path)[len("metrics-"):-len(".json")]
+                if pid.isdigit() and not process_exists(int(pid)):
+                    self.remove_snapshot(int(pid))
+                    continue
+                try:
+                    with open(path) as snapshot_file:
+                        snapshots.append(json.load(snapshot_file))
+                except (OSError, ValueError):
+                    continue
+        return merge_snapshots(snapshots)
+
+    def render(self) -> str:
+        """Render the collected metrics in the Prometheus text exposition format."""
+        merged = self.collect()
+        lines = []
+        for name in sorted({name for name, _ in merged["histograms"]}):
+            lines.extend(_header(name, "histogram"))
+            for (metric_name, labels), histogram in sorted(merged["histograms"].items()):
+                if metric_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, le=_number(bound))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {histogram['count']}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(histogram['sum'])}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+        for kind in ("counters", "gauges"):
+            for name in sorted({name for name, _ in merged[kind]}):
+                lines.extend(_header(name, "counter" if kind == "counters" else "gauge"))
+                for (metric_name, labels), value in sorted(merged[kind].items()):
+                    if metric_name == name:
+                        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def process_exists(pid: int) -> bool:
+    """Tell whether a process is running, with a null signal.
+
+    :param int pid: The process id
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists but belongs to another user
+        return True
+    return True
+
+
+def merge_snapshots(snapshots: Iterable[dict]) -> dict:
+    """Sum snapshots of several processes, metric by metric, but for gauges whose maximum is kept.
+
+    :param snapshots: Snapshots as returned by ``Metrics.snapshot``
+    """
+    merged = {"histograms": {}, "counters": {}, "gauges": {}}
+    for snapshot in snapshots:
+        for name, labels, histogram in snapshot["histograms"]:
+            key = (name, tuple(tuple(label) for label in labels))
+            current = merged["histograms"].get(key)
+            if current is None:
+                merged["histograms"][key] = dict(histogram, counts=list(histogram["counts"]))
+                continue
+            current["counts"] = [a + b for a, b in zip(current["counts"], histogram["counts"])]
+            current["sum"] += histogram["sum"]
+            current["count"] += histogram["count"]
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(tuple(label) for label in labels))
+            merged["counters"][key] = merged["counters"].get(key, 0) + value
+        for name, labels, value, aggregation in snapshot["gauges"]:
+            key = (name, tuple(tuple(label) for label in labels))
+            if key not in merged["gauges"]:
+                merged["gauges"][key] = value
+            elif aggregation == "max":
+                merged["gauges"][key] = max(merged["gauges"][key], value)
+            else:
+                merged["gauges"][key] += value
+    return merged
+
+
+def _header(name: str, metric_type: str) -> list:
+    """Return the HELP and TYPE lines of a metric."""
+    return [f"# HELP {name} {MetricNames.help.get(name, name)}", f"# TYPE {name} {metric_type}"]
+
+
+def _labels(labels: LabelsKey, **extra: str) -> str:
+    """Format labels as ``{key="value",...}``."""
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+def _number(value: float) -> str:
+    """Format a number without useless decimals."""
+    return repr(value) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+metrics = Metrics()
@@ -0,0 +1,143 @@
+from concurrent.futures import ProcessPoolExecutor
+import heapq
+from itertools import repeat
+from logging import getLogger
+import multiprocessing
+from os import cpu_count, getpid
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .crypters import Ciphertext
+from .metrics import metrics
+
+
+class ProcessOffloader:
+    """Run CPU-bound work in a process pool when the payload is large enough.
+
+    Large payloads hold the GIL for a long time when encrypted or signed on the request thread, stalling every other
+    request of the worker. Above ``threshold`` bytes, the work is sent to a pool of processes instead, while small
+    payloads stay inline to avoid the pickling and scheduling overhead.
+
+    The pool is created lazily, and again in forked children, so that it can be shared by a preloaded application.
+    Counters incremented by the work, such as decryption errors, are sent back and added to the metrics of the calling
+    process, as the pool processes never write metrics snapshots.
+
+    :param int threshold: Minimum payload size in bytes to offload, 0 disables offloading
+    :param int max_workers: Number of processes in the pool
+    """
+
+    def __init__(self, threshold: int, max_workers: Optional[int] = None):
+        self.threshold = threshold
+        self.max_workers = max_workers
+        self.logger = getLogger(__name__)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = Lock()
+
+    def should_offload(self, size_hint: Optional[int]) -> bool:
+        """Tell whether a payload of ``size_hint`` bytes must be processed in the pool.
+
+        :param int size_hint: Approximate size of the payload, such as the request content length, or ``None``
+        """
+        return self.threshold > 0 and size_hint is not None and size_hint >= self.threshold
+
+    @property
+    def workers(self) -> int:
+        """The number of processes in the pool."""
+        return self.max_workers or cpu_count() or 1
+
+    def run(self, fn: Callable, *args) -> Any:
+        """Run ``fn(*args)`` in the process pool and wait for its result.
+
+        :param fn: A picklable module-level callable, its arguments must be picklable too
+        """
+        result, counters = self.get_executor().submit(_run_counted, fn, *args).result()
+        metrics.add_counters(counters)
+        return result
+
+    def run_chunks(self, fn: Callable, chunks: Iterable, *args) -> List[Any]:
+        """Run ``fn(chunk, *args)`` for each chunk in the process pool, in parallel, and return the results in order.
+
+        :param fn: A picklable module-level callable, its arguments must be picklable too
+        :param chunks: The chunks of work, one call each
+        """
+        results = []
+        calls = self.get_executor().map(_run_counted, repeat(fn), chunks, *(repeat(arg) for arg in args))
+        for result, counters in calls:
+            metrics.add_counters(counters)
+            results.append(result)
+        return results
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        """Return the process pool, creating it on first use in the current process."""
+        if self._executor is None or self._executor_pid != getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != getpid():
+                    self.logger.debug("Start offload process pool with %s workers", self.max_workers)
+                    # Workers are spawned, forking a threaded server process is unsafe
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+                    self._executor_pid = getpid()
+        return self._executor
+
+    def shutdown(self):
+        """Shut the process pool down, if it was started by this process."""
+        with self._lock:
+            if self._executor is not None and self._executor_pid == getpid():
+                self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def _run_counted(fn: Callable, *args) -> Tuple[Any, Dict]:
+    """Run ``fn(*args)`` in a pool process, and return its result with the counters it incremented."""
+    before = metrics.counters()
+    result = fn(*args)
+    return result, {key: value - before.get(key, 0) for key, value in metrics.counters().items()
+                    if value != before.get(key, 0)}
+
+
+def estimate_size(value: Any) -> int:
+    """Estimate the serialized size of a JSON value, in bytes, without serializing it.
+
+    Strings and bytes count for their length, other scalars for a few bytes. Containers are walked iteratively.
+
+    :param value: Any JSON value
+    """
+    size, stack = 0, [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, (str, bytes)):
+            size += len(value) + 2
+        elif isinstance(value, Ciphertext):
+            size += len(value.data)
+        elif isinstance(value, dict):
+            size += len(value) * 4 + 2
+            stack.extend(value.keys())
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            size += len(value) + 2
+            stack.extend(value)
+        else:
+            size += 8
+    return size
+
+
+def balanced_chunks(payload: dict, count: int) -> List[dict]:
+    """Split the items of a dictionary into at most ``count`` chunks of about the same estimated size.
+
+    Items are given, largest first, to the chunk with the smallest size so far. Keys of a chunk are not in the order of
+    the payload.
+
+    :param dict payload: The dictionary to split
+    :param int count: The maximum number of chunks
+    """
+    chunks = [{} for _ in range(max(1, min(count, len(payload))))]
+    heap = [(0, index) for index in range(len(chunks))]
+    sized = sorted(((estimate_size(value), key) for key, value in payload.items()), key=lambda item: -item[0])
+    for size, key in sized:
+        total, index = heapq.heappop(heap)
+        chunks[index][key] = payload[key]
+        heapq.heappush(heap, (total + size, index))
+    return chunks
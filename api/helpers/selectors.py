@@ -0,0 +1,141 @@
+from functools import lru_cache
+import re
+from typing import Any, Iterator, List, Tuple, Union
+
+
+class SelectorError(ValueError):
+    """Raised when a path selector cannot be parsed."""
+
+
+class Step:
+    """Kinds of steps of a path selector."""
+    key = "key"
+    index = "index"
+    wildcard = "wildcard"
+    descendant = "descendant"
+
+
+# A match is a container (dict or list) and the key or index of the matched value within it
+Match = Tuple[Union[dict, list], Union[str, int]]
+
+_TOKEN = re.compile(r"""
+    \.\.(?P<descendant>\*|[^.\[\]]+)     # ..name or ..*
+    | \.(?P<key>\*|[^.\[\]]+)            # .name or .*
+    | \[(?P<index>-?\d+)\]               # [0]
+    | \[(?P<wildcard>\*)\]               # [*]
+    | \[(?P<quote>['"])(?P<quoted>(?:(?!(?P=quote)).)*)(?P=quote)\]   # ['name'] or ["name"]
+""", re.VERBOSE)
+
+
+@lru_cache(maxsize=256)
+def parse_selector(selector: str) -> Tuple[Tuple[str, Any], ...]:
+    """Parse a JSONPath-like selector into a tuple of steps.
+
+    Supported syntax: ``$`` root, ``.name`` and ``['name']`` keys, ``[0]`` list index, ``.*`` and ``[*]`` wildcards,
+    ``..name`` and ``..*`` descendants at any depth. For instance ``$.users[*].password`` or ``$..secret``.
+
+    :param str selector: The selector to parse, the leading ``$`` is optional
+    """
+    path = selector.strip()
+    if path.startswith("$"):
+        path = path[1:]
+    elif path and path[0] not in ".[":
+        path = "." + path
+    if not path:
+        raise SelectorError(f"Selector {selector!r} selects the whole document")
+
+    steps, position = [], 0
+    while position < len(path):
+        match = _TOKEN.match(path, position)
+        if match is None:
+            raise SelectorError(f"Invalid selector {selector!r} at position {position}")
+        position = match.end()
+        if match["descendant"] is not None:
+            steps.append((Step.descendant, None if match["descendant"] == "*" else match["descendant"]))
+        elif match["key"] == "*" or match["wildcard"]:
+            steps.append((Step.wildcard, None))
+        elif match["key"] is not None:
+            steps.append((Step.key, match["key"]))
+        elif match["index"] is not None:
+            steps.append((Step.index, int(match["index"])))
+        else:
+            steps.append((Step.key, match["quoted"]))
+    return tuple(steps)
+
+
+def children(value: Any) -> Iterator[Match]:
+    """Yield the (container, key) pairs of the direct children of a value."""
+    if isinstance(value, dict):
+        for key in value:
+            yield value, key
+    elif isinstance(value, list):
+        for index in range(len(value)):
+            yield value, index
+
+
+def descendants(value: Any) -> Iterator[Match]:
+    """Yield the (container, key) pairs of all descendants of a value, iteratively so that depth is not limited."""
+    stack = [value]
+    while stack:
+        for container, key in children(stack.pop()):
+            yield container, key
+            stack.append(container[key])
+
+
+def select(document: Any, selector: str) -> List[Match]:
+    """Return the (container, key) pairs of the values matched by ``selector`` in ``document``.
+
+    :param document: A JSON document
+    :param str selector: A selector, see ``parse_selector``
+    """
+    # Values reached so far, the root has no container
+    frontier: List[Tuple[Any, Any]] = [(None, None)]
+    for kind, argument in parse_selector(selector):
+        next_frontier = []
+        for container, key in frontier:
+            value = document if container is None else container[key]
+            if kind == Step.key:
+                if isinstance(value, dict) and argument in value:
+                    next_frontier.append((value, argument))
+            elif kind == Step.index:
+                if isinstance(value, list) and -len(value) <= argument < len(value):
+                    next_frontier.append((value, argument % len(value)))
+            elif kind == Step.wildcard:
+                next_frontier.extend(children(value))
+            else:
+                next_frontier.extend((parent, child) for parent, child in descendants(value)
+                                     if argument is None or child == argument)
+        frontier = next_frontier
+    return frontier
+
+
+def select_all(document: Any, selectors: List[str]) -> List[Match]:
+    """Return the distinct matches of several selectors, shallowest first.
+
+    When a match is nested in another one, handling the outer one first detaches the inner one from the document, so
+    that the outer one wins.
+
+    :param document: A JSON document
+    :param list selectors: Selectors, see ``parse_selector``
+    """
+    seen, matches = set(), []
+    for selector in selectors:
+        for container, key in select(document, selector):
+            if (id(container), key) not in seen:
+                seen.add((id(container), key))
+                matches.append((container, key))
+    depths = _depths(document)
+    return sorted(matches, key=lambda match: depths.get(id(match[0]), 0))
+
+
+def _depths(document: Any) -> dict:
+    """Map the id of each container of the document to its depth."""
+    depths, stack = {id(document): 0}, [document]
+    while stack:
+        value = stack.pop()
+        for container, key in children(value):
+            child = container[key]
+            if isinstance(child, (dict, list)):
+                depths[id(child)] = depths[id(value)] + 1
+                stack.append(child)
+    return depths
@@ -1,36 +1,104 @@
-from hashlib import sha256
-import hmac
 from logging import getLogger
+from typing import Iterable, Optional, Tuple
 
-from ..config.settings import HMAC_SECRET
+from .keyring import KeyRing
+
+
+class UnknownKeyError(ValueError):
+    """Raised when a signature refers to a key id that is not in the key ring."""
 
 
 class RootSigner:
     """Root class for signing algorithms classes."""
+    # Identifies the signing keys without revealing them, so that caches can detect a key change
+    key_fingerprint = ""
 
-    def signature(self, s: str) -> str:
-        """Generate signature for input `s`.
+    def signature(self, s: str, key_id: Optional[str] = None) -> str:
+        """Generate signature for input `s`, with the key `key_id` if the algorithm has several keys.
 
         To be overridden in child classes.
         """
         pass
 
+    def signature_chunks(self, chunks: Iterable[bytes], key_id: Optional[str] = None) -> str:
+        """Generate signature for the concatenation of UTF-8 encoded `chunks`.
+
+        Child classes can override it to sign the chunks incrementally.
+        """
+        return self.signature(b"".join(chunks).decode("utf-8"), key_id=key_id)
+
+    def split_signature(self, signature: str) -> Tuple[Optional[str], str]:
+        """Split a signature into the id of its key, ``None`` if the algorithm has a single key, and its digest."""
+        return None, signature
+
 
 class HMACSigner(RootSigner):
-    """Implement HMAC signing algorithm."""
+    """Implement HMAC signing algorithm.
+
+    Keys are held by a `KeyRing`, each one in a pre-keyed HMAC object. Each signature works on a copy of that object,
+    so that a single instance can be shared between threads.
+
+    Signatures are prefixed with the id of their key, as ``<key id>:<hex digest>``, except for the legacy key whose
+    signatures are the bare hex digest.
+
+    :param str secret: The single HMAC key, ignored if ``keyring`` is given
+    :param KeyRing keyring: The HMAC keys, defaults to a key ring built from the environment variables, see
+    ``KeyRing.from_settings``
+    """
     ENCODING = "utf-8"
+    SEPARATOR = ":"
 
-    def __init__(self):
+    def __init__(self, secret: Optional[str] = None, keyring: Optional[KeyRing] = None):
         self.logger = getLogger(__name__)
-        if not HMAC_SECRET:
-            self.logger.warning("HMAC_SECRET is not set, signature algorithm is vulnerable.")
+        if keyring is None:
+            keyring = KeyRing.from_settings() if secret is None else KeyRing(secret=secret)
+        self.keyring = keyring
+
+    @property
+    def key_fingerprint(self) -> str:
+        """Identify the keys of the key ring, changed whenever keys are rotated."""
+        return self.keyring.fingerprint
 
-    def signature(self, message: str) -> str:
-        """Create an HMAC-SHA256 signature of a message as an hexadecimal string.
+    def signature(self, message: str, key_id: Optional[str] = None) -> str:
+        """Create an HMAC-SHA256 signature of a message, prefixed with its key id.
 
         :param str message: The message to sign
+        :param str key_id: The id of the key, defaults to the active key
         """
-        message_bytes = message.encode(self.ENCODING)
-        secret_bytes = HMAC_SECRET.encode(self.ENCODING)
+        return self.signature_bytes(message.encode(self.ENCODING), key_id=key_id)
 
-        return hmac.new(key=secret_bytes, msg=message_bytes, digestmod=sha256).hexdigest()
+    def signature_bytes(self, message: bytes, key_id: Optional[str] = None) -> str:
+        """Create an HMAC-SHA256 signature of an already encoded message, prefixed with its key id.
+
+        :param bytes message: The message to sign
+        :param str key_id: The id of the key, defaults to the active key
+        :raise UnknownKeyError: If the key is not in the key ring
+        """
+        return self.signature_chunks((message,), key_id=key_id)
+
+    def signature_chunks(self, chunks: Iterable[bytes], key_id: Optional[str] = None) -> str:
+        """Create an HMAC-SHA256 signature of the concatenation of encoded chunks, prefixed with its key id.
+
+        Chunks are fed to the HMAC one at a time, so that the whole message is never held in memory.
+
+        :param chunks: The encoded message, by chunks
+        :param str key_id: The id of the key, defaults to the active key
+        :raise UnknownKeyError: If the key is not in the key ring
+        """
+        key_id, keyed_hmac = self.keyring.get(key_id)
+        if keyed_hmac is None:
+            raise UnknownKeyError(f"Unknown HMAC key {key_id!r}")
+        mac = keyed_hmac.copy()
+        for chunk in chunks:
+            mac.update(chunk)
+        if key_id == KeyRing.LEGACY_KEY_ID:
+            return mac.hexdigest()
+        return key_id + self.SEPARATOR + mac.hexdigest()
+
+    def split_signature(self, signature: str) -> Tuple[Optional[str], str]:
+        """Split a signature into the id of its key, the legacy key id for bare digests, and its hex digest.
+
+        :param str signature: A signature as returned by ``signature``
+        """
+        key_id, _, digest = signature.rpartition(self.SEPARATOR)
+        return key_id, digest
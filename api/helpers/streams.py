@@ -0,0 +1,40 @@
+import io
+from typing import BinaryIO
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+
+class CappedReader(io.RawIOBase):
+    """Readable stream raising `REQUEST ENTITY TOO LARGE` once more than ``limit`` bytes are read from a stream.
+
+    Unlike the stream of werkzeug, which stops at the limit, a body over the limit is never passed truncated. Child
+    classes transform the bytes read by overriding ``read_source``.
+
+    :param stream: The stream to read, of unknown length
+    :param int limit: Maximum number of bytes read
+    :param str error: Description of the error, formatted with ``limit``
+    """
+
+    def __init__(self, stream: BinaryIO, limit: int, error: str = "Body exceeds {limit} bytes"):
+        self.stream = stream
+        self.limit = limit
+        self.error = error
+        self.size = 0
+
+    def readable(self) -> bool:
+        """Tell that the stream is readable."""
+        return True
+
+    def read_source(self, size: int) -> bytes:
+        """Read up to ``size`` bytes from the stream, empty at its end."""
+        return self.stream.read(size)
+
+    def readinto(self, buffer) -> int:
+        """Read up to ``len(buffer)`` bytes into ``buffer``, 0 at the end of the stream."""
+        # Reading one byte more than allowed is enough to detect an oversized body
+        data = self.read_source(min(len(buffer), self.limit - self.size + 1))
+        self.size += len(data)
+        if self.size > self.limit:
+            raise RequestEntityTooLarge(self.error.format(limit=self.limit))
+        buffer[:len(data)] = data
+        return len(data)
@@ -1,16 +1,38 @@
+from functools import partial
 from http import HTTPStatus, HTTPMethod
 from logging import getLogger
 
-from flask import Blueprint, request
+from flask import Blueprint, Response, request, stream_with_context
 
+from ..config.settings import NDJSON_MIMETYPE, STREAM_MAX_CONTENT_LENGTH
+from ..controllers.batch import iter_lines, process_batch, process_stream, validate_batch
 from ..controllers.encryption import EncryptionHandler
-from ..helpers.crypters import Base64Crypter
+from ..controllers.limits import limit_request
+from ..controllers.negotiation import get_payload, get_response_format, make_payload_response
+from ..controllers.registry import get_registry
+from ..helpers.metrics import MetricNames, metrics
+from ..helpers.selectors import SelectorError, parse_selector
 
 
 blueprint_encryption = Blueprint("encryption", import_name="__name__")
 
 
+def encrypt_item(handler: EncryptionHandler, item):
+    """Validate and encrypt a single item of a batch or stream."""
+    if not isinstance(item, dict):
+        return {"error": "Input is not a valid JSON"}, HTTPStatus.BAD_REQUEST
+    return handler.encrypt_payload(item)
+
+
+def decrypt_item(handler: EncryptionHandler, item):
+    """Validate and decrypt a single item of a batch or stream."""
+    if not isinstance(item, dict):
+        return {"error": "Input is not a valid JSON"}, HTTPStatus.BAD_REQUEST
+    return handler.decrypt_payload(item)
+
+
 @blueprint_encryption.route("/encrypt", methods=[HTTPMethod.POST])
+@limit_request(first_byte=b"{")
 def encrypt():
     """
     Encrypt all depth-1 values in the received JSON payload.
@@ -18,6 +40,23 @@ def encrypt():
     ---
     post:
         summary: Encrypt depth-1 values of a JSON object
+        description: >
+            By default, all depth-1 values are encrypted. With one or more `path` selectors, only the matched
+            values are encrypted, at any depth, and the rest of the object is returned in clear.
+            Bodies can also be sent and received as `application/msgpack` or `application/cbor`, negotiated with
+            the Content-Type and Accept headers. Encrypted values are then raw bytes (msgpack extension type 1,
+            CBOR tag 40401) instead of sentinel-prefixed base64 strings.
+        parameters:
+            - in: query
+              name: path
+              description: JSONPath-like selector of values to encrypt, such as `$.users[*].password`
+              required: false
+              schema:
+                  type: array
+                  items:
+                      type: string
+              style: form
+              explode: true
         requestBody:
             required: true
             content:
@@ -65,21 +104,43 @@ def encrypt():
         tags:
             - encryption
     """
-    payload = request.get_json()
+    with metrics.timer(MetricNames.stage_seconds, route="encrypt", stage="parse"):
+        payload, request_format = get_payload()
+    wire_format = get_response_format(request_format)
+    metrics.observe_size(MetricNames.payload_bytes, request.content_length, route="encrypt")
     if not isinstance(payload, dict):
-        return {"error": "Input is not a valid JSON"}, HTTPStatus.BAD_REQUEST
+        metrics.increment(MetricNames.errors_total, route="encrypt", cause="invalid_input")
+        return make_payload_response({"error": "Input is not a valid JSON"}, HTTPStatus.BAD_REQUEST, wire_format)
+
+    selectors = request.args.getlist("path")
+    try:
+        for selector in selectors:
+            parse_selector(selector)
+    except SelectorError as e:
+        metrics.increment(MetricNames.errors_total, route="encrypt", cause="invalid_selector")
+        return make_payload_response({"error": str(e)}, HTTPStatus.BAD_REQUEST, wire_format)
 
     logger = getLogger(__name__)
-    handler = EncryptionHandler(crypter=Base64Crypter())
+    handler = get_registry().encryption
     try:
-        result, status = handler.encrypt_payload(payload)
+        with metrics.timer(MetricNames.stage_seconds, route="encrypt", stage="crypter"):
+            result, status = handler.encrypt_payload(payload, size_hint=request.content_length, selectors=selectors,
+                                                     raw=wire_format is not None)
+        return make_payload_response(result, status, wire_format)
+    except TypeError as e:
+        # Binary wire formats can carry values, such as bytes, that have no JSON form to encrypt or to answer with
+        logger.error("Payload is not JSON serializable: %s", repr(e))
+        metrics.increment(MetricNames.errors_total, route="encrypt", cause="invalid_input")
+        result, status = {"error": "Payload is not JSON serializable"}, HTTPStatus.BAD_REQUEST
     except Exception as e:
         logger.error("Error when encrypting payload", exc_info=e)
+        metrics.increment(MetricNames.errors_total, route="encrypt", cause="exception")
         result, status = {"error": "Unable to encrypt payload"}, HTTPStatus.INTERNAL_SERVER_ERROR
-    return result, status
+    return make_payload_response(result, status, wire_format)
 
 
 @blueprint_encryption.route("/decrypt", methods=[HTTPMethod.POST])
+@limit_request(first_byte=b"{")
 def decrypt():
     """
     Decrypt depth-1 items from payload. If an item was not encrypted, it is returned as is.
@@ -90,7 +151,33 @@ def decrypt():
         description: >
             Decrypts all depth-1 values of the provided JSON object that were previously
             encrypted by us. Values that are not encrypted by us are returned unchanged. If any
-            decryption fails, a BadRequest error is returned.
+            decryption fails, a BadRequest error is returned. With `deep`, encrypted values are
+            decrypted at any depth, as produced by `/encrypt` with `path` selectors. With `fields`, only the
+            named depth-1 values are decrypted, the other ones being returned unchanged, or left out with `only`.
+            Bodies can also be sent and received as `application/msgpack` or `application/cbor`, in which
+            encrypted values can be raw bytes.
+        parameters:
+            - in: query
+              name: deep
+              description: Decrypt encrypted values at any depth
+              required: false
+              schema:
+                  type: boolean
+                  default: false
+            - in: query
+              name: fields
+              description: Comma-separated keys of the depth-1 values to decrypt, all of them by default
+              required: false
+              schema:
+                  type: string
+              example: name,age
+            - in: query
+              name: only
+              description: Return only the values named by `fields`
+              required: false
+              schema:
+                  type: boolean
+                  default: false
         requestBody:
             required: true
             content:
@@ -140,15 +227,282 @@ def decrypt():
         tags:
             - encryption
     """
-    payload = request.get_json()
+    with metrics.timer(MetricNames.stage_seconds, route="decrypt", stage="parse"):
+        payload, request_format = get_payload()
+    wire_format = get_response_format(request_format)
+    metrics.observe_size(MetricNames.payload_bytes, request.content_length, route="decrypt")
     if not isinstance(payload, dict):
-        return {"error": "Input is not a valid JSON"}, HTTPStatus.BAD_REQUEST
+        metrics.increment(MetricNames.errors_total, route="decrypt", cause="invalid_input")
+        return make_payload_response({"error": "Input is not a valid JSON"}, HTTPStatus.BAD_REQUEST, wire_format)
+
+    deep = request.args.get("deep", "false").lower() in ("true", "1", "yes")
+    only = request.args.get("only", "false").lower() in ("true", "1", "yes")
+    fields = request.args.get("fields")
+    if fields is not None:
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+    elif only:
+        metrics.increment(MetricNames.errors_total, route="decrypt", cause="invalid_input")
+        error = {"error": "The only parameter requires fields"}
+        return make_payload_response(error, HTTPStatus.BAD_REQUEST, wire_format)
 
     logger = getLogger(__name__)
-    handler = EncryptionHandler(crypter=Base64Crypter())
+    handler = get_registry().encryption
     try:
-        result, status = handler.decrypt_payload(payload)
+        with metrics.timer(MetricNames.stage_seconds, route="decrypt", stage="crypter"):
+            result, status = handler.decrypt_payload(payload, size_hint=request.content_length, deep=deep,
+                                                     fields=fields, only=only)
+        return make_payload_response(result, status, wire_format)
+    except TypeError as e:
+        # Binary wire formats can carry values, such as bytes, that have no JSON form to encrypt or to answer with
+        logger.error("Payload is not JSON serializable: %s", repr(e))
+        metrics.increment(MetricNames.errors_total, route="decrypt", cause="invalid_input")
+        result, status = {"error": "Payload is not JSON serializable"}, HTTPStatus.BAD_REQUEST
     except Exception as e:
         logger.error("Error when encrypting payload", exc_info=e)
+        metrics.increment(MetricNames.errors_total, route="decrypt", cause="exception")
         result, status = {"error": "Unable to decrypt payload"}, HTTPStatus.INTERNAL_SERVER_ERROR
-    return result, status
+    return make_payload_response(result, status, wire_format)
+
+
+@blueprint_encryption.route("/encrypt/batch", methods=[HTTPMethod.POST])
+@limit_request(first_byte=b"[", error="Input is not a valid JSON array")
+def encrypt_batch():
+    """
+    Encrypt all depth-1 values of each JSON object in the received array.
+
+    ---
+    post:
+        summary: Encrypt depth-1 values of several JSON objects at once
+        description: >
+            Each item of the array is encrypted independently, as `/encrypt` would. The response holds one
+            result per item, in the same order, with its own status code. An invalid item does not fail
+            the whole batch.
+        requestBody:
+            required: true
+            content:
+                application/json:
+                    schema:
+                        type: array
+                        items:
+                            type: object
+                            additionalProperties: true
+                    example:
+                        - name: Alice
+                          age: 32
+                        - not an object
+        responses:
+            200:
+                description: Batch processed, see each item status
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                results:
+                                    type: array
+                                    items:
+                                        type: object
+                                        properties:
+                                            status:
+                                                type: integer
+                                            body:
+                                                type: object
+                        example:
+                            results:
+                                - status: 200
+                                  body:
+                                      age: --- BEGIN CRYPTED MESSAGE ---MzI=
+                                      name: --- BEGIN CRYPTED MESSAGE ---IkFsaWNlIg==
+                                - status: 400
+                                  body:
+                                      error: Input is not a valid JSON
+            400:
+                description: Invalid input payload (payload is not a JSON array)
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                error:
+                                    type: string
+            413:
+                description: Too many items in the batch
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                error:
+                                    type: string
+        tags:
+            - encryption
+    """
+    payload = request.get_json()
+    error = validate_batch(payload)
+    if error:
+        return error
+
+    handler = get_registry().encryption
+    return process_batch(payload, partial(encrypt_item, handler), "Unable to encrypt payload")
+
+
+@blueprint_encryption.route("/decrypt/batch", methods=[HTTPMethod.POST])
+@limit_request(first_byte=b"[", error="Input is not a valid JSON array")
+def decrypt_batch():
+    """
+    Decrypt depth-1 items of each JSON object in the received array.
+
+    ---
+    post:
+        summary: Decrypt the depth-1 values of several JSON objects at once
+        description: >
+            Each item of the array is decrypted independently, as `/decrypt` would. The response holds one
+            result per item, in the same order, with its own status code. An item that fails to decrypt
+            does not fail the whole batch.
+        requestBody:
+            required: true
+            content:
+                application/json:
+                    schema:
+                        type: array
+                        items:
+                            type: object
+                            additionalProperties: true
+                    example:
+                        - name: --- BEGIN CRYPTED MESSAGE ---IkFsaWNlIg==
+                          comment: Not encrypted
+                        - name: --- BEGIN CRYPTED MESSAGE ---not base64
+        responses:
+            200:
+                description: Batch processed, see each item status
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                results:
+                                    type: array
+                                    items:
+                                        type: object
+                                        properties:
+                                            status:
+                                                type: integer
+                                            body:
+                                                type: object
+                        example:
+                            results:
+                                - status: 200
+                                  body:
+                                      name: Alice
+                                      comment: Not encrypted
+                                - status: 400
+                                  body:
+                                      error: One or more items were not properly encrypted
+            400:
+                description: Invalid input payload (payload is not a JSON array)
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                error:
+                                    type: string
+            413:
+                description: Too many items in the batch
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                error:
+                                    type: string
+        tags:
+            - encryption
+    """
+    payload = request.get_json()
+    error = validate_batch(payload)
+    if error:
+        return error
+
+    handler = get_registry().encryption
+    return process_batch(payload, partial(decrypt_item, handler), "Unable to decrypt payload")
+
+
+@blueprint_encryption.route("/encrypt/stream", methods=[HTTPMethod.POST])
+@limit_request(max_length=STREAM_MAX_CONTENT_LENGTH)
+def encrypt_stream():
+    """
+    Encrypt all depth-1 values of each JSON object of a NDJSON stream.
+
+    ---
+    post:
+        summary: Encrypt depth-1 values of newline-delimited JSON objects
+        description: >
+            The body is read one line at a time and each record is encrypted as `/encrypt` would.
+            Results are streamed back as NDJSON, one `{status, body}` line per record and in the same order,
+            so memory usage does not depend on the body size.
+        requestBody:
+            required: true
+            content:
+                application/x-ndjson:
+                    schema:
+                        type: string
+                    example: |
+                        {"age": 32}
+                        {"name": "Bob"}
+        responses:
+            200:
+                description: Stream processed, see each line status
+                content:
+                    application/x-ndjson:
+                        schema:
+                            type: string
+                        example: |
+                            {"status":200,"body":{"age":"--- BEGIN CRYPTED MESSAGE ---MzI="}}
+                            {"status":200,"body":{"name":"--- BEGIN CRYPTED MESSAGE ---IkJvYiI="}}
+        tags:
+            - encryption
+    """
+    handler = get_registry().encryption
+    results = process_stream(iter_lines(request.stream), partial(encrypt_item, handler), "Unable to encrypt payload")
+    return Response(stream_with_context(results), mimetype=NDJSON_MIMETYPE)
+
+
+@blueprint_encryption.route("/decrypt/stream", methods=[HTTPMethod.POST])
+@limit_request(max_length=STREAM_MAX_CONTENT_LENGTH)
+def decrypt_stream():
+    """
+    Decrypt depth-1 items of each JSON object of a NDJSON stream.
+
+    ---
+    post:
+        summary: Decrypt the depth-1 values of newline-delimited JSON objects
+        description: >
+            The body is read one line at a time and each record is decrypted as `/decrypt` would.
+            Results are streamed back as NDJSON, one `{status, body}` line per record and in the same order,
+            so memory usage does not depend on the body size.
+        requestBody:
+            required: true
+            content:
+                application/x-ndjson:
+                    schema:
+                        type: string
+                    example: |
+                        {"name": "--- BEGIN CRYPTED MESSAGE ---IkFsaWNlIg==", "comment": "Not encrypted"}
+                        {"name": "--- BEGIN CRYPTED MESSAGE ---IkJvYiI="}
+        responses:
+            200:
+                description: Stream processed, see each line status
+                content:
+                    application/x-ndjson:
+                        schema:
+                            type: string
+                        example: |
+                            {"status":200,"body":{"name":"Alice","comment":"Not encrypted"}}
+                            {"status":200,"body":{"name":"Bob"}}
+        tags:
+            - encryption
+    """
+    handler = get_registry().encryption
+    results = process_stream(iter_lines(request.stream), partial(decrypt_item, handler), "Unable to decrypt payload")
+    return Response(stream_with_context(results), mimetype=NDJSON_MIMETYPE)
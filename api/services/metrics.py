@@ -0,0 +1,50 @@
+from http import HTTPMethod, HTTPStatus
+
+from flask import Blueprint, Response
+
+from ..helpers.metrics import metrics
+
+
+blueprint_metrics = Blueprint("metrics", import_name="__name__")
+
+
+@blueprint_metrics.route("/metrics", methods=[HTTPMethod.GET])
+def get_metrics():
+    """
+    Expose metrics in the Prometheus text format.
+
+    ---
+    get:
+        summary: Prometheus metrics of the API
+        description: >
+            Per-stage latency histograms for each route (parse, crypter, hmac, serialise), payload size
+            histograms, error counters by cause and signature cache counters, aggregated over all worker
+            processes. Only available when the `METRICS_ENABLED` environment variable is set.
+        responses:
+            200:
+                description: Metrics in the Prometheus text format
+                content:
+                    text/plain:
+                        schema:
+                            type: string
+            404:
+                description: Metrics are disabled
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                error:
+                                    type: string
+        tags:
+            - metrics
+    """
+    if not metrics.enabled:
+        return {"error": "Metrics are disabled"}, HTTPStatus.NOT_FOUND
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@blueprint_metrics.teardown_app_request
+def flush_metrics(exception):
+    """Write this worker metrics to the shared directory, at most every flush interval."""
+    metrics.maybe_flush()
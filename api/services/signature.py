@@ -1,17 +1,42 @@
+from functools import partial
 from http import HTTPMethod, HTTPStatus
 from logging import getLogger
 
-from flask import Blueprint, request
+from flask import Blueprint, Response, request, stream_with_context
 
 from ..config.fields import SignatureFields
+from ..config.settings import NDJSON_MIMETYPE, STREAM_MAX_CONTENT_LENGTH
+from ..controllers.batch import iter_lines, process_batch, process_stream, validate_batch
+from ..controllers.limits import limit_request
+from ..controllers.negotiation import get_payload, get_response_format, make_payload_response
+from ..controllers.registry import get_registry
 from ..controllers.signature import SignatureHandler
-from ..helpers.signer import HMACSigner
+from ..helpers.formats import get_wire_format
+from ..helpers.metrics import MetricNames, metrics
 
 
 blueprint_signature = Blueprint("signature", import_name="__name__")
+MERKLE_MODE = "merkle"
+
+
+def sign_item(handler: SignatureHandler, item):
+    """Validate and sign a single item of a batch or stream, rejecting ``null`` as ``/sign`` does."""
+    if item is None:
+        return {"error": "Invalid JSON payload"}, HTTPStatus.BAD_REQUEST
+    return handler.sign_payload(item)
+
+
+def verify_item(handler: SignatureHandler, item):
+    """Validate and verify a single item of a batch or stream."""
+    if not isinstance(item, dict):
+        return {"error": "Invalid JSON payload"}, HTTPStatus.BAD_REQUEST
+    elif SignatureFields.signature not in item or SignatureFields.data not in item:
+        return {"error": "Missing signature or data in payload"}, HTTPStatus.BAD_REQUEST
+    return handler.verify_payload(item)
 
 
 @blueprint_signature.route("/sign", methods=[HTTPMethod.POST])
+@limit_request()
 def sign():
     """
     Generate signature for received JSON payload.
@@ -19,6 +44,21 @@ def sign():
     ---
     post:
         summary: Generate signature for a JSON object
+        description: >
+            Bodies can also be sent and received as `application/msgpack` or `application/cbor`, negotiated with
+            the Content-Type and Accept headers. The signature is still computed over the canonical JSON form of
+            the payload, so it does not depend on the wire format.
+            With `mode=merkle`, the payload must be an object: the signature is computed over the root of a
+            Merkle tree of its members, returned with the inclusion proof of each member, so that members can
+            later be verified one by one with `/verify?mode=merkle`, or changed with `/sign/update`.
+        parameters:
+            - in: query
+              name: mode
+              required: false
+              schema:
+                  type: string
+                  enum: [merkle]
+              description: Sign the Merkle root of the object members instead of its canonical form
         requestBody:
             required: true
             content:
@@ -39,6 +79,12 @@ def sign():
                             properties:
                                 signature:
                                     type: string
+                                root:
+                                    type: string
+                                    description: Merkle root, with `mode=merkle` only
+                                proofs:
+                                    type: object
+                                    description: Inclusion proof of each member, with `mode=merkle` only
                         example:
                             signature: a1b2c3d4e5f6g7h8i9j0
             400:
@@ -62,23 +108,53 @@ def sign():
         tags:
             - signature
     """
+    metrics.observe_size(MetricNames.payload_bytes, request.content_length, route="sign")
+    mode = request.args.get("mode")
+    handler = get_registry().signature
+    # Bodies identical to an already signed one are answered before parsing, see SignatureHandler.signature_cache_key
+    cache_key = None
+    if mode is None:
+        with metrics.timer(MetricNames.stage_seconds, route="sign", stage="cache"):
+            cache_key = handler.signature_cache_key(request.get_data(cache=True), request.mimetype)
+            signature = handler.cached_signature(cache_key)
+        if signature is not None:
+            wire_format = get_response_format(get_wire_format(request.mimetype))
+            return make_payload_response({SignatureFields.signature: signature}, HTTPStatus.OK, wire_format)
+
     # We accept non-dict JSON input, such as a single string, null, a list...
     #   but still raise a BAD REQUEST if get_json did not return properly
-    payload = request.get_json(silent=True)
+    with metrics.timer(MetricNames.stage_seconds, route="sign", stage="parse"):
+        payload, request_format = get_payload(silent=True)
+    wire_format = get_response_format(request_format)
     if payload is None:
-        return {"error": "Invalid JSON payload"}, HTTPStatus.BAD_REQUEST
+        metrics.increment(MetricNames.errors_total, route="sign", cause="invalid_input")
+        return make_payload_response({"error": "Invalid JSON payload"}, HTTPStatus.BAD_REQUEST, wire_format)
+
+    if mode not in (None, MERKLE_MODE):
+        metrics.increment(MetricNames.errors_total, route="sign", cause="invalid_input")
+        return make_payload_response({"error": f"Unknown mode {mode!r}"}, HTTPStatus.BAD_REQUEST, wire_format)
 
     logger = getLogger(__name__)
-    handler = SignatureHandler(signer=HMACSigner())
     try:
-        result, status = handler.sign_payload(payload)
+        with metrics.timer(MetricNames.stage_seconds, route="sign", stage="hmac"):
+            if mode == MERKLE_MODE:
+                result, status = handler.sign_merkle(payload)
+            else:
+                result, status = handler.sign_payload(payload, size_hint=request.content_length, cache_key=cache_key)
+    except TypeError as e:
+        # Binary wire formats can carry values that have no JSON form, hence no canonical form to sign
+        logger.error("Payload is not JSON serializable: %s", repr(e))
+        metrics.increment(MetricNames.errors_total, route="sign", cause="invalid_input")
+        result, status = {"error": "Payload is not JSON serializable"}, HTTPStatus.BAD_REQUEST
     except Exception as e:
         logger.error("Error when signing payload: %s", repr(e))
+        metrics.increment(MetricNames.errors_total, route="sign", cause="exception")
         result, status = {"error": "Unable to sign payload"}, HTTPStatus.INTERNAL_SERVER_ERROR
-    return result, status
+    return make_payload_response(result, status, wire_format)
 
 
 @blueprint_signature.route("/verify", methods=[HTTPMethod.POST])
+@limit_request(first_byte=b"{", error="Invalid JSON payload")
 def verify():
     """
     Verify data within payload against provided signature.
@@ -89,6 +165,18 @@ def verify():
         description: >
             Verify that the `data` object provided matches with the signature provided.
             Verification is not dependant on the order of keys within the data object.
+            Bodies can also be sent as `application/msgpack` or `application/cbor`, the signature being
+            defined over the canonical JSON form of `data` whatever the wire format.
+            With `mode=merkle`, the signature is a Merkle signature from `/sign?mode=merkle`. Either `data` is
+            the whole object, or it holds only some members, given with the signed `root` and their `proofs`.
+        parameters:
+            - in: query
+              name: mode
+              required: false
+              schema:
+                  type: string
+                  enum: [merkle]
+              description: Verify a Merkle signature, over the whole object or some of its members
         requestBody:
             required: true
             content:
@@ -101,6 +189,11 @@ def verify():
                             data:
                                 type: object
                                 additionalProperties: true
+                            root:
+                                type: string
+                            proofs:
+                                type: object
+                                additionalProperties: true
                         required:
                             - signature
                             - data
@@ -133,19 +226,406 @@ def verify():
         tags:
             - signature
     """
-    payload = request.get_json()
+    metrics.observe_size(MetricNames.payload_bytes, request.content_length, route="verify")
+    mode = request.args.get("mode")
+    handler = get_registry().signature
+    # Bodies identical to an already verified one are answered before parsing, see SignatureHandler.verified_key
+    verified_key = None
+    if mode is None:
+        with metrics.timer(MetricNames.stage_seconds, route="verify", stage="index"):
+            verified_key = handler.verified_key(request.get_data(cache=True), request.mimetype)
+            verified = handler.is_verified(verified_key)
+        if verified:
+            wire_format = get_response_format(get_wire_format(request.mimetype))
+            return make_payload_response("", HTTPStatus.NO_CONTENT, wire_format)
+
+    with metrics.timer(MetricNames.stage_seconds, route="verify", stage="parse"):
+        payload, request_format = get_payload()
+    wire_format = get_response_format(request_format)
 
     # Validate that signature and data are present in payload. With more time we'd use a schema validation decorator
     if not isinstance(payload, dict):
-        return {"error": "Invalid JSON payload"}, HTTPStatus.BAD_REQUEST
+        metrics.increment(MetricNames.errors_total, route="verify", cause="invalid_input")
+        return make_payload_response({"error": "Invalid JSON payload"}, HTTPStatus.BAD_REQUEST, wire_format)
     elif SignatureFields.signature not in payload or SignatureFields.data not in payload:
-        return {"error": "Missing signature or data in payload"}, HTTPStatus.BAD_REQUEST
+        metrics.increment(MetricNames.errors_total, route="verify", cause="missing_fields")
+        error = {"error": "Missing signature or data in payload"}
+        return make_payload_response(error, HTTPStatus.BAD_REQUEST, wire_format)
+
+    if mode not in (None, MERKLE_MODE):
+        metrics.increment(MetricNames.errors_total, route="verify", cause="invalid_input")
+        return make_payload_response({"error": f"Unknown mode {mode!r}"}, HTTPStatus.BAD_REQUEST, wire_format)
 
     logger = getLogger(__name__)
-    handler = SignatureHandler(signer=HMACSigner())
     try:
-        result, status = handler.verify_payload(payload)
+        with metrics.timer(MetricNames.stage_seconds, route="verify", stage="hmac"):
+            if mode == MERKLE_MODE:
+                result, status = handler.verify_merkle(payload)
+            else:
+                result, status = handler.verify_payload(payload, size_hint=request.content_length,
+                                                        verified_key=verified_key)
+    except TypeError as e:
+        logger.error("Payload is not JSON serializable: %s", repr(e))
+        metrics.increment(MetricNames.errors_total, route="verify", cause="invalid_input")
+        result, status = {"error": "Payload is not JSON serializable"}, HTTPStatus.BAD_REQUEST
     except Exception as e:
         logger.error("Error when verifying payload: %s", repr(e))
+        metrics.increment(MetricNames.errors_total, route="verify", cause="exception")
         result, status = {"error": "Unable to verify payload"}, HTTPStatus.INTERNAL_SERVER_ERROR
-    return result, status
+    return make_payload_response(result, status, wire_format)
+
+
+@blueprint_signature.route("/sign/update", methods=[HTTPMethod.POST])
+@limit_request(first_byte=b"{", error="Invalid JSON payload")
+def sign_update():
+    """
+    Re-sign a Merkle-signed object after changing one of its members.
+
+    ---
+    post:
+        summary: Update one member of a Merkle-signed object
+        description: >
+            The previous value of the member is verified against the signed `root` with its proof, as
+            `/verify?mode=merkle` does, then the new root is computed from the new value with the same proof and
+            signed. Only the changed member is sent, whatever the size of the object. The proof of the changed
+            member stays valid, the proofs of the other members change and must be computed again.
+        requestBody:
+            required: true
+            content:
+                application/json:
+                    schema:
+                        type: object
+                        properties:
+                            signature:
+                                type: string
+                            root:
+                                type: string
+                            proofs:
+                                type: object
+                                additionalProperties: true
+                            data:
+                                type: object
+                                description: The member to change, with its previous value
+                            update:
+                                type: object
+                                description: The member to change, with its new value
+                        required:
+                            - signature
+                            - root
+                            - proofs
+                            - data
+                            - update
+                    example:
+                        signature: 8e11628db50eae6b5bf482d2afb3eaac46eb832ff28b45b2f2b30c1cdcecafaa
+                        root: 3f5c1e0b9b2d7a4c8e6f1a2b3c4d5e6f708192a3b4c5d6e7f8091a2b3c4d5e6f
+                        proofs:
+                            age:
+                                - side: right
+                                  hash: 9a8b7c6d5e4f3a2b1c0d9e8f7a6b5c4d3e2f1a0b9c8d7e6f5a4b3c2d1e0f9a8b
+                        data:
+                            age: 32
+                        update:
+                            age: 33
+        responses:
+            200:
+                description: Successfully signed the updated object
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                signature:
+                                    type: string
+                                root:
+                                    type: string
+                                proofs:
+                                    type: object
+            400:
+                description: Invalid payload, signature or proof
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                error:
+                                    type: string
+            500:
+                description: Unable to sign message
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                error:
+                                    type: string
+        tags:
+            - signature
+    """
+    with metrics.timer(MetricNames.stage_seconds, route="sign", stage="parse"):
+        payload, request_format = get_payload()
+    wire_format = get_response_format(request_format)
+    metrics.observe_size(MetricNames.payload_bytes, request.content_length, route="sign")
+
+    if not isinstance(payload, dict):
+        metrics.increment(MetricNames.errors_total, route="sign", cause="invalid_input")
+        return make_payload_response({"error": "Invalid JSON payload"}, HTTPStatus.BAD_REQUEST, wire_format)
+    elif any(field not in payload for field in (SignatureFields.signature, SignatureFields.data,
+                                                SignatureFields.root, SignatureFields.proofs)):
+        metrics.increment(MetricNames.errors_total, route="sign", cause="missing_fields")
+        error = {"error": "Missing signature, root, proofs or data in payload"}
+        return make_payload_response(error, HTTPStatus.BAD_REQUEST, wire_format)
+
+    logger = getLogger(__name__)
+    handler = get_registry().signature
+    try:
+        with metrics.timer(MetricNames.stage_seconds, route="sign", stage="hmac"):
+            result, status = handler.update_merkle(payload)
+    except TypeError as e:
+        logger.error("Payload is not JSON serializable: %s", repr(e))
+        metrics.increment(MetricNames.errors_total, route="sign", cause="invalid_input")
+        result, status = {"error": "Payload is not JSON serializable"}, HTTPStatus.BAD_REQUEST
+    except Exception as e:
+        logger.error("Error when updating payload: %s", repr(e))
+        metrics.increment(MetricNames.errors_total, route="sign", cause="exception")
+        result, status = {"error": "Unable to sign payload"}, HTTPStatus.INTERNAL_SERVER_ERROR
+    return make_payload_response(result, status, wire_format)
+
+
+@blueprint_signature.route("/sign/batch", methods=[HTTPMethod.POST])
+@limit_request(first_byte=b"[", error="Input is not a valid JSON array")
+def sign_batch():
+    """
+    Generate signatures for each JSON value in the received array.
+
+    ---
+    post:
+        summary: Generate signatures for several JSON values at once
+        description: >
+            Each item of the array is signed independently, as `/sign` would. The response holds one
+            result per item, in the same order, with its own status code.
+        requestBody:
+            required: true
+            content:
+                application/json:
+                    schema:
+                        type: array
+                        items: {}
+                    example:
+                        - name: Alice
+                          age: 32
+                        - name: Bob
+        responses:
+            200:
+                description: Batch processed, see each item status
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                results:
+                                    type: array
+                                    items:
+                                        type: object
+                                        properties:
+                                            status:
+                                                type: integer
+                                            body:
+                                                type: object
+                        example:
+                            results:
+                                - status: 200
+                                  body:
+                                      signature: a1b2c3d4e5f6g7h8i9j0
+                                - status: 200
+                                  body:
+                                      signature: 0j9i8h7g6f5e4d3c2b1a
+            400:
+                description: Invalid input payload (payload is not a JSON array)
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                error:
+                                    type: string
+            413:
+                description: Too many items in the batch
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                error:
+                                    type: string
+        tags:
+            - signature
+    """
+    payload = request.get_json()
+    error = validate_batch(payload)
+    if error:
+        return error
+
+    handler = get_registry().signature
+    return process_batch(payload, partial(sign_item, handler), "Unable to sign payload")
+
+
+@blueprint_signature.route("/verify/batch", methods=[HTTPMethod.POST])
+@limit_request(first_byte=b"[", error="Input is not a valid JSON array")
+def verify_batch():
+    """
+    Verify data against signature for each item in the received array.
+
+    ---
+    post:
+        summary: Verify signatures for several JSON objects at once
+        description: >
+            Each item of the array is verified independently, as `/verify` would. The response holds one
+            result per item, in the same order, with its own status code (204 for a valid signature).
+        requestBody:
+            required: true
+            content:
+                application/json:
+                    schema:
+                        type: array
+                        items:
+                            type: object
+                            properties:
+                                signature:
+                                    type: string
+                                data:
+                                    type: object
+                                    additionalProperties: true
+                            required:
+                                - signature
+                                - data
+                    example:
+                        - signature: 8e11628db50eae6b5bf482d2afb3eaac46eb832ff28b45b2f2b30c1cdcecafaa
+                          data:
+                              name: Alice
+                              age: 32
+        responses:
+            200:
+                description: Batch processed, see each item status
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                results:
+                                    type: array
+                                    items:
+                                        type: object
+                                        properties:
+                                            status:
+                                                type: integer
+                                            body: {}
+                        example:
+                            results:
+                                - status: 204
+                                  body: ""
+            400:
+                description: Invalid input payload (payload is not a JSON array)
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                error:
+                                    type: string
+            413:
+                description: Too many items in the batch
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                error:
+                                    type: string
+        tags:
+            - signature
+    """
+    payload = request.get_json()
+    error = validate_batch(payload)
+    if error:
+        return error
+
+    handler = get_registry().signature
+    return process_batch(payload, partial(verify_item, handler), "Unable to verify payload")
+
+
+@blueprint_signature.route("/sign/stream", methods=[HTTPMethod.POST])
+@limit_request(max_length=STREAM_MAX_CONTENT_LENGTH)
+def sign_stream():
+    """
+    Generate signatures for each JSON value of a NDJSON stream.
+
+    ---
+    post:
+        summary: Generate signatures for newline-delimited JSON values
+        description: >
+            The body is read one line at a time and each record is signed as `/sign` would.
+            Results are streamed back as NDJSON, one `{status, body}` line per record and in the same order,
+            so memory usage does not depend on the body size.
+        requestBody:
+            required: true
+            content:
+                application/x-ndjson:
+                    schema:
+                        type: string
+                    example: |
+                        {"name": "Alice", "age": 32}
+                        {"name": "Bob"}
+        responses:
+            200:
+                description: Stream processed, see each line status
+                content:
+                    application/x-ndjson:
+                        schema:
+                            type: string
+                        example: |
+                            {"status":200,"body":{"signature":"a1b2c3d4e5f6g7h8i9j0"}}
+                            {"status":200,"body":{"signature":"0j9i8h7g6f5e4d3c2b1a"}}
+        tags:
+            - signature
+    """
+    handler = get_registry().signature
+    results = process_stream(iter_lines(request.stream), partial(sign_item, handler), "Unable to sign payload")
+    return Response(stream_with_context(results), mimetype=NDJSON_MIMETYPE)
+
+
+@blueprint_signature.route("/verify/stream", methods=[HTTPMethod.POST])
+@limit_request(max_length=STREAM_MAX_CONTENT_LENGTH)
+def verify_stream():
+    """
+    Verify data against signature for each record of a NDJSON stream.
+
+    ---
+    post:
+        summary: Verify signatures for newline-delimited JSON objects
+        description: >
+            The body is read one line at a time and each record is verified as `/verify` would.
+            Results are streamed back as NDJSON, one `{status, body}` line per record and in the same order,
+            so memory usage does not depend on the body size.
+        requestBody:
+            required: true
+            content:
+                application/x-ndjson:
+                    schema:
+                        type: string
+                    example: |
+                        {"signature": "8e11628db50eae6b5bf482d2afb3eaac", "data": {"age": 32}}
+        responses:
+            200:
+                description: Stream processed, see each line status
+                content:
+                    application/x-ndjson:
+                        schema:
+                            type: string
+                        example: |
+                            {"status":400,"body":{"error":"Invalid signature or data"}}
+        tags:
+            - signature
+    """
+    handler = get_registry().signature
+    results = process_stream(iter_lines(request.stream), partial(verify_item, handler), "Unable to verify payload")
+    return Response(stream_with_context(results), mimetype=NDJSON_MIMETYPE)
@@ -1,9 +1,15 @@
 from archivist import LoggerBuilder
-from flask import Flask, jsonify, redirect
-
-from api.config.apispec import spec
-from api.config.settings import API_URL, SWAGGER_URL, ROOT_URL
+import click
+from flask import Flask, redirect, request
+
+from api.config.apispec import FINGERPRINT_KEY, build_spec, spec_fingerprint, write_spec
+from api.config.json_provider import CodecJSONProvider
+from api.config.settings import API_SPEC_FILE, API_URL, COMPRESSION_ENABLED, SWAGGER_URL, ROOT_URL
+from api.controllers.openapi import OpenAPIDocument
+from api.controllers.registry import HandlerRegistry
+from api.helpers.compression import CompressionMiddleware
 from api.services.encryption import blueprint_encryption
+from api.services.metrics import blueprint_metrics
 from api.services.signature import blueprint_signature
 from api.services.swagger import swagger_ui_blueprint
 
@@ -12,23 +18,31 @@ logger = LoggerBuilder().build()
 logger.debug("Start API Service")
 
 app = Flask(__name__)
+app.json = CodecJSONProvider(app)
+HandlerRegistry().init_app(app)
 app.register_blueprint(blueprint_encryption, url_prefix=ROOT_URL)
 app.register_blueprint(blueprint_signature, url_prefix=ROOT_URL)
+app.register_blueprint(blueprint_metrics, url_prefix=ROOT_URL)
+if COMPRESSION_ENABLED:
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app)
 
-
-with app.test_request_context():
-    for fn_name, fn_view in app.view_functions.items():
-        if fn_name == "static":
-            continue
-        logger.debug(f"Loading swagger docs for {fn_name}")
-        spec.path(view=fn_view)
-        logger.debug(f"Loaded swagger docs for {fn_name}")
+# The spec is read from the artifact written by `flask build-spec`, on first request, unless built from other sources
+openapi_document = OpenAPIDocument(API_SPEC_FILE, build=lambda: build_spec(app),
+                                   fingerprint=lambda: spec_fingerprint(app), fingerprint_key=FINGERPRINT_KEY)
 
 
 @app.route(API_URL)
 def swagger():
     """Swagger API definition."""
-    return jsonify(spec.to_dict())
+    return openapi_document.response(request)
+
+
+@app.cli.command("build-spec")
+@click.option("--output", default=API_SPEC_FILE, show_default=True, help="Path of the JSON artifact")
+def build_spec_command(output: str):
+    """Build the OpenAPI document from the views docstrings and write it as a JSON artifact."""
+    write_spec(app, output)
+    click.echo(f"OpenAPI document written to {output}")
 
 
 app.register_blueprint(swagger_ui_blueprint, url_prefix=SWAGGER_URL)
@@ -0,0 +1,102 @@
+"""ASGI entry point, serving the same application as ``app.py``.
+
+Run it with any ASGI server, for instance ``uvicorn asgi:app``.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from api.config.settings import ASGI_WORKER_THREADS
+from app import app as wsgi_app
+
+
+class ExecutorWsgiToAsgiInstance(WsgiToAsgiInstance):
+    """Per-request instance running the WSGI application in a thread pool.
+
+    The request body is read asynchronously by the parent class, so slow clients only hold a coroutine. The WSGI
+    application, where crypter and signer work happens, then runs in ``executor``. The parent implementation runs
+    every request in a single shared thread, which would serialize them.
+
+    :param wsgi_application: The WSGI application to run
+    :param ThreadPoolExecutor executor: The executor running the WSGI application
+    """
+
+    def __init__(self, wsgi_application, executor: ThreadPoolExecutor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        """Run the WSGI application in the executor."""
+        await sync_to_async(self.run_wsgi_app_sync, thread_sensitive=False, executor=self.executor)(body)
+
+    def run_wsgi_app_sync(self, body):
+        """Run the WSGI application and send its response, in the executor thread.
+
+        ``start_response`` is called in this same thread, as the WSGI application runs.
+
+        :param body: The request body, read by the parent class
+        """
+        try:
+            environ = self.build_environ(self.scope, body)
+        except ValueError:
+            # Too many duplicate headers
+            self.sync_send({"type": "http.response.start", "status": 400,
+                            "headers": [(b"content-type", b"text/plain")]})
+            self.sync_send({"type": "http.response.body", "body": b"Bad Request: Too many duplicate headers"})
+            return
+
+        output = self.wsgi_application(environ, self.start_response)
+        try:
+            sent = 0
+            for chunk in output:
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                # Never send more than the Content-Length announced by the application
+                if self.response_content_length is not None:
+                    chunk = chunk[:self.response_content_length - sent]
+                self.sync_send({"type": "http.response.body", "body": chunk, "more_body": True})
+                sent += len(chunk)
+                if sent == self.response_content_length:
+                    break
+        finally:
+            if hasattr(output, "close"):
+                output.close()
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        self.sync_send({"type": "http.response.body"})
+
+
+class ExecutorWsgiToAsgi(WsgiToAsgi):
+    """Wrap a WSGI application into an ASGI application running requests in a thread pool.
+
+    :param wsgi_application: The WSGI application to wrap
+    :param int max_workers: Number of threads running the WSGI application
+    """
+
+    def __init__(self, wsgi_application, max_workers: int = ASGI_WORKER_THREADS):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="asgi-worker")
+
+    async def __call__(self, scope, receive, send):
+        """ASGI application entry point."""
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        await ExecutorWsgiToAsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        """Handle the lifespan protocol, shutting the executor down with the server."""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+app = ExecutorWsgiToAsgi(wsgi_app)
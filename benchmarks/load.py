@@ -0,0 +1,161 @@
+"""Load generator replaying a JSONL corpus against the API, reporting latency percentiles and throughput.
+
+Each line of the corpus is sent as payload to ``/encrypt`` and ``/sign``. Their outputs are then replayed to
+``/decrypt`` and ``/verify``. By default the application is started locally in a background thread, use ``--url`` to
+target a server started separately (gunicorn, uvicorn...).
+
+Run with ``python -m benchmarks.load requests.jsonl``, see ``--help`` for options.
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+import json
+from logging import WARNING, getLogger
+import statistics
+from threading import Thread, local
+from time import perf_counter
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit
+
+from benchmarks.results import save_results
+
+
+ROUTES = ("/api/encrypt", "/api/decrypt", "/api/sign", "/api/verify")
+
+
+class Client:
+    """HTTP client keeping one keep-alive connection per thread."""
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self._local = local()
+
+    def post(self, path: str, body: bytes) -> Tuple[int, bytes, float]:
+        """Post a JSON body and return the status, the response body and the latency in seconds."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = HTTPConnection(self.host, self.port, timeout=60)
+        start = perf_counter()
+        try:
+            connection.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            content = response.read()
+        except OSError:
+            connection.close()
+            self._local.connection = None
+            return 0, b"", perf_counter() - start
+        return response.status, content, perf_counter() - start
+
+
+def start_local_server() -> str:
+    """Start the application in a background thread and return its URL."""
+    from werkzeug.serving import make_server
+
+    from app import app
+
+    # Access logs would dominate the measures
+    getLogger("werkzeug").setLevel(WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def read_corpus(path: str, limit: int) -> List[dict]:
+    """Read up to ``limit`` JSON objects from a JSONL file, skipping blank lines and non-objects."""
+    corpus = []
+    with open(path, "rb") as corpus_file:
+        for line in corpus_file:
+            if line.strip():
+                record = json.loads(line)
+                if isinstance(record, dict):
+                    corpus.append(record)
+            if len(corpus) >= limit:
+                break
+    return corpus
+
+
+def build_requests(client: Client, corpus: List[dict]) -> List[Tuple[str, bytes]]:
+    """Build the (route, body) pairs to replay.
+
+    ``/encrypt`` and ``/sign`` are called once per record, to get valid inputs for ``/decrypt`` and ``/verify``.
+    """
+    requests = []
+    for record in corpus:
+        body = json.dumps(record).encode("utf-8")
+        _, encrypted, _ = client.post("/api/encrypt", body)
+        _, signed, _ = client.post("/api/sign", body)
+        signature = json.loads(signed)["signature"]
+        requests.extend([
+            ("/api/encrypt", body),
+            ("/api/decrypt", encrypted),
+            ("/api/sign", body),
+            ("/api/verify", json.dumps({"data": record, "signature": signature}).encode("utf-8"))
+        ])
+    return requests
+
+
+def summarize(latencies: List[float], errors: int, duration: float) -> Dict[str, float]:
+    """Compute percentiles in milliseconds and throughput for a list of latencies."""
+    if len(latencies) < 2:
+        return {"requests": len(latencies), "errors": errors}
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": percentiles[49] * 1000,
+        "p95_ms": percentiles[94] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "req_per_s": len(latencies) / duration
+    }
+
+
+def run(client: Client, requests: List[Tuple[str, bytes]], total: int, concurrency: int) -> dict:
+    """Replay ``total`` requests, cycling through ``requests``, with ``concurrency`` parallel clients."""
+    def send(index: int) -> Tuple[str, int, float]:
+        route, body = requests[index % len(requests)]
+        status, _, latency = client.post(route, body)
+        return route, status, latency
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(send, range(total)))
+    duration = perf_counter() - start
+
+    results = {}
+    for route in ("all",) + ROUTES:
+        selected = [outcome for outcome in outcomes if route in ("all", outcome[0])]
+        latencies = [latency for _, _, latency in selected]
+        errors = sum(1 for _, status, _ in selected if status == 0 or status >= 500)
+        results[route] = summarize(latencies, errors, duration)
+    results["all"]["concurrency"] = concurrency
+    results["all"]["duration_s"] = duration
+    return results
+
+
+def main():
+    """Parse the command line and run the load test."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("corpus", help="Path of a JSONL file, one JSON object per line")
+    parser.add_argument("--url", help="Base URL of a running server, the app is started locally if not given")
+    parser.add_argument("--requests", type=int, default=2000, help="Total number of requests to send")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of parallel clients")
+    parser.add_argument("--records", type=int, default=100, help="Maximum number of corpus records to use")
+    parser.add_argument("--output", help="Path of the JSON results file")
+    args = parser.parse_args()
+
+    client = Client(args.url or start_local_server())
+    requests = build_requests(client, read_corpus(args.corpus, args.records))
+    results = run(client, requests, args.requests, args.concurrency)
+    for route, summary in results.items():
+        if "p50_ms" in summary:
+            print(f"{route:<14} {summary['requests']:>7} req {summary['errors']:>4} errors  "
+                  f"p50={summary['p50_ms']:.2f}ms p95={summary['p95_ms']:.2f}ms p99={summary['p99_ms']:.2f}ms "
+                  f"{summary['req_per_s']:.0f} req/s")
+    print(f"Results saved to {save_results('load', results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
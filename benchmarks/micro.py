@@ -0,0 +1,117 @@
+"""Micro-benchmarks of the crypter, signer and handlers across payload sizes and nesting depths.
+
+Run with ``python -m benchmarks.micro``, see ``--help`` for options.
+"""
+from argparse import ArgumentParser
+import os
+import statistics
+from timeit import Timer
+from typing import Callable, Dict, List
+
+from api.controllers.encryption import EncryptionHandler
+from api.controllers.signature import SignatureHandler
+from api.helpers.crypters import AEADCrypter, AESGCM, Base64Crypter
+from api.helpers.signer import HMACSigner
+from benchmarks.results import save_results
+
+
+def make_payload(size: int, depth: int, width: int = 16) -> dict:
+    """Build a JSON object of roughly ``size`` bytes, with ``width`` keys per level and ``depth`` levels.
+
+    :param int size: Approximate serialized size in bytes
+    :param int depth: Nesting depth of the leaves, 1 for a flat object
+    :param int width: Number of keys of each object
+    """
+    leaves = width ** depth if depth < 4 else width * depth
+    value = "x" * max(1, size // max(1, leaves))
+
+    def build(level: int) -> dict:
+        if level == depth:
+            return {f"key{i}": value for i in range(width)}
+        # Past a few levels, only the first key goes deeper, to keep the payload size bounded
+        children = width if depth < 4 else 1
+        node = {f"key{i}": build(level + 1) for i in range(children)}
+        node.update({f"leaf{i}": value for i in range(width - children)})
+        return node
+
+    return build(1)
+
+
+def measure(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """Time ``fn`` and return the best and median time per call, in seconds.
+
+    :param fn: The callable to benchmark
+    :param int repeat: Number of timing rounds
+    """
+    timer = Timer(fn)
+    number, _ = timer.autorange()
+    timings = [timing / number for timing in timer.repeat(repeat=repeat, number=number)]
+    return {"best": min(timings), "median": statistics.median(timings), "calls_per_round": number}
+
+
+def run(sizes: List[int], depths: List[int], repeat: int) -> List[dict]:
+    """Run every micro-benchmark for each payload size and depth."""
+    crypter = Base64Crypter()
+    signer = HMACSigner(secret="benchmark")
+    encryption_handler = EncryptionHandler(crypter=crypter)
+    # Authenticated encryption is benchmarked against the base64 path when cryptography is installed
+    aead_crypter = AEADCrypter(key=os.urandom(AEADCrypter.KEY_SIZE), key_id="benchmark") if AESGCM else None
+    signature_handler = SignatureHandler(signer=signer)
+
+    results = []
+    for size in sizes:
+        for depth in depths:
+            payload = make_payload(size, depth)
+            canonical = signature_handler.canonicalise(payload)
+            encrypted, _ = encryption_handler.encrypt_payload(payload)
+            ciphertext = crypter.encrypt(payload)
+            cases = {
+                "Base64Crypter.encrypt": lambda: crypter.encrypt(payload),
+                "Base64Crypter.decrypt": lambda: crypter.decrypt(ciphertext),
+                "HMACSigner.signature": lambda: signer.signature(canonical),
+                "SignatureHandler.canonicalise": lambda: signature_handler.canonicalise(payload),
+                "SignatureHandler.generate_signature": lambda: signature_handler.generate_signature(payload),
+                "EncryptionHandler.encrypt_payload": lambda: encryption_handler.encrypt_payload(payload),
+                "EncryptionHandler.decrypt_payload": lambda: encryption_handler.decrypt_payload(encrypted)
+            }
+            if aead_crypter is not None:
+                aead_ciphertext = aead_crypter.encrypt(payload)
+                cases["AEADCrypter.encrypt"] = lambda: aead_crypter.encrypt(payload)
+                cases["AEADCrypter.decrypt"] = lambda: aead_crypter.decrypt(aead_ciphertext)
+            for name, fn in cases.items():
+                timing = measure(fn, repeat)
+                result = {
+                    "case": name,
+                    "size": size,
+                    "depth": depth,
+                    "canonical_bytes": len(canonical.encode("utf-8")),
+                    **timing,
+                    "mb_per_s": len(canonical.encode("utf-8")) / timing["best"] / 1e6
+                }
+                results.append(result)
+                print(f"{name:<40} size={size:<9} depth={depth:<3} best={timing['best'] * 1e6:>12.1f}us "
+                      f"{result['mb_per_s']:>9.1f}MB/s")
+    return results
+
+
+def parse_list(value: str) -> List[int]:
+    """Parse a comma-separated list of integers."""
+    return [int(item) for item in value.split(",")]
+
+
+def main():
+    """Parse the command line and run the micro-benchmarks."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=parse_list, default=[1024, 64 * 1024, 1024 * 1024],
+                        help="Comma-separated payload sizes in bytes")
+    parser.add_argument("--depths", type=parse_list, default=[1, 2, 8], help="Comma-separated nesting depths")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timing rounds per case")
+    parser.add_argument("--output", help="Path of the JSON results file")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.depths, args.repeat)
+    print(f"Results saved to {save_results('micro', results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
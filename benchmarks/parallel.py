@@ -0,0 +1,80 @@
+"""Crossover benchmark of parallel per-field encryption against the sequential loop, across payload sizes.
+
+Run with ``python -m benchmarks.parallel``, see ``--help`` for options.
+"""
+from argparse import ArgumentParser
+import json
+from typing import List
+
+from api.controllers.encryption import EncryptionHandler
+from api.helpers.crypters import Base64Crypter
+from api.helpers.offload import ProcessOffloader
+from benchmarks.micro import measure, parse_list
+from benchmarks.results import save_results
+
+
+def make_wide_payload(keys: int, value_size: int) -> dict:
+    """Build a flat JSON object of ``keys`` items, whose values are objects of about ``value_size`` bytes.
+
+    :param int keys: Number of first-level keys
+    :param int value_size: Approximate serialized size of each value in bytes
+    """
+    return {f"field{index}": {"id": index, "text": "x" * value_size} for index in range(keys)}
+
+
+def run(keys: List[int], value_sizes: List[int], workers: int, repeat: int) -> List[dict]:
+    """Time sequential and parallel encryption and decryption for each payload shape."""
+    offloader = ProcessOffloader(threshold=0, max_workers=workers)
+    # A threshold of 1 byte sends every payload to the parallel path, the size hint decides
+    handler = EncryptionHandler(crypter=Base64Crypter(), offloader=offloader, parallel_threshold=1)
+
+    results = []
+    try:
+        # Start the pool before timing, its startup is paid once per process
+        offloader.run_chunks(len, [[0]] * workers)
+        for count in keys:
+            for value_size in value_sizes:
+                payload = make_wide_payload(count, value_size)
+                size = len(json.dumps(payload))
+                encrypted, _ = handler.encrypt_payload(payload)
+                timings = {
+                    "encrypt_sequential": measure(lambda: handler.encrypt_payload(payload), repeat),
+                    "encrypt_parallel": measure(lambda: handler.encrypt_payload(payload, size_hint=size), repeat),
+                    "decrypt_sequential": measure(lambda: handler.decrypt_payload(encrypted), repeat),
+                    "decrypt_parallel": measure(lambda: handler.decrypt_payload(encrypted, size_hint=size), repeat),
+                }
+                result = {"keys": count, "value_size": value_size, "size": size, "workers": workers}
+                for operation in ("encrypt", "decrypt"):
+                    sequential = timings[f"{operation}_sequential"]["best"]
+                    parallel = timings[f"{operation}_parallel"]["best"]
+                    result[f"{operation}_sequential"] = sequential
+                    result[f"{operation}_parallel"] = parallel
+                    result[f"{operation}_speedup"] = sequential / parallel
+                results.append(result)
+                print(f"keys={count:<6} value={value_size:<7} size={size:<10} "
+                      f"encrypt x{result['encrypt_speedup']:<6.2f} decrypt x{result['decrypt_speedup']:<6.2f}")
+    finally:
+        offloader.shutdown()
+
+    crossover = [result["size"] for result in results if min(result["encrypt_speedup"], result["decrypt_speedup"]) > 1]
+    print(f"Parallel is faster from {min(crossover)} bytes" if crossover else "Parallel is never faster")
+    return results
+
+
+def main():
+    """Parse the command line and run the crossover benchmark."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--keys", type=parse_list, default=[100, 1000, 5000], help="Comma-separated numbers of keys")
+    parser.add_argument("--value-sizes", type=parse_list, default=[64, 1024, 16 * 1024],
+                        help="Comma-separated sizes of each value in bytes")
+    parser.add_argument("--workers", type=int, default=4, help="Number of processes of the pool")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timing rounds per case")
+    parser.add_argument("--output", help="Path of the JSON results file")
+    args = parser.parse_args()
+
+    results = run(args.keys, args.value_sizes, args.workers, args.repeat)
+    print(f"Results saved to {save_results('parallel', results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
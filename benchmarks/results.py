@@ -0,0 +1,41 @@
+"""Save benchmark results as JSON, with enough context to compare commits."""
+from datetime import datetime, timezone
+import json
+from pathlib import Path
+import platform
+import subprocess
+from typing import Optional
+
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def current_commit() -> str:
+    """Return the short hash of the checked out commit, or ``unknown`` outside of a git repository."""
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return output.stdout.strip()
+
+
+def save_results(name: str, results: dict, output: Optional[str] = None) -> Path:
+    """Write results to a JSON file and return its path.
+
+    :param str name: Name of the benchmark, used in the default file name
+    :param dict results: The measures to save
+    :param str output: Path of the output file, defaults to ``benchmarks/results/<name>-<commit>.json``
+    """
+    commit = current_commit()
+    path = Path(output) if output else RESULTS_DIR / f"{name}-{commit}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    document = {
+        "benchmark": name,
+        "commit": commit,
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results
+    }
+    path.write_text(json.dumps(document, indent=2))
+    return path
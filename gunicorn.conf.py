@@ -0,0 +1,82 @@
+"""gunicorn configuration of the production deployment, read by ``gunicorn --config gunicorn.conf.py``.
+
+The application is preloaded: it is imported, its handlers built and its OpenAPI document loaded once in the master
+process, before workers are forked and share those pages copy-on-write. Worker and thread counts are derived from the
+CPUs available to the process, according to ``GUNICORN_PROFILE``:
+
+* ``single``, the default, one single-threaded sync worker, as served before this configuration existed. It had the
+  best throughput of the load suite, see the README, and is kept until the other profiles are measured on the target
+  machine
+* ``sync``, ``2 * CPUs + 1`` single-threaded workers. Each worker serves one request at a time, so it must sit behind
+  a buffering proxy that shields it from slow clients
+* ``gthread``, one worker per CPU with 4 threads each. The encryption and signature work holds the GIL,
+  processes give the parallelism, and threads overlap the network I/O of keep-alive and slow clients
+* ``async``, one uvicorn worker per CPU serving ``asgi:app``. Request bodies are read by the event loop, the
+  application runs in a pool of ``ASGI_WORKER_THREADS`` threads
+
+``GUNICORN_WORKERS`` and ``GUNICORN_THREADS`` override the derived counts.
+"""
+import logging
+import os
+
+from api.config.settings import GUNICORN_PROFILE, GUNICORN_THREADS, GUNICORN_WORKERS
+
+PROFILES = ("single", "sync", "gthread", "async")
+if GUNICORN_PROFILE not in PROFILES:
+    raise ValueError(f"Unknown GUNICORN_PROFILE {GUNICORN_PROFILE!r}, use one of {', '.join(PROFILES)}")
+
+# CPUs the process may run on, which is less than the machine CPUs with affinity restrictions
+cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+preload_app = True
+wsgi_app = "app:app"
+
+if GUNICORN_PROFILE == "single":
+    worker_class = "sync"
+    workers = GUNICORN_WORKERS or 1
+elif GUNICORN_PROFILE == "sync":
+    worker_class = "sync"
+    workers = GUNICORN_WORKERS or 2 * cpus + 1
+elif GUNICORN_PROFILE == "gthread":
+    worker_class = "gthread"
+    workers = GUNICORN_WORKERS or cpus
+    threads = GUNICORN_THREADS or 4
+else:
+    wsgi_app = "asgi:app"
+    worker_class = "uvicorn_worker.UvicornWorker"
+    workers = GUNICORN_WORKERS or cpus
+
+# Load balancers keep connections open longer than the 2 seconds default
+keepalive = 5
+
+
+def on_starting(server):
+    """Undo the side effects of preloading the application, before any worker starts.
+
+    The logging configuration of the application disables the loggers existing when it is imported, gunicorn's among
+    them, which would silence the master and the workers. Metrics snapshots left by the workers of a previous run are
+    removed.
+    """
+    from api.helpers.metrics import metrics
+
+    for name in ("gunicorn.error", "gunicorn.access"):
+        logging.getLogger(name).disabled = False
+    metrics.clear_snapshots()
+
+
+def child_exit(server, worker):
+    """Remove the metrics snapshot of an exited worker, so that its replacement is not summed with it."""
+    from api.helpers.metrics import metrics
+
+    metrics.remove_snapshot(worker.pid)
+
+
+def when_ready(server):
+    """Load the OpenAPI document in the master process, so that forked workers share it instead of loading it."""
+    if server.cfg.preload_app:
+        from app import openapi_document
+
+        # Reading the body loads it once
+        openapi_document.body
+    server.log.info("Serving with the %s profile: %s workers of %s", GUNICORN_PROFILE, workers, worker_class)
@@ -0,0 +1,136 @@
+"""Clients posting requests to the application through each serving mode, for the functional tests."""
+import asyncio
+import gzip
+import json as jsonlib
+from typing import Optional
+from unittest import TestCase, skipUnless
+
+from flask import Flask, Response
+
+from app import app
+from api.helpers.compression import ENCODINGS
+
+try:
+    from asgi import ExecutorWsgiToAsgi, app as asgi_app
+except ImportError:
+    ExecutorWsgiToAsgi = asgi_app = None
+
+
+class WSGIClient:
+    """Post requests to a Flask application with its test client, as a WSGI server would.
+
+    :param Flask application: The application, defaults to the one of ``app.py``
+    """
+    mode = "WSGI"
+    available = True
+
+    def __init__(self, application: Optional[Flask] = None):
+        self.client = (application or app).test_client()
+
+    def post(self, path: str, json=None, data=None, content_type: Optional[str] = None,
+             headers: Optional[dict] = None) -> Response:
+        """Post a request, with ``json`` serialized as body or raw ``data``, and return the response."""
+        return self.client.post(path, json=json, data=data, content_type=content_type, headers=headers)
+
+    def close(self):
+        """Release the resources of the client."""
+
+
+class CompressedWSGIClient(WSGIClient):
+    """Post zstd-compressed requests asking for gzip-compressed responses, decompressed before they are returned."""
+    mode = "CompressedWSGI"
+    available = ENCODINGS["zstd"].available
+
+    def post(self, path: str, json=None, data=None, content_type: Optional[str] = None,
+             headers: Optional[dict] = None) -> Response:
+        """Post a compressed request and return the response with its body decompressed."""
+        if json is not None:
+            data, content_type = jsonlib.dumps(json), "application/json"
+        data = data.encode("utf-8") if isinstance(data, str) else data or b""
+        compressor = ENCODINGS["zstd"].compressor()
+        headers = {**(headers or {}), "Content-Encoding": "zstd", "Accept-Encoding": "gzip"}
+        response = super().post(path, data=compressor.compress(data) + compressor.finish(), content_type=content_type,
+                                headers=headers)
+        if response.headers.get("Content-Encoding") == "gzip":
+            response.set_data(gzip.decompress(response.get_data()))
+            del response.headers["Content-Encoding"]
+        return response
+
+
+class ASGIClient:
+    """Post requests to the ASGI application of ``asgi.py``, sending bodies in two parts as a slow client would.
+
+    :param Flask application: The application to wrap, defaults to the one of ``app.py`` already wrapped by ``asgi.py``
+    """
+    mode = "ASGI"
+    available = asgi_app is not None
+
+    def __init__(self, application: Optional[Flask] = None):
+        self.owned = application is not None
+        self.application = ExecutorWsgiToAsgi(application, max_workers=2) if self.owned else asgi_app
+
+    def post(self, path: str, json=None, data=None, content_type: Optional[str] = None,
+             headers: Optional[dict] = None) -> Response:
+        """Post a request, with ``json`` serialized as body or raw ``data``, and return the response."""
+        if json is not None:
+            data, content_type = jsonlib.dumps(json), "application/json"
+        body = data.encode("utf-8") if isinstance(data, str) else data or b""
+        path, _, query_string = path.partition("?")
+        request_headers = [(b"content-length", str(len(body)).encode())]
+        if content_type:
+            request_headers.append((b"content-type", content_type.encode()))
+        request_headers.extend((name.lower().encode(), value.encode()) for name, value in (headers or {}).items())
+        scope = {
+            "type": "http",
+            "method": "POST",
+            "path": path,
+            "query_string": query_string.encode(),
+            "http_version": "1.1",
+            "headers": request_headers
+        }
+        received = [
+            {"type": "http.request", "body": body[:len(body) // 2], "more_body": True},
+            {"type": "http.request", "body": body[len(body) // 2:]}
+        ]
+        sent = []
+
+        async def receive():
+            return received.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.application(scope, receive, send))
+        return Response(b"".join(message.get("body", b"") for message in sent[1:]), status=sent[0]["status"],
+                        headers=[(name.decode(), value.decode()) for name, value in sent[0]["headers"]])
+
+    def close(self):
+        """Shut down the thread pool of a wrapped application."""
+        if self.owned:
+            self.application.executor.shutdown(wait=True)
+
+
+class ClientTestCase(TestCase):
+    """Test case posting its requests with ``self.client``, an instance of ``client_class``.
+
+    Subclasses run with the WSGI client, ``client_variant`` derives their variants for the other serving modes.
+    """
+    client_class = WSGIClient
+
+    def setUp(self):
+        self.client = self.client_class()
+        self.addCleanup(self.client.close)
+
+
+def client_variant(test_case: type, client_class: type) -> type:
+    """Return a subclass of ``test_case`` posting its requests with ``client_class``, skipped if it is unavailable.
+
+    Assign it to a module-level ``Test...`` name so that test runners collect it.
+
+    :param type test_case: A ``ClientTestCase`` subclass
+    :param type client_class: One of the clients of this module
+    """
+    name = f"{test_case.__name__}{client_class.mode}"
+    variant = type(name, (test_case,), {"client_class": client_class, "__module__": test_case.__module__,
+                                        "__qualname__": name})
+    return skipUnless(client_class.available, f"{client_class.mode} client is not available")(variant)
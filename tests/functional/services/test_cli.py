@@ -0,0 +1,97 @@
+import io
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from api.cli import Progress, iter_batches, main, run
+from api.config.fields import BatchFields, SignatureFields
+
+
+def to_jsonl(records: list) -> io.BytesIO:
+    return io.BytesIO("".join(json.dumps(record) + "\n" for record in records).encode())
+
+
+def from_jsonl(stream: io.BytesIO) -> list:
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+class TestCommandLine(TestCase):
+
+    def setUp(self):
+        self.records = [{"id": index, "name": f"user{index}", "tags": ["a", index]} for index in range(500)]
+
+    def run_command(self, command: str, records: list, workers: int = 1) -> list:
+        target = io.BytesIO()
+        run(command, to_jsonl(records), target, workers=workers, batch_size=1024)
+        return from_jsonl(target)
+
+    def test_decrypt_successfully_decrypts_encrypt_output_in_order(self):
+        encrypted = self.run_command("encrypt", self.records)
+        decrypted = self.run_command("decrypt", [result[BatchFields.body] for result in encrypted])
+
+        self.assertTrue(all(result[BatchFields.status] == 200 for result in encrypted + decrypted))
+        self.assertListEqual([result[BatchFields.body] for result in decrypted], self.records)
+
+    def test_verify_successfully_verifies_sign_output(self):
+        signed = self.run_command("sign", self.records)
+        payloads = [{SignatureFields.data: record, SignatureFields.signature: result[BatchFields.body]["signature"]}
+                    for record, result in zip(self.records, signed)]
+        payloads[1][SignatureFields.data] = {"tampered": True}
+
+        statuses = [result[BatchFields.status] for result in self.run_command("verify", payloads)]
+
+        self.assertListEqual(statuses[:3], [204, 400, 204])
+
+    def test_worker_processes_keep_input_order(self):
+        self.assertListEqual(self.run_command("encrypt", self.records, workers=2),
+                             self.run_command("encrypt", self.records))
+
+    def test_invalid_records_are_counted_as_failures(self):
+        source = io.BytesIO(b'{"name": "Alice"}\n\nnot json\n"not a dict"\n')
+        target = io.BytesIO()
+
+        progress = run("encrypt", source, target, workers=1, batch_size=1024)
+
+        statuses = [result[BatchFields.status] for result in from_jsonl(target)]
+        self.assertListEqual(statuses, [200, 400, 400])
+        self.assertEqual((progress.records, progress.failures), (3, 2))
+
+    def test_sign_rejects_null_records_as_sign_stream_does(self):
+        source = io.BytesIO(b'{"name": "Alice"}\nnull\n[]\n')
+        target = io.BytesIO()
+
+        progress = run("sign", source, target, workers=1, batch_size=1024)
+
+        results = from_jsonl(target)
+        self.assertListEqual([result[BatchFields.status] for result in results], [200, 400, 200])
+        self.assertDictEqual(results[1][BatchFields.body], {"error": "Invalid JSON payload"})
+        self.assertEqual((progress.records, progress.failures), (3, 1))
+
+    def test_iter_batches_groups_lines_by_size(self):
+        batches = list(iter_batches(io.BytesIO(b"a" * 99 + b"\n" + b"b\n" * 100), batch_size=150))
+
+        self.assertListEqual([size for _, size in batches], [150, 150])
+        self.assertEqual(sum(len(lines) for lines, _ in batches), 101)
+
+    def test_main_processes_files_and_reports_progress(self):
+        with TemporaryDirectory() as directory:
+            source, target = os.path.join(directory, "in.jsonl"), os.path.join(directory, "out.jsonl")
+            with open(source, "wb") as file:
+                file.write(to_jsonl(self.records[:10]).getvalue() + b"[]\n")
+
+            status = main(["encrypt", source, "-o", target, "-w", "1", "--progress-interval", "0"])
+
+            with open(target, "rb") as file:
+                results = from_jsonl(io.BytesIO(file.read()))
+        self.assertEqual(status, 1)
+        self.assertEqual(len(results), 11)
+
+    def test_progress_reports_throughput(self):
+        stream = io.StringIO()
+        progress = Progress("encrypt", stream=stream, interval=0)
+
+        progress.update(records=10, failures=1, size=2000)
+        progress.report(final=True)
+
+        self.assertIn("encrypt done: 10 records (1 failed)", stream.getvalue())
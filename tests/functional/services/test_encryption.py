@@ -1,16 +1,15 @@
-from unittest import TestCase
 from unittest.mock import patch
-from http import HTTPMethod, HTTPStatus
-from flask import Flask
+from http import HTTPStatus
+import json
 
+from api.config.fields import BatchFields
+from api.config.settings import NDJSON_MIMETYPE
 from api.controllers.encryption import EncryptionHandler
-from api.services.encryption import encrypt, decrypt
 
+from clients import ASGIClient, ClientTestCase, client_variant
 
-mock_app = Flask(__name__)
 
-
-class TestEncryptEndpoint(TestCase):
+class TestEncryptEndpoint(ClientTestCase):
 
     def test_encrypt_returns_OK_on_valid_input(self):
         payload = {
@@ -22,35 +21,33 @@ class TestEncryptEndpoint(TestCase):
             "bool": False
         }
 
-        with mock_app.test_request_context("/encrypt", method=HTTPMethod.POST, json=payload):
-            response, status_code = encrypt()
+        response = self.client.post("/api/encrypt", json=payload)
 
-        self.assertEqual(status_code, HTTPStatus.OK)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        encrypted = response.get_json()
         for key in payload.keys():
-            self.assertIn(key, response)
-            self.assertIsInstance(response[key], str)
-            self.assertTrue(response[key].startswith(EncryptionHandler.SENTINEL))
+            self.assertIn(key, encrypted)
+            self.assertIsInstance(encrypted[key], str)
+            self.assertTrue(encrypted[key].startswith(EncryptionHandler.SENTINEL))
 
     @patch.object(EncryptionHandler, "encrypt_payload")
     def test_encrypt_returns_ERROR_on_encryption_error(self, mo_encrypt):
         payload = {}
         mo_encrypt.side_effect = ValueError
 
-        with mock_app.test_request_context("/encrypt", method=HTTPMethod.POST, json=payload):
-            _, status_code = encrypt()
+        response = self.client.post("/api/encrypt", json=payload)
 
-        self.assertEqual(status_code, HTTPStatus.INTERNAL_SERVER_ERROR)
+        self.assertEqual(response.status_code, HTTPStatus.INTERNAL_SERVER_ERROR)
 
     def test_encrypt_returns_BADREQUEST_on_invalid_input(self):
         payload = "not a dict"
 
-        with mock_app.test_request_context("/encrypt", method=HTTPMethod.POST, json=payload):
-            _, status_code = encrypt()
+        response = self.client.post("/api/encrypt", json=payload)
 
-        self.assertEqual(status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
 
 
-class TestDecryptionEndpoint(TestCase):
+class TestDecryptionEndpoint(ClientTestCase):
 
     def test_decrypt_successfully_decrypts_payload_encrypted_by_us(self):
         original = {
@@ -62,34 +59,152 @@ class TestDecryptionEndpoint(TestCase):
             "bool": True
         }
         # First, encrypt the payload
-        with mock_app.test_request_context("/encrypt", method=HTTPMethod.POST, json=original):
-            encrypted, _ = encrypt()
+        encrypted = self.client.post("/api/encrypt", json=original).get_json()
 
         # Second, add some clear items (to the encrypted output and also to the original)
         encrypted["clear"] = original["clear"] = "just a regular string"
         encrypted["object"] = original["object"] = {"key": "value"}
 
         # This is the actual test : trying to decrypt our own encrypted output
-        with mock_app.test_request_context("/decrypt", method=HTTPMethod.POST, json=encrypted):
-            decrypted, status_code = decrypt()
+        response = self.client.post("/api/decrypt", json=encrypted)
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertDictEqual(response.get_json(), original)
+
+    def test_decrypt_returns_envelope_like_clear_values_unchanged(self):
+        payload = {"price": "~EUR:100", "code": "~#E9x:1"}
 
-        self.assertEqual(status_code, HTTPStatus.OK)
-        self.assertDictEqual(decrypted, original)
+        response = self.client.post("/api/decrypt", json=payload)
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertDictEqual(response.get_json(), payload)
 
     @patch.object(EncryptionHandler, "decrypt_payload")
     def test_decrypt_returns_ERROR_on_decryption_error(self, mo_decrypt):
         payload = {}
         mo_decrypt.side_effect = ValueError
 
-        with mock_app.test_request_context("/decrypt", method=HTTPMethod.POST, json=payload):
-            _, status_code = decrypt()
+        response = self.client.post("/api/decrypt", json=payload)
 
-        self.assertEqual(status_code, HTTPStatus.INTERNAL_SERVER_ERROR)
+        self.assertEqual(response.status_code, HTTPStatus.INTERNAL_SERVER_ERROR)
 
     def test_decrypt_returns_BADREQUEST_on_invalid_input(self):
         payload = "not a dict"
 
-        with mock_app.test_request_context("/decrypt", method=HTTPMethod.POST, json=payload):
-            _, status_code = decrypt()
+        response = self.client.post("/api/decrypt", json=payload)
+
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+class TestDeepEncryptionEndpoints(ClientTestCase):
+
+    def test_decrypt_deep_successfully_decrypts_encrypt_with_paths_output(self):
+        original = {"users": [{"name": "Alice", "password": "a"}, {"name": "Bob", "password": "b"}], "count": 2}
+
+        response = self.client.post("/api/encrypt?path=$.users[*].password&path=$.count", json=original)
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        encrypted = response.get_json()
+        self.assertEqual(encrypted["users"][1]["name"], "Bob")
+        self.assertTrue(encrypted["users"][1]["password"].startswith(EncryptionHandler.SENTINEL))
+
+        response = self.client.post("/api/decrypt?deep=true", json=encrypted)
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertDictEqual(response.get_json(), original)
+
+    def test_encrypt_returns_BADREQUEST_on_invalid_path(self):
+        response = self.client.post("/api/encrypt?path=$.users[", json={"users": []})
+
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn("error", response.get_json())
+
+
+class TestSelectedFieldsDecryptionEndpoint(ClientTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.original = {"name": "Alice", "age": 32, "active": True}
+        self.encrypted = self.client.post("/api/encrypt", json=self.original).get_json()
+
+    def test_decrypt_with_fields_and_only_returns_named_values(self):
+        response = self.client.post("/api/decrypt?fields=name,%20age&only=true", json=self.encrypted)
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertDictEqual(response.get_json(), {"name": "Alice", "age": 32})
+
+    def test_decrypt_with_fields_passes_other_values_through(self):
+        response = self.client.post("/api/decrypt?fields=age", json=self.encrypted)
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertDictEqual(response.get_json(), {**self.encrypted, "age": 32})
+
+    def test_decrypt_returns_BADREQUEST_on_only_without_fields(self):
+        response = self.client.post("/api/decrypt?only=true", json=self.encrypted)
+
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+class TestBatchEncryptionEndpoints(ClientTestCase):
+
+    def test_decrypt_batch_successfully_decrypts_encrypt_batch_output(self):
+        originals = [{"name": "Alice", "age": 32}, {"metadata": {"country": "FR"}}]
+
+        response = self.client.post("/api/encrypt/batch", json=originals)
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        bodies = [result[BatchFields.body] for result in response.get_json()[BatchFields.results]]
+
+        response = self.client.post("/api/decrypt/batch", json=bodies)
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        decrypted = response.get_json()
+        self.assertListEqual([result[BatchFields.body] for result in decrypted[BatchFields.results]], originals)
+
+    def test_decrypt_batch_isolates_invalid_items(self):
+        payload = [
+            {"name": EncryptionHandler.SENTINEL + "not base64"},
+            "not a dict",
+            {"clear": "value"}
+        ]
+
+        response = self.client.post("/api/decrypt/batch", json=payload)
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        results = response.get_json()[BatchFields.results]
+        statuses = [result[BatchFields.status] for result in results]
+        self.assertListEqual(statuses, [HTTPStatus.BAD_REQUEST, HTTPStatus.BAD_REQUEST, HTTPStatus.OK])
+        self.assertDictEqual(results[2][BatchFields.body], {"clear": "value"})
+
+    def test_batch_endpoints_return_BADREQUEST_on_non_list_input(self):
+        for path in ("/api/encrypt/batch", "/api/decrypt/batch"):
+            with self.subTest(path=path):
+                response = self.client.post(path, json={})
+
+                self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+class TestStreamEncryptionEndpoints(ClientTestCase):
+
+    def test_decrypt_stream_successfully_decrypts_encrypt_stream_output(self):
+        originals = [{"name": "Alice", "age": 32}, {"metadata": {"country": "FR"}}]
+        body = "\n".join(json.dumps(original) for original in originals)
+
+        response = self.client.post("/api/encrypt/stream", data=body, content_type=NDJSON_MIMETYPE)
+        encrypted = [json.loads(line) for line in response.get_data().splitlines()]
+
+        self.assertEqual(response.mimetype, NDJSON_MIMETYPE)
+        body = "\n".join(json.dumps(result[BatchFields.body]) for result in encrypted)
+
+        response = self.client.post("/api/decrypt/stream", data=body, content_type=NDJSON_MIMETYPE)
+        decrypted = [json.loads(line) for line in response.get_data().splitlines()]
+
+        self.assertListEqual([result[BatchFields.body] for result in decrypted], originals)
+
 
-        self.assertEqual(status_code, HTTPStatus.BAD_REQUEST)
+TestEncryptEndpointASGI = client_variant(TestEncryptEndpoint, ASGIClient)
+TestDecryptionEndpointASGI = client_variant(TestDecryptionEndpoint, ASGIClient)
+TestDeepEncryptionEndpointsASGI = client_variant(TestDeepEncryptionEndpoints, ASGIClient)
+TestSelectedFieldsDecryptionEndpointASGI = client_variant(TestSelectedFieldsDecryptionEndpoint, ASGIClient)
+TestBatchEncryptionEndpointsASGI = client_variant(TestBatchEncryptionEndpoints, ASGIClient)
+TestStreamEncryptionEndpointsASGI = client_variant(TestStreamEncryptionEndpoints, ASGIClient)
@@ -0,0 +1,32 @@
+from unittest import TestCase
+from unittest.mock import patch
+from http import HTTPStatus
+
+from app import app
+from api.helpers.metrics import MetricNames, metrics
+
+
+class TestMetricsEndpoint(TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def test_metrics_returns_NOTFOUND_when_disabled(self):
+        with patch.object(metrics, "enabled", False):
+            response = self.client.get("/api/metrics")
+
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_metrics_exposes_stages_and_error_causes(self):
+        with patch.object(metrics, "enabled", True):
+            self.client.post("/api/encrypt", json={"name": "Alice"})
+            self.client.post("/api/decrypt", json={"name": "--- BEGIN CRYPTED MESSAGE ---not base64"})
+            response = self.client.get("/api/metrics")
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        content = response.get_data(as_text=True)
+        for stage in ("parse", "crypter", "serialise"):
+            with self.subTest(stage=stage):
+                self.assertIn(f'{MetricNames.stage_seconds}_count{{route="encrypt",stage="{stage}"}}', content)
+        self.assertIn(f'{MetricNames.errors_total}{{cause="BinasciiError",route="decrypt"}}', content)
+        self.assertIn(f'{MetricNames.payload_bytes}_count{{route="encrypt"}}', content)
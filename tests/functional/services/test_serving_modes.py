@@ -0,0 +1,170 @@
+import gzip
+import logging
+import os
+import runpy
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from http import HTTPStatus
+import json
+
+from app import app
+from api.config.fields import BatchFields, SignatureFields
+from api.helpers.codecs import StdlibJSONCodec
+from api.helpers.metrics import Metrics
+from api.helpers.signer import HMACSigner
+
+from clients import ASGIClient, ClientTestCase, CompressedWSGIClient, client_variant
+
+
+class TestServingModes(ClientTestCase):
+
+    def test_decrypt_successfully_decrypts_encrypt_output(self):
+        original = {"name": "Alice", "age": 32, "metadata": {"country": "FR"}}
+
+        response = self.client.post("/api/encrypt", json=original)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+        response = self.client.post("/api/decrypt", json=response.get_json())
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertDictEqual(response.get_json(), original)
+
+    def test_verify_successfully_verifies_sign_output(self):
+        original = {"name": "Alice", "age": 32}
+
+        response = self.client.post("/api/sign", json=original)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+        signature = response.get_json()[SignatureFields.signature]
+        payload = {SignatureFields.data: original, SignatureFields.signature: signature}
+        response = self.client.post("/api/verify", json=payload)
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+
+    def test_integers_above_64_bits_keep_their_digits(self):
+        original = {"a": 123456789012345678901234567890}
+
+        response = self.client.post("/api/sign", json=original)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        # Signatures are computed over the canonical form of the standard library, as before the JSON backends
+        expected = HMACSigner().signature(StdlibJSONCodec().canonical(original))
+        self.assertEqual(response.get_json()[SignatureFields.signature], expected)
+
+        encrypted = self.client.post("/api/encrypt", json=original).get_json()
+        decrypted = self.client.post("/api/decrypt", json=encrypted).get_json()
+        self.assertEqual(repr(decrypted), repr(original))
+
+    def test_non_finite_floats_are_accepted_as_by_the_standard_library(self):
+        body = '{"a": NaN, "b": [Infinity, -Infinity]}'
+        original = json.loads(body)
+
+        response = self.client.post("/api/sign", data=body, content_type="application/json")
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        expected = HMACSigner().signature(StdlibJSONCodec().canonical(original))
+        self.assertEqual(response.get_json()[SignatureFields.signature], expected)
+
+        response = self.client.post("/api/decrypt", data=body, content_type="application/json")
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.get_data(), StdlibJSONCodec().encode(original))
+
+    def test_batch_endpoint_returns_per_item_results(self):
+        response = self.client.post("/api/encrypt/batch", json=[{"name": "Alice"}, "not a dict"])
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        statuses = [result[BatchFields.status] for result in response.get_json()[BatchFields.results]]
+        self.assertListEqual(statuses, [HTTPStatus.OK, HTTPStatus.BAD_REQUEST])
+
+    def test_invalid_input_returns_BADREQUEST(self):
+        response = self.client.post("/api/encrypt", json="not a dict")
+
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+TestServingModesCompressedWSGI = client_variant(TestServingModes, CompressedWSGIClient)
+TestServingModesASGI = client_variant(TestServingModes, ASGIClient)
+
+
+class TestCompressedResponses(TestCase):
+
+    def test_large_response_is_compressed(self):
+        payload = {f"field{index}": "x" * 100 for index in range(100)}
+        response = app.test_client().post("/api/encrypt", json=payload, headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(response.get_data())).keys(), payload.keys())
+
+
+class TestRequestLimits(TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def test_malformed_bodies_are_rejected_before_parsing(self):
+        for path, body, error in (("/api/encrypt", b"[1]", "Input is not a valid JSON"),
+                                  ("/api/verify", b' "data"', "Invalid JSON payload"),
+                                  ("/api/sign/batch", b"{}", "Input is not a valid JSON array")):
+            with self.subTest(path=path):
+                response = self.client.post(path, data=body, content_type="application/json")
+
+                self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+                self.assertEqual(response.get_json(), {"error": error})
+
+    def test_routes_have_their_own_size_limit(self):
+        body = json.dumps({"name": "x" * 1000})
+        with patch.dict("api.controllers.limits.MAX_CONTENT_LENGTHS", {"encrypt": 100}):
+            self.assertEqual(self.client.post("/api/encrypt", data=body, content_type="application/json").status_code,
+                             HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            self.assertEqual(self.client.post("/api/sign", data=body, content_type="application/json").status_code,
+                             HTTPStatus.OK)
+
+    def test_signature_routes_accept_documents_over_the_global_limit(self):
+        # Only the announced length is large, the limit is checked before the body is read
+        length = str(100 * 1024 * 1024)
+        for path, status in (("/api/encrypt", HTTPStatus.REQUEST_ENTITY_TOO_LARGE),
+                             ("/api/sign", HTTPStatus.BAD_REQUEST), ("/api/verify", HTTPStatus.BAD_REQUEST)):
+            with self.subTest(path=path):
+                response = self.client.post(path, data=b"{}", content_type="application/json",
+                                            environ_overrides={"CONTENT_LENGTH": length})
+
+                self.assertEqual(response.status_code, status)
+
+
+class TestGunicornProfiles(TestCase):
+    CONFIG = os.path.join(os.path.dirname(__file__), "..", "..", "..", "gunicorn.conf.py")
+
+    def load(self, profile: str, workers: int = 0) -> dict:
+        with patch("api.config.settings.GUNICORN_PROFILE", profile):
+            with patch("api.config.settings.GUNICORN_WORKERS", workers):
+                return runpy.run_path(self.CONFIG)
+
+    def test_profiles_derive_workers_from_cpus(self):
+        config = self.load("single")
+        cpus = config["cpus"]
+        self.assertEqual((config["worker_class"], config["workers"]), ("sync", 1))
+
+        config = self.load("sync")
+        self.assertTrue(config["preload_app"])
+        self.assertEqual((config["worker_class"], config["workers"]), ("sync", 2 * cpus + 1))
+
+        config = self.load("gthread")
+        self.assertEqual((config["worker_class"], config["workers"], config["threads"]), ("gthread", cpus, 4))
+
+        config = self.load("async")
+        self.assertEqual((config["wsgi_app"], config["worker_class"], config["workers"]),
+                         ("asgi:app", "uvicorn_worker.UvicornWorker", cpus))
+        self.assertEqual(self.load("sync", workers=7)["workers"], 7)
+
+    def test_unknown_profile_raises_VALUEERROR(self):
+        with self.assertRaises(ValueError):
+            self.load("eventlet")
+
+    def test_on_starting_enables_gunicorn_loggers_and_clears_metrics_snapshots(self):
+        logging.getLogger("gunicorn.error").disabled = True
+        with TemporaryDirectory() as directory:
+            stale = os.path.join(directory, "metrics-1.json")
+            open(stale, "w").close()
+
+            with patch("api.helpers.metrics.metrics", Metrics(enabled=True, directory=directory)):
+                self.load("gthread")["on_starting"](MagicMock())
+
+            self.assertFalse(os.path.exists(stale))
+        self.assertFalse(logging.getLogger("gunicorn.error").disabled)
@@ -1,55 +1,55 @@
-from unittest import TestCase
 from unittest.mock import patch
-from http import HTTPMethod, HTTPStatus
+from http import HTTPStatus
+import json
 from flask import Flask
 
-from api.config.fields import SignatureFields
+from api.config.fields import BatchFields, SignatureFields
+from api.config.json_provider import CodecJSONProvider
+from api.config.settings import NDJSON_MIMETYPE, ROOT_URL
+from api.controllers.registry import HandlerRegistry
 from api.controllers.signature import SignatureHandler
-from api.services.signature import sign, verify
+from api.helpers.cache import SignatureCache, VerifiedIndex
+from api.helpers.signer import HMACSigner
+from api.services.signature import blueprint_signature
 
+from clients import ASGIClient, ClientTestCase, client_variant
 
-mock_app = Flask(__name__)
 
-
-class TestSignEndpoint(TestCase):
+class TestSignEndpoint(ClientTestCase):
 
     def test_sign_returns_signature_and_OK(self):
         payload = {}
 
-        with mock_app.test_request_context("/sign", method=HTTPMethod.POST, json=payload):
-            response, status_code = sign()
+        response = self.client.post("/api/sign", json=payload)
 
-        self.assertEqual(status_code, HTTPStatus.OK)
-        self.assertIn(SignatureFields.signature, response.keys())
-        self.assertEqual(len(response.keys()), 1)
-        self.assertIsInstance(response[SignatureFields.signature], str)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        signed = response.get_json()
+        self.assertIn(SignatureFields.signature, signed.keys())
+        self.assertEqual(len(signed.keys()), 1)
+        self.assertIsInstance(signed[SignatureFields.signature], str)
 
     @patch.object(SignatureHandler, "sign_payload")
     def test_sign_returns_ERROR_on_sign_error(self, mo_sign):
         payload = {}
         mo_sign.side_effect = ValueError
 
-        with mock_app.test_request_context("/sign", method=HTTPMethod.POST, json=payload):
-            _, status_code = sign()
+        response = self.client.post("/api/sign", json=payload)
 
-        self.assertEqual(status_code, HTTPStatus.INTERNAL_SERVER_ERROR)
+        self.assertEqual(response.status_code, HTTPStatus.INTERNAL_SERVER_ERROR)
 
     def test_sign_returns_BADREQUEST_on_invalid_input(self):
-        # With invalid JSON, get_json(silent=True) will return None
-        with mock_app.test_request_context("/sign", method=HTTPMethod.POST, json=None):
-            _, status_code = sign()
+        response = self.client.post("/api/sign", data="not json", content_type="application/json")
 
-        self.assertEqual(status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
 
 
-class TestVerifyEndpoint(TestCase):
+class TestVerifyEndpoint(ClientTestCase):
 
     def test_verify_successfully_verifies_payload_signed_by_us(self):
         original = {}
 
         # First, sign the payload
-        with mock_app.test_request_context("/sign", method=HTTPMethod.POST, json=original):
-            signed, _ = sign()
+        signed = self.client.post("/api/sign", json=original).get_json()
 
         # Second, prepare payload for verify
         payload = {
@@ -58,11 +58,10 @@ class TestVerifyEndpoint(TestCase):
         }
 
         # This is the actual test : trying to verify our own signed output
-        with mock_app.test_request_context("/verify", method=HTTPMethod.POST, json=payload):
-            verified, status_code = verify()
+        response = self.client.post("/api/verify", json=payload)
 
-        self.assertEqual(status_code, HTTPStatus.NO_CONTENT)
-        self.assertEqual(verified, "")
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assertEqual(response.get_data(), b"")
 
     def test_verify_successfully_verifies_equivalent_payloads(self):
         original1 = {
@@ -81,8 +80,7 @@ class TestVerifyEndpoint(TestCase):
         }
 
         # First, sign one of the payload to get the signature
-        with mock_app.test_request_context("/sign", method=HTTPMethod.POST, json=original1):
-            signed, _ = sign()
+        signed = self.client.post("/api/sign", json=original1).get_json()
 
         # Second, prepare payloads for verify
         payload1 = {
@@ -95,10 +93,8 @@ class TestVerifyEndpoint(TestCase):
         }
 
         # This is the actual test : we should accept both payloads
-        with mock_app.test_request_context("/verify", method=HTTPMethod.POST, json=payload1):
-            _, status1 = verify()
-        with mock_app.test_request_context("/verify", method=HTTPMethod.POST, json=payload2):
-            _, status2 = verify()
+        status1 = self.client.post("/api/verify", json=payload1).status_code
+        status2 = self.client.post("/api/verify", json=payload2).status_code
 
         self.assertEqual(status1, status2)
         self.assertEqual(status1, HTTPStatus.NO_CONTENT)
@@ -107,8 +103,7 @@ class TestVerifyEndpoint(TestCase):
         original = {"name": "John"}
 
         # First, sign the payload
-        with mock_app.test_request_context("/sign", method=HTTPMethod.POST, json=original):
-            signed, _ = sign()
+        signed = self.client.post("/api/sign", json=original).get_json()
 
         # Second, prepare payload for verify
         payload = {
@@ -117,17 +112,15 @@ class TestVerifyEndpoint(TestCase):
         }
 
         # This is the actual test : verify should return a BAD REQUEST due to tampered data
-        with mock_app.test_request_context("/verify", method=HTTPMethod.POST, json=payload):
-            _, status_code = verify()
+        response = self.client.post("/api/verify", json=payload)
 
-        self.assertEqual(status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
 
     def test_verify_successfully_detect_invalid_signature(self):
         original = {}
 
         # First, sign the payload
-        with mock_app.test_request_context("/sign", method=HTTPMethod.POST, json=original):
-            signed, _ = sign()
+        signed = self.client.post("/api/sign", json=original).get_json()
 
         # Second, prepare payload for verify
         payload = {
@@ -136,25 +129,21 @@ class TestVerifyEndpoint(TestCase):
         }
 
         # This is the actual test : verify should return a BAD REQUEST due to invalid signature
-        with mock_app.test_request_context("/verify", method=HTTPMethod.POST, json=payload):
-            _, status_code = verify()
+        response = self.client.post("/api/verify", json=payload)
 
-        self.assertEqual(status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
 
     def test_verify_returns_BADREQUEST_on_invalid_input(self):
         with self.subTest("Test invalid JSON-dict"):
-            # Mock an invalid json input with json=""
-            with mock_app.test_request_context("/verify", method=HTTPMethod.POST, json=""):
-                _, status_code = verify()
+            response = self.client.post("/api/verify", json="")
 
-            self.assertEqual(status_code, HTTPStatus.BAD_REQUEST)
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
 
         with self.subTest("Test missing keys"):
             payload = {}
-            with mock_app.test_request_context("/verify", method=HTTPMethod.POST, json=payload):
-                _, status_code = verify()
+            response = self.client.post("/api/verify", json=payload)
 
-            self.assertEqual(status_code, HTTPStatus.BAD_REQUEST)
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
 
     @patch.object(SignatureHandler, "verify_payload")
     def test_verify_returns_ERROR_on_execution_error(self, mo_verify):
@@ -164,7 +153,187 @@ class TestVerifyEndpoint(TestCase):
         }
         mo_verify.side_effect = ValueError
 
-        with mock_app.test_request_context("/verify", method=HTTPMethod.POST, json=payload):
-            _, status_code = verify()
+        response = self.client.post("/api/verify", json=payload)
+
+        self.assertEqual(response.status_code, HTTPStatus.INTERNAL_SERVER_ERROR)
+
+
+class TestBatchSignatureEndpoints(ClientTestCase):
+
+    def test_verify_batch_successfully_verifies_sign_batch_output(self):
+        originals = [{"name": "Alice"}, {"name": "Bob"}]
+
+        response = self.client.post("/api/sign/batch", json=originals)
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        payload = [
+            {
+                SignatureFields.data: original,
+                SignatureFields.signature: result[BatchFields.body][SignatureFields.signature]
+            }
+            for original, result in zip(originals, response.get_json()[BatchFields.results])
+        ]
+        # Tamper the second item only
+        payload[1][SignatureFields.data] = {"name": "Eve"}
+
+        response = self.client.post("/api/verify/batch", json=payload)
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        statuses = [result[BatchFields.status] for result in response.get_json()[BatchFields.results]]
+        self.assertListEqual(statuses, [HTTPStatus.NO_CONTENT, HTTPStatus.BAD_REQUEST])
+
+    def test_verify_batch_isolates_invalid_items(self):
+        payload = [{}, "not a dict"]
+
+        response = self.client.post("/api/verify/batch", json=payload)
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        statuses = [result[BatchFields.status] for result in response.get_json()[BatchFields.results]]
+        self.assertListEqual(statuses, [HTTPStatus.BAD_REQUEST, HTTPStatus.BAD_REQUEST])
+
+    def test_sign_batch_rejects_null_items_as_sign_does(self):
+        single = self.client.post("/api/sign", data="null", content_type="application/json")
+
+        response = self.client.post("/api/sign/batch", json=[{"name": "Alice"}, None, "text"])
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        results = response.get_json()[BatchFields.results]
+        self.assertListEqual([result[BatchFields.status] for result in results],
+                             [HTTPStatus.OK, single.status_code, HTTPStatus.OK])
+        self.assertDictEqual(results[1][BatchFields.body], single.get_json())
+
+
+class TestStreamSignatureEndpoints(ClientTestCase):
+
+    def test_verify_stream_successfully_verifies_sign_stream_output(self):
+        originals = [{"name": "Alice"}, {"name": "Bob"}]
+        body = "\n".join(json.dumps(original) for original in originals)
+
+        response = self.client.post("/api/sign/stream", data=body, content_type=NDJSON_MIMETYPE)
+        signed = [json.loads(line) for line in response.get_data().splitlines()]
+
+        body = "\n".join(
+            json.dumps({
+                SignatureFields.data: original,
+                SignatureFields.signature: result[BatchFields.body][SignatureFields.signature]
+            })
+            for original, result in zip(originals, signed)
+        )
+
+        response = self.client.post("/api/verify/stream", data=body, content_type=NDJSON_MIMETYPE)
+        verified = [json.loads(line) for line in response.get_data().splitlines()]
+
+        self.assertListEqual([result[BatchFields.status] for result in verified], [204, 204])
+
+    def test_sign_stream_rejects_null_records(self):
+        response = self.client.post("/api/sign/stream", data='{"name": "Alice"}\nnull', content_type=NDJSON_MIMETYPE)
+        signed = [json.loads(line) for line in response.get_data().splitlines()]
+
+        self.assertListEqual([result[BatchFields.status] for result in signed], [200, 400])
+        self.assertDictEqual(signed[1][BatchFields.body], {"error": "Invalid JSON payload"})
+
+
+class TestMerkleSignatureEndpoints(ClientTestCase):
+
+    def test_verify_and_update_single_member_of_merkle_signed_object(self):
+        document = {"name": "Alice", "age": 32, "city": "Paris"}
+
+        response = self.client.post("/api/sign?mode=merkle", json=document)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        signed = response.get_json()
+
+        payload = {
+            SignatureFields.signature: signed[SignatureFields.signature],
+            SignatureFields.root: signed[SignatureFields.root],
+            SignatureFields.proofs: {"age": signed[SignatureFields.proofs]["age"]},
+            SignatureFields.data: {"age": 32}
+        }
+        response = self.client.post("/api/verify?mode=merkle", json=payload)
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+
+        response = self.client.post("/api/sign/update", json={**payload, SignatureFields.update: {"age": 33}})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        updated = response.get_json()
+
+        payload = {SignatureFields.signature: updated[SignatureFields.signature],
+                   SignatureFields.data: {**document, "age": 33}}
+        response = self.client.post("/api/verify?mode=merkle", json=payload)
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+
+    def test_sign_returns_BADREQUEST_on_unknown_mode(self):
+        response = self.client.post("/api/sign?mode=tree", json={})
+
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+class TestVerifiedIndexEndpoint(ClientTestCase):
+
+    def setUp(self):
+        self.handler = SignatureHandler(signer=HMACSigner(secret="key"), verified_index=VerifiedIndex(max_entries=16))
+        self.registry = HandlerRegistry()
+        self.registry.signature = self.handler
+        self.app = Flask(__name__)
+        self.app.json = CodecJSONProvider(self.app)
+        self.registry.init_app(self.app)
+        self.app.register_blueprint(blueprint_signature, url_prefix=ROOT_URL)
+        self.client = self.client_class(self.app)
+        self.addCleanup(self.client.close)
+
+    def verify(self, payload):
+        return self.client.post("/api/verify", json=payload).status_code
+
+    def test_repeated_verification_is_answered_from_index(self):
+        data = {"name": "Alice"}
+        payload = {SignatureFields.data: data, SignatureFields.signature: self.handler.generate_signature(data)}
+
+        self.assertEqual(self.verify(payload), HTTPStatus.NO_CONTENT)
+        with patch.object(SignatureHandler, "verify_payload") as mo_verify:
+            self.assertEqual(self.verify(payload), HTTPStatus.NO_CONTENT)
+
+        mo_verify.assert_not_called()
+
+    def test_invalid_signature_is_never_answered_from_index(self):
+        payload = {SignatureFields.data: {"name": "Alice"}, SignatureFields.signature: "0" * 64}
+
+        self.assertEqual(self.verify(payload), HTTPStatus.BAD_REQUEST)
+        self.assertEqual(self.verify(payload), HTTPStatus.BAD_REQUEST)
+        self.assertEqual(self.handler.verified_index.hits, 0)
+
+
+class TestSignatureCacheEndpoint(ClientTestCase):
+
+    def setUp(self):
+        self.handler = SignatureHandler(signer=HMACSigner(secret="key"),
+                                        cache=SignatureCache(max_entries=16, max_bytes=1024))
+        self.registry = HandlerRegistry()
+        self.registry.signature = self.handler
+        self.app = Flask(__name__)
+        self.app.json = CodecJSONProvider(self.app)
+        self.registry.init_app(self.app)
+        self.app.register_blueprint(blueprint_signature, url_prefix=ROOT_URL)
+        self.client = self.client_class(self.app)
+        self.addCleanup(self.client.close)
+
+    def test_repeated_signature_is_answered_from_cache(self):
+        first = self.client.post("/api/sign", json={"name": "Alice"})
+        with patch.object(SignatureHandler, "sign_payload") as mo_sign:
+            second = self.client.post("/api/sign", json={"name": "Alice"})
+
+        mo_sign.assert_not_called()
+        self.assertEqual(second.status_code, HTTPStatus.OK)
+        self.assertDictEqual(second.get_json(), first.get_json())
+
+    def test_merkle_and_invalid_requests_are_not_cached(self):
+        self.client.post("/api/sign?mode=merkle", json={"name": "Alice"})
+        self.client.post("/api/sign", data="not json", content_type="application/json")
+
+        self.assertEqual(self.handler.cache.stats()["entries"], 0)
+
 
-        self.assertEqual(status_code, HTTPStatus.INTERNAL_SERVER_ERROR)
+TestSignEndpointASGI = client_variant(TestSignEndpoint, ASGIClient)
+TestVerifyEndpointASGI = client_variant(TestVerifyEndpoint, ASGIClient)
+TestBatchSignatureEndpointsASGI = client_variant(TestBatchSignatureEndpoints, ASGIClient)
+TestStreamSignatureEndpointsASGI = client_variant(TestStreamSignatureEndpoints, ASGIClient)
+TestMerkleSignatureEndpointsASGI = client_variant(TestMerkleSignatureEndpoints, ASGIClient)
+TestVerifiedIndexEndpointASGI = client_variant(TestVerifiedIndexEndpoint, ASGIClient)
+TestSignatureCacheEndpointASGI = client_variant(TestSignatureCacheEndpoint, ASGIClient)
@@ -0,0 +1,52 @@
+from http import HTTPStatus
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from app import app, openapi_document
+from api.config.apispec import FINGERPRINT_KEY, spec_fingerprint
+from api.controllers.openapi import OpenAPIDocument
+
+
+class TestSwaggerEndpoint(TestCase):
+
+    def test_swagger_documents_every_route_and_revalidates(self):
+        client = app.test_client()
+
+        response = client.get("/api/swagger.json")
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn("/api/sign", response.get_json()["paths"])
+        self.assertIn("/api/decrypt", response.get_json()["paths"])
+
+        response = client.get("/api/swagger.json", headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(response.get_data(), b"")
+
+    def test_build_spec_command_writes_artifact(self):
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "openapi.json")
+
+            result = app.test_cli_runner().invoke(args=["build-spec", "--output", path])
+
+            self.assertEqual(result.exit_code, 0, result.output)
+            with open(path) as file:
+                self.assertIn("/api/verify", json.load(file)["paths"])
+
+    def test_artifact_of_other_sources_is_rebuilt(self):
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "openapi.json")
+            app.test_cli_runner().invoke(args=["build-spec", "--output", path])
+            with open(path) as file:
+                built = json.load(file)
+            self.assertEqual(built[FINGERPRINT_KEY], spec_fingerprint(app))
+
+            # An artifact left by a previous version of the routes
+            del built["paths"]["/api/verify"]
+            built[FINGERPRINT_KEY] = "previous"
+            with open(path, "w") as file:
+                json.dump(built, file)
+            document = OpenAPIDocument(path, openapi_document.build, fingerprint=openapi_document.fingerprint,
+                                       fingerprint_key=FINGERPRINT_KEY)
+
+            self.assertIn("/api/verify", json.loads(document.body.raw)["paths"])
@@ -0,0 +1,109 @@
+from unittest import TestCase, skipUnless
+from unittest.mock import PropertyMock, patch
+from http import HTTPStatus
+
+from app import app
+from api.config.fields import SignatureFields
+from api.config.settings import CBOR_MIMETYPE, JSON_MIMETYPE, MSGPACK_MIMETYPE
+from api.controllers.encryption import EncryptionHandler
+from api.helpers.crypters import Ciphertext
+from api.helpers.formats import CBORFormat, MsgpackFormat, get_wire_format
+
+
+class WireFormatEndpointsTests:
+    """Endpoints roundtrips in a binary wire format, run for each format by the classes below."""
+    mimetype = ""
+
+    def setUp(self):
+        self.client = app.test_client()
+        self.wire_format = get_wire_format(self.mimetype)
+
+    def post(self, path: str, payload, accept: str = None):
+        """Post a payload in the wire format and return the response."""
+        headers = {"Accept": accept} if accept else {}
+        return self.client.post(path, data=self.wire_format.encode(payload), content_type=self.mimetype,
+                                headers=headers)
+
+    def test_decrypt_successfully_decrypts_encrypt_output(self):
+        original = {"name": "Alice", "age": 32, "metadata": {"country": "FR"}}
+
+        response = self.post("/api/encrypt", original)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.mimetype, self.mimetype)
+        encrypted = self.wire_format.decode(response.data)
+        self.assertIsInstance(encrypted["name"], Ciphertext)
+
+        response = self.post("/api/decrypt", encrypted)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertDictEqual(self.wire_format.decode(response.data), original)
+
+    def test_encrypt_answers_json_with_text_ciphertexts_when_accepted(self):
+        response = self.post("/api/encrypt", {"name": "Alice"}, accept=JSON_MIMETYPE)
+
+        self.assertEqual(response.mimetype, JSON_MIMETYPE)
+        self.assertTrue(response.get_json()["name"].startswith(EncryptionHandler.SENTINEL))
+
+    def test_decrypt_accepts_json_ciphertexts(self):
+        encrypted = self.client.post("/api/encrypt", json={"name": "Alice"}).get_json()
+
+        response = self.post("/api/decrypt", encrypted)
+
+        self.assertDictEqual(self.wire_format.decode(response.data), {"name": "Alice"})
+
+    def test_encrypt_returns_BADREQUEST_on_bytes_values(self):
+        for path in ("/api/encrypt", "/api/encrypt?path=$.key"):
+            with self.subTest(path=path):
+                response = self.post(path, {"key": b"\x00\x01"})
+
+                self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+                error = self.wire_format.decode(response.data)
+                self.assertDictEqual(error, {"error": "Payload is not JSON serializable"})
+
+    def test_decrypt_returns_BADREQUEST_on_bytes_values_answered_as_json(self):
+        response = self.post("/api/decrypt", {"key": b"\x00\x01", "clear": 1}, accept=JSON_MIMETYPE)
+
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertDictEqual(response.get_json(), {"error": "Payload is not JSON serializable"})
+
+    def test_sign_returns_the_same_signature_as_json(self):
+        original = {"name": "Alice", "age": 32, "scores": [1.5, None]}
+        expected = self.client.post("/api/sign", json=original).get_json()[SignatureFields.signature]
+
+        response = self.post("/api/sign", original)
+        signature = self.wire_format.decode(response.data)[SignatureFields.signature]
+
+        self.assertEqual(signature, expected)
+        response = self.post("/api/verify", {SignatureFields.data: original, SignatureFields.signature: signature})
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+
+    def test_sign_returns_BADREQUEST_on_non_json_values(self):
+        response = self.post("/api/sign", {"bytes": Ciphertext(b"raw")})
+
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_endpoints_return_BADREQUEST_on_malformed_body(self):
+        response = self.client.post("/api/encrypt", data=b"\xc1", content_type=self.mimetype)
+
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_endpoints_return_UNSUPPORTED_MEDIA_TYPE_when_format_is_not_installed(self):
+        with patch.object(type(self.wire_format), "available", new_callable=PropertyMock, return_value=False):
+            response = self.client.post("/api/encrypt", data=b"", content_type=self.mimetype)
+
+        self.assertEqual(response.status_code, HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
+
+
+@skipUnless(MsgpackFormat().available, "msgpack is not installed")
+class TestMsgpackEndpoints(WireFormatEndpointsTests, TestCase):
+    mimetype = MSGPACK_MIMETYPE
+
+    def test_json_request_is_answered_in_accepted_format(self):
+        response = self.client.post("/api/encrypt", json={"name": "Alice"}, headers={"Accept": MSGPACK_MIMETYPE})
+
+        self.assertEqual(response.mimetype, MSGPACK_MIMETYPE)
+        self.assertIsInstance(self.wire_format.decode(response.data)["name"], Ciphertext)
+
+
+@skipUnless(CBORFormat().available, "cbor2 is not installed")
+class TestCBOREndpoints(WireFormatEndpointsTests, TestCase):
+    mimetype = CBOR_MIMETYPE
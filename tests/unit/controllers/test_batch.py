@@ -0,0 +1,89 @@
+from unittest import TestCase
+from unittest.mock import patch
+from http import HTTPStatus
+from io import BytesIO
+import json
+
+from api.config.fields import BatchFields
+from api.controllers.batch import iter_lines, process_batch, process_item, process_stream, validate_batch
+
+
+class TestBatchValidation(TestCase):
+
+    def test_validate_batch_accepts_list(self):
+        self.assertIsNone(validate_batch([{}, "anything"]))
+
+    def test_validate_batch_returns_BADREQUEST_on_non_list(self):
+        for payload in ({}, "not a list", None):
+            with self.subTest(payload=payload):
+                _, status = validate_batch(payload)
+                self.assertEqual(status, HTTPStatus.BAD_REQUEST)
+
+    @patch("api.controllers.batch.BATCH_MAX_ITEMS", 2)
+    def test_validate_batch_returns_TOOLARGE_above_limit(self):
+        _, status = validate_batch([{}, {}, {}])
+
+        self.assertEqual(status, HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
+
+class TestBatchProcessing(TestCase):
+
+    def test_process_item_wraps_operation_result(self):
+        actual = process_item({"a": 1}, lambda item: (item, HTTPStatus.OK), "error")
+
+        self.assertDictEqual(actual, {BatchFields.status: 200, BatchFields.body: {"a": 1}})
+
+    def test_process_item_returns_ERROR_when_operation_raises(self):
+        def operation(item):
+            raise ValueError
+
+        actual = process_item({}, operation, "Unable to process")
+
+        self.assertDictEqual(actual, {BatchFields.status: 500, BatchFields.body: {"error": "Unable to process"}})
+
+    def test_process_batch_keeps_order_and_isolates_failures(self):
+        def operation(item):
+            if item < 0:
+                return {"error": "negative"}, HTTPStatus.BAD_REQUEST
+            return {"value": item}, HTTPStatus.OK
+
+        actual, status = process_batch([1, -1, 2], operation, "error")
+        statuses = [result[BatchFields.status] for result in actual[BatchFields.results]]
+
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertListEqual(statuses, [200, 400, 200])
+        self.assertDictEqual(actual[BatchFields.results][2][BatchFields.body], {"value": 2})
+
+
+class TestStreamProcessing(TestCase):
+
+    def test_iter_lines_yields_lines_across_chunk_boundaries(self):
+        stream = BytesIO(b'{"a": 1}\n{"b": 2}\n\n{"c": 3}')
+
+        actual = list(iter_lines(stream, chunk_size=3))
+
+        self.assertListEqual(actual, [b'{"a": 1}', b'{"b": 2}', b"", b'{"c": 3}'])
+
+    def test_iter_lines_joins_record_spanning_many_chunks(self):
+        # 16384 chunks for the first record: copying the pending bytes at each chunk would take seconds
+        record = b'{"a": "' + b"x" * 1024 * 1024 + b'"}'
+        stream = BytesIO(record + b"\n" + record)
+
+        actual = list(iter_lines(stream, chunk_size=64))
+
+        self.assertEqual(len(actual), 2)
+        self.assertTrue(actual[0] == actual[1] == record)
+
+    def test_process_stream_yields_one_line_per_record(self):
+        lines = [b'{"a": 1}', b"", b"not json", b"[1]"]
+
+        def operation(item):
+            if not isinstance(item, dict):
+                return {"error": "not a dict"}, HTTPStatus.BAD_REQUEST
+            return item, HTTPStatus.OK
+
+        actual = [json.loads(line) for line in process_stream(lines, operation, "error")]
+        statuses = [result[BatchFields.status] for result in actual]
+
+        self.assertListEqual(statuses, [200, 400, 400])
+        self.assertDictEqual(actual[0][BatchFields.body], {"a": 1})
@@ -1,9 +1,10 @@
+import copy
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 from http import HTTPStatus
 
 from api.controllers.encryption import EncryptionHandler
-from api.helpers.crypters import RootCrypter
+from api.helpers.crypters import AEADCrypter, Base64Crypter, Ciphertext, RootCrypter
 
 
 class TestEncrypterDetectCryptingMethod(TestCase):
@@ -94,3 +95,191 @@ class TestEncrypterEndpointMethods(TestCase):
         self.assertEqual(actual, expected)
         self.assertEqual(status, HTTPStatus.OK)
         mo_decrypter.assert_not_called()
+
+
+class TestEncrypterDeepMode(TestCase):
+
+    def setUp(self):
+        self.handler = EncryptionHandler(crypter=Base64Crypter())
+
+    def test_encrypt_payload_with_selectors_only_encrypts_matched_values(self):
+        payload = {"users": [{"name": "Alice", "password": "secret"}], "count": 1}
+
+        actual, status = self.handler.encrypt_payload(payload, selectors=["$.users[*].password"])
+
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertEqual(actual["users"][0]["name"], "Alice")
+        self.assertEqual(actual["count"], 1)
+        self.assertTrue(actual["users"][0]["password"].startswith(self.handler.SENTINEL))
+
+    def test_encrypt_payload_with_nested_selectors_encrypts_outer_value(self):
+        payload = {"profile": {"password": "secret"}}
+
+        actual, _ = self.handler.encrypt_payload(payload, selectors=["$.profile.password", "$.profile"])
+        decrypted, _ = self.handler.decrypt_payload(actual)
+
+        self.assertDictEqual(decrypted, {"profile": {"password": "secret"}})
+
+    def test_decrypt_payload_deep_decrypts_values_at_any_depth(self):
+        original = {"users": [{"name": "Alice", "profile": {"password": "secret", "pin": 1234}}]}
+        encrypted, _ = self.handler.encrypt_payload(copy.deepcopy(original), selectors=["$..password", "$..pin"])
+
+        actual, status = self.handler.decrypt_payload(encrypted, deep=True)
+
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertDictEqual(actual, original)
+
+    def test_decrypt_payload_deep_does_not_walk_into_decrypted_values(self):
+        inner = self.handler.SENTINEL + "not base64"
+        encrypted, _ = self.handler.encrypt_payload({"outer": {"inner": inner}}, selectors=["$.outer"])
+
+        actual, status = self.handler.decrypt_payload(encrypted, deep=True)
+
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertDictEqual(actual, {"outer": {"inner": inner}})
+
+    def test_decrypt_payload_deep_returns_BADREQUEST_on_nested_invalid_value(self):
+        payload = {"users": [{"password": self.handler.SENTINEL + "not base64"}]}
+
+        _, status = self.handler.decrypt_payload(payload, deep=True)
+
+        self.assertEqual(status, HTTPStatus.BAD_REQUEST)
+
+
+class TestEncrypterSelectedFields(TestCase):
+
+    def setUp(self):
+        self.handler = EncryptionHandler(crypter=Base64Crypter())
+        self.original = {"name": "Alice", "age": 32, "address": {"city": "Paris"}, "comment": "clear"}
+        self.encrypted, _ = self.handler.encrypt_payload(copy.deepcopy(self.original))
+
+    def test_decrypt_payload_with_fields_only_decrypts_named_values(self):
+        with patch.object(EncryptionHandler, "decrypt_value", wraps=self.handler.decrypt_value) as mo_decrypt:
+            actual, status = self.handler.decrypt_payload(self.encrypted, fields=["age", "comment", "missing"])
+
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertEqual(mo_decrypt.call_count, 2)
+        self.assertListEqual(list(actual), list(self.original))
+        self.assertEqual(actual["age"], 32)
+        self.assertEqual(actual["comment"], "clear")
+        self.assertEqual(actual["name"], self.encrypted["name"])
+
+    def test_decrypt_payload_with_only_returns_named_values(self):
+        actual, status = self.handler.decrypt_payload(self.encrypted, fields=["address", "missing", "name"], only=True)
+
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertDictEqual(actual, {"address": {"city": "Paris"}, "name": "Alice"})
+
+    def test_decrypt_payload_with_fields_ignores_invalid_values_of_other_fields(self):
+        payload = {**self.encrypted, "broken": self.handler.SENTINEL + "not base64"}
+
+        with self.subTest("Invalid value not selected"):
+            _, status = self.handler.decrypt_payload(payload, fields=["name"])
+            self.assertEqual(status, HTTPStatus.OK)
+
+        with self.subTest("Invalid value selected"):
+            _, status = self.handler.decrypt_payload(payload, fields=["name", "broken"])
+            self.assertEqual(status, HTTPStatus.BAD_REQUEST)
+
+    def test_decrypt_payload_with_fields_offloads_according_to_selected_size(self):
+        offloader = Mock(threshold=1000, workers=2)
+        offloader.run.return_value = {}, HTTPStatus.OK
+        offloader.should_offload.side_effect = lambda size_hint: size_hint is not None and size_hint >= 1000
+        handler = EncryptionHandler(crypter=Base64Crypter(), offloader=offloader, parallel_threshold=1000)
+        payload = {**self.encrypted, "large": "x" * 10 ** 6}
+
+        actual, status = handler.decrypt_payload(payload, size_hint=10 ** 6, fields=["name", "age"], only=True)
+
+        offloader.run.assert_not_called()
+        offloader.run_chunks.assert_not_called()
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertDictEqual(actual, {"name": "Alice", "age": 32})
+
+        handler.decrypt_payload(payload, size_hint=10 ** 6, fields=["large"], only=True)
+        offloader.run.assert_called_once()
+
+
+class TestEncrypterRawCiphertexts(TestCase):
+
+    def setUp(self):
+        self.handler = EncryptionHandler(crypter=Base64Crypter())
+
+    def test_encrypt_payload_raw_returns_ciphertexts(self):
+        actual, status = self.handler.encrypt_payload({"key": {"a": 1}}, raw=True)
+
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertEqual(actual["key"], Ciphertext(self.handler.crypter.encrypt_bytes({"a": 1})))
+
+    def test_decrypt_payload_decrypts_ciphertexts_and_strings(self):
+        payload = {
+            "raw": Ciphertext(self.handler.crypter.encrypt_bytes([1, 2])),
+            "text": self.handler.SENTINEL + self.handler.crypter.encrypt("text"),
+            "clear": "clear",
+        }
+
+        actual, status = self.handler.decrypt_payload(payload)
+
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertDictEqual(actual, {"raw": [1, 2], "text": "text", "clear": "clear"})
+
+    def test_decrypt_payload_returns_BADREQUEST_on_invalid_ciphertext(self):
+        _, status = self.handler.decrypt_payload({"raw": Ciphertext(b"\xff not json")})
+
+        self.assertEqual(status, HTTPStatus.BAD_REQUEST)
+
+
+class TestEncrypterCompactEnvelope(TestCase):
+
+    def setUp(self):
+        self.handler = EncryptionHandler(crypter=Base64Crypter(), envelope="compact")
+        self.payload = {"name": "Alice", "age": 32, "metadata": {"country": "FR"}}
+
+    def test_encrypt_payload_prefixes_values_with_compact_envelope(self):
+        actual, status = self.handler.encrypt_payload(self.payload)
+
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertEqual(actual["name"], "~#E1b:" + self.handler.crypter.encrypt("Alice"))
+        legacy, _ = EncryptionHandler(crypter=Base64Crypter()).encrypt_payload(self.payload)
+        saved = len(EncryptionHandler.SENTINEL) - self.handler.ENVELOPE_SIZE
+        for key in self.payload:
+            self.assertEqual(len(legacy[key]) - len(actual[key]), saved)
+
+    def test_decrypt_payload_decrypts_both_envelopes_whatever_the_setting(self):
+        compact, _ = self.handler.encrypt_payload(self.payload)
+        legacy, _ = EncryptionHandler(crypter=Base64Crypter()).encrypt_payload(self.payload)
+        mixed = {"name": compact["name"], "age": legacy["age"], "metadata": compact["metadata"], "clear": "~#E1b"}
+
+        for handler in (self.handler, EncryptionHandler(crypter=Base64Crypter())):
+            actual, status = handler.decrypt_payload(mixed)
+
+            self.assertEqual(status, HTTPStatus.OK)
+            self.assertDictEqual(actual, {**self.payload, "clear": "~#E1b"})
+
+    def test_decrypt_payload_returns_BADREQUEST_on_other_algorithm(self):
+        aead = EncryptionHandler(crypter=AEADCrypter(key=bytes(AEADCrypter.KEY_SIZE)), envelope="compact")
+        encrypted, _ = aead.encrypt_payload(self.payload)
+        self.assertTrue(encrypted["name"].startswith("~#E1a:"))
+
+        _, status = self.handler.decrypt_payload({"name": encrypted["name"]})
+
+        self.assertEqual(status, HTTPStatus.BAD_REQUEST)
+
+    def test_decrypt_payload_returns_envelope_like_clear_values_unchanged(self):
+        # Strings shaped like an envelope with an unknown version or algorithm were not encrypted by us
+        payload = {"price": "~EUR:100", "version": "~#E2b:" + self.handler.crypter.encrypt("Alice"), "alg": "~#E1z:1"}
+
+        for handler in (self.handler, EncryptionHandler(crypter=Base64Crypter())):
+            with self.subTest(envelope=handler.envelope):
+                actual, status = handler.decrypt_payload(payload)
+
+                self.assertEqual(status, HTTPStatus.OK)
+                self.assertDictEqual(actual, payload)
+
+    def test_envelope_survives_pickling(self):
+        handler = copy.deepcopy(self.handler)
+
+        self.assertEqual(handler.prefix, "~#E1b:")
+
+    def test_unknown_envelope_raises_VALUEERROR(self):
+        with self.assertRaises(ValueError):
+            EncryptionHandler(crypter=Base64Crypter(), envelope="short")
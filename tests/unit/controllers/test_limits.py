@@ -0,0 +1,114 @@
+from http import HTTPStatus
+import io
+from unittest import TestCase
+from unittest.mock import patch
+
+from flask import Flask, request
+from werkzeug.test import EnvironBuilder
+
+from api.controllers.limits import PEEK_SIZE, limit_request, peek_first_byte
+
+
+class UnreadableStream(io.RawIOBase):
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        raise AssertionError("The body must not be read")
+
+
+class TestPeekFirstByte(TestCase):
+
+    def peek(self, body: bytes, content_length=None, terminated=False):
+        environ = {"wsgi.input": io.BytesIO(body)}
+        if terminated:
+            environ["wsgi.input_terminated"] = True
+        found = peek_first_byte(environ, len(body) if content_length is None and not terminated else content_length)
+        return found, environ["wsgi.input"].read()
+
+    def test_returns_first_significant_byte_and_keeps_body_readable(self):
+        for body, expected in ((b'{"a": 1}', b"{"), (b' \r\n\t[1, 2]', b"["), (b"x" * 10000, b"x")):
+            with self.subTest(body=body[:10]):
+                found, replayed = self.peek(body)
+
+                self.assertEqual(found, expected)
+                self.assertEqual(replayed, body)
+
+    def test_returns_empty_for_blank_body_and_none_when_undecided(self):
+        self.assertEqual(self.peek(b"")[0], b"")
+        self.assertEqual(self.peek(b"   ")[0], b"")
+        self.assertEqual(self.peek(b"  ", terminated=True)[0], b"")
+        self.assertIsNone(self.peek(b" " * PEEK_SIZE + b"{}")[0])
+
+    def test_returns_none_without_reading_body_of_unknown_end(self):
+        environ = {"wsgi.input": UnreadableStream()}
+
+        self.assertIsNone(peek_first_byte(environ, None))
+
+
+class TestLimitRequest(TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.calls = 0
+
+        @self.app.route("/object", methods=["POST"])
+        @limit_request(max_length=100, first_byte=b"{")
+        def object_route():
+            self.calls += 1
+            return {"body": request.get_data(as_text=True)}
+
+        @self.app.route("/unlimited", methods=["POST"])
+        @limit_request(max_length=0)
+        def unlimited_route():
+            return {"size": len(request.get_data())}
+
+        self.client = self.app.test_client()
+
+    def test_valid_body_reaches_view_unchanged(self):
+        response = self.client.post("/object", data=b'  {"a": 1}', content_type="application/json")
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.get_json()["body"], '  {"a": 1}')
+
+    def test_oversized_body_is_rejected_before_read(self):
+        environ = {"wsgi.input": UnreadableStream(), "CONTENT_LENGTH": "101", "CONTENT_TYPE": "application/json"}
+
+        response = self.client.post("/object", environ_overrides=environ)
+
+        self.assertEqual(response.status_code, HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        self.assertIn("error", response.get_json())
+
+    def test_body_without_length_is_cut_at_limit(self):
+        environ = EnvironBuilder(path="/object", method="POST", data=b"{" + b" " * 200 + b"}",
+                                 content_type="application/json").get_environ()
+        # As servers handling chunked bodies do
+        del environ["CONTENT_LENGTH"]
+        environ["wsgi.input_terminated"] = True
+
+        response = self.app.response_class.from_app(self.app, environ)
+
+        self.assertEqual(response.status_code, HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
+    def test_unexpected_first_byte_is_rejected_before_parsing(self):
+        for body in (b"[1, 2]", b'"string"', b"  null", b"not json"):
+            with self.subTest(body=body):
+                response = self.client.post("/object", data=body, content_type="application/json")
+
+                self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+                self.assertEqual(response.get_json(), {"error": "Input is not a valid JSON"})
+        self.assertEqual(self.calls, 0)
+
+    def test_first_byte_is_not_checked_for_other_media_types(self):
+        response = self.client.post("/object", data=b"[1, 2]", content_type="application/msgpack")
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_route_limit_is_overridden_by_setting(self):
+        with patch.dict("api.controllers.limits.MAX_CONTENT_LENGTHS", {"unlimited_route": 10}):
+            response = self.client.post("/unlimited", data=b"x" * 11)
+        self.assertEqual(response.status_code, HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
+        response = self.client.post("/unlimited", data=b"x" * 1000)
+        self.assertEqual(response.get_json(), {"size": 1000})
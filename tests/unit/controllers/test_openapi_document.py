@@ -0,0 +1,94 @@
+from gzip import decompress
+from http import HTTPStatus
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import Mock
+
+from flask import Flask, request
+
+from api.controllers.openapi import OpenAPIDocument
+
+
+mock_app = Flask(__name__)
+
+
+class TestOpenAPIDocument(TestCase):
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "openapi.json")
+        self.build = Mock(return_value={"openapi": "3.0.2", "paths": {}})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get(self, document, headers=None):
+        with mock_app.test_request_context("/api/swagger.json", headers=headers or {}):
+            return document.response(request)
+
+    def test_document_is_read_from_artifact_without_building(self):
+        with open(self.path, "w") as file:
+            file.write('{"openapi":"3.0.2","paths":{"/api/sign":{}}}')
+        document = OpenAPIDocument(self.path, self.build)
+
+        response = self.get(document)
+
+        self.build.assert_not_called()
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn("/api/sign", response.get_json()["paths"])
+
+    def test_document_is_built_once_when_artifact_is_missing(self):
+        document = OpenAPIDocument(self.path, self.build)
+
+        self.get(document)
+        response = self.get(document)
+
+        self.build.assert_called_once()
+        self.assertDictEqual(json.loads(response.get_data()), self.build.return_value)
+
+    def test_document_is_built_when_artifact_is_stale(self):
+        with open(self.path, "w") as file:
+            file.write('{"openapi":"3.0.2","paths":{},"x-source-fingerprint":"old"}')
+        self.build.return_value = {"openapi": "3.0.2", "paths": {"/api/sign": {}}, "x-source-fingerprint": "new"}
+        document = OpenAPIDocument(self.path, self.build, fingerprint=lambda: "new")
+
+        response = self.get(document)
+
+        self.build.assert_called_once()
+        self.assertIn("/api/sign", response.get_json()["paths"])
+
+    def test_document_is_read_from_artifact_with_current_fingerprint(self):
+        with open(self.path, "w") as file:
+            file.write('{"openapi":"3.0.2","paths":{"/api/sign":{}},"x-source-fingerprint":"new"}')
+        document = OpenAPIDocument(self.path, self.build, fingerprint=lambda: "new")
+
+        response = self.get(document)
+
+        self.build.assert_not_called()
+        self.assertIn("/api/sign", response.get_json()["paths"])
+
+    def test_document_is_loaded_lazily(self):
+        OpenAPIDocument(self.path, self.build)
+
+        self.build.assert_not_called()
+
+    def test_response_is_NOTMODIFIED_with_same_etag(self):
+        document = OpenAPIDocument(self.path, self.build)
+        etag = self.get(document).headers["ETag"]
+
+        response = self.get(document, {"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_response_is_gzipped_when_accepted(self):
+        document = OpenAPIDocument(self.path, self.build)
+        plain = self.get(document)
+
+        response = self.get(document, {"Accept-Encoding": "gzip, deflate"})
+
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertNotEqual(response.headers["ETag"], plain.headers["ETag"])
+        self.assertEqual(decompress(response.get_data()), plain.get_data())
@@ -0,0 +1,40 @@
+from unittest import TestCase
+from flask import Flask
+
+from api.controllers.encryption import EncryptionHandler
+from api.controllers.registry import HandlerRegistry, get_registry
+from api.controllers.signature import SignatureHandler
+from api.helpers.crypters import RootCrypter
+
+
+class TestHandlerRegistry(TestCase):
+
+    def test_registry_builds_handlers_once(self):
+        registry = HandlerRegistry()
+
+        self.assertIsInstance(registry.encryption, EncryptionHandler)
+        self.assertIsInstance(registry.signature, SignatureHandler)
+
+    def test_registry_uses_given_algorithm_helpers(self):
+        crypter = RootCrypter()
+
+        registry = HandlerRegistry(crypter=crypter)
+
+        self.assertIs(registry.encryption.crypter, crypter)
+
+    def test_get_registry_returns_registry_attached_to_app(self):
+        app = Flask(__name__)
+        registry = HandlerRegistry()
+        registry.init_app(app)
+
+        with app.app_context():
+            self.assertIs(get_registry(), registry)
+
+    def test_get_registry_returns_same_default_registry_without_app(self):
+        app = Flask(__name__)
+
+        with app.app_context():
+            first = get_registry()
+        second = get_registry()
+
+        self.assertIs(first, second)
@@ -1,10 +1,14 @@
 from unittest import TestCase
+import json
 from unittest.mock import patch
 from http import HTTPStatus
 
 from api.config.fields import SignatureFields
 from api.controllers.signature import SignatureHandler
-from api.helpers.signer import RootSigner
+from api.helpers.cache import SignatureCache, VerifiedIndex
+from api.helpers.keyring import KeyRing
+from api.helpers.merkle import MerkleTree
+from api.helpers.signer import HMACSigner, RootSigner
 
 
 class TestSignatureHandlerCanonicalise(TestCase):
@@ -64,7 +68,7 @@ class TestSignatureHandlerMainMethods(TestCase):
 
         self.assertDictEqual(actual, expected)
         self.assertEqual(status, HTTPStatus.OK)
-        mo_gen_sig.assert_called_once_with(payload)
+        mo_gen_sig.assert_called_once_with(payload, size_hint=None)
 
     @patch.object(SignatureHandler, "generate_signature")
     def test_verify_payload_returns_NOCONTENT_for_valid_payload(self, mo_gen_sig):
@@ -78,7 +82,7 @@ class TestSignatureHandlerMainMethods(TestCase):
 
         self.assertEqual(actual, "")
         self.assertEqual(status, HTTPStatus.NO_CONTENT)
-        mo_gen_sig.assert_called_once_with({})
+        mo_gen_sig.assert_called_once_with({}, size_hint=None)
 
     @patch.object(SignatureHandler, "generate_signature")
     def test_verify_payload_returns_BADREQUEST_for_invalid_payload(self, mo_gen_sig):
@@ -91,4 +95,232 @@ class TestSignatureHandlerMainMethods(TestCase):
         _, status = self.handler.verify_payload(payload)
 
         self.assertEqual(status, HTTPStatus.BAD_REQUEST)
-        mo_gen_sig.assert_called_once_with({})
+        mo_gen_sig.assert_called_once_with({}, size_hint=None)
+
+
+class TestSignatureHandlerCache(TestCase):
+
+    def setUp(self):
+        self.cache = SignatureCache(max_entries=10, max_bytes=1024)
+        self.handler = SignatureHandler(signer=HMACSigner(secret="key"), cache=self.cache)
+
+    def sign(self, body: bytes):
+        cache_key = self.handler.signature_cache_key(body, "application/json")
+        signature = self.handler.cached_signature(cache_key)
+        if signature is None:
+            signature = self.handler.sign_payload(json.loads(body), cache_key=cache_key)[0][SignatureFields.signature]
+        return signature
+
+    def test_cached_signature_answers_identical_body_without_signing(self):
+        with patch.object(HMACSigner, "signature", wraps=self.handler.signer.signature) as mo_signer:
+            first = self.sign(b'{"a": 1}')
+            second = self.sign(b'{"a": 1}')
+
+        self.assertEqual(first, second)
+        mo_signer.assert_called_once()
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_cached_signature_misses_other_body_of_same_document(self):
+        self.sign(b'{"a": 1}')
+
+        cache_key = self.handler.signature_cache_key(b'{"a":1}', "application/json")
+
+        self.assertIsNone(self.handler.cached_signature(cache_key))
+
+    def test_cached_signature_does_not_return_signature_from_previous_key(self):
+        first = self.sign(b'{"a": 1}')
+
+        self.handler.signer = HMACSigner(secret="rotated key")
+        second = self.sign(b'{"a": 1}')
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(second, SignatureHandler(signer=HMACSigner(secret="rotated key")).generate_signature({"a": 1}))
+
+    def test_signature_cache_key_is_none_without_cache(self):
+        handler = SignatureHandler(signer=HMACSigner(secret="key"))
+
+        self.assertIsNone(handler.signature_cache_key(b"{}", "application/json"))
+        self.assertIsNone(handler.cached_signature(None))
+
+
+class TestSignatureHandlerKeyRotation(TestCase):
+
+    def setUp(self):
+        self.keys = {"active": "k1", "keys": {"k1": "one"}}
+        self.signer = HMACSigner(keyring=KeyRing(secret="legacy", keys=json.dumps(self.keys)))
+        self.cache = SignatureCache(max_entries=10, max_bytes=1024)
+        self.handler = SignatureHandler(signer=self.signer, cache=self.cache)
+
+    def verify(self, data, signature):
+        return self.handler.verify_payload({SignatureFields.data: data, SignatureFields.signature: signature})[1]
+
+    def test_verify_payload_verifies_signatures_of_each_key(self):
+        payload = {"a": 1}
+        legacy = HMACSigner(secret="legacy").signature(self.handler.canonicalise(payload))
+
+        self.assertEqual(self.verify(payload, self.handler.generate_signature(payload)), HTTPStatus.NO_CONTENT)
+        self.assertEqual(self.verify(payload, legacy), HTTPStatus.NO_CONTENT)
+
+    def test_verify_payload_goes_straight_to_signature_key(self):
+        payload = {"a": 1}
+        signature = self.handler.generate_signature(payload)
+
+        with patch.object(HMACSigner, "signature", wraps=self.signer.signature) as mo_signer:
+            self.verify(payload, signature.replace("k1:", "k1:0"))
+
+        mo_signer.assert_called_once_with(self.handler.canonicalise(payload), key_id="k1")
+
+    def test_verify_payload_returns_BADREQUEST_on_unknown_key(self):
+        self.assertEqual(self.verify({"a": 1}, "k9:" + "0" * 64), HTTPStatus.BAD_REQUEST)
+
+    def test_signatures_of_rotated_out_key_stay_valid(self):
+        payload = {"a": 1}
+        old = self.handler.generate_signature(payload)
+
+        self.keys = {"active": "k2", "keys": {"k1": "one", "k2": "two"}}
+        self.handler.signer = HMACSigner(keyring=KeyRing(secret="legacy", keys=json.dumps(self.keys)))
+        new = self.handler.generate_signature(payload)
+
+        self.assertTrue(new.startswith("k2:"))
+        self.assertEqual(self.verify(payload, old), HTTPStatus.NO_CONTENT)
+        self.assertEqual(self.verify(payload, new), HTTPStatus.NO_CONTENT)
+
+
+class TestSignatureHandlerStreaming(TestCase):
+
+    def setUp(self):
+        self.handler = SignatureHandler(signer=HMACSigner(secret="key"), stream_threshold=1024)
+
+    def test_generate_signature_streams_canonical_form_above_threshold(self):
+        payload = {"b": ["é" * 100] * 50, "a": {"z": 1.5, "y": None}}
+
+        with patch.object(SignatureHandler, "canonicalise", wraps=self.handler.canonicalise) as mo_canonicalise:
+            streamed = self.handler.generate_signature(payload, size_hint=4096)
+        in_memory = self.handler.generate_signature(payload, size_hint=512)
+
+        mo_canonicalise.assert_not_called()
+        self.assertEqual(streamed, in_memory)
+
+    def test_verify_payload_verifies_streamed_signature(self):
+        payload = {"a": list(range(1000))}
+        signature = self.handler.generate_signature(payload)
+
+        _, status = self.handler.verify_payload({SignatureFields.data: payload, SignatureFields.signature: signature},
+                                                size_hint=8192)
+
+        self.assertEqual(status, HTTPStatus.NO_CONTENT)
+
+
+class TestSignatureHandlerMerkle(TestCase):
+
+    def setUp(self):
+        self.handler = SignatureHandler(signer=HMACSigner(secret="key"))
+        self.document = {"name": "Alice", "age": 32, "address": {"city": "Paris"}, "tags": ["a", "b"], "id": 7}
+        self.signed, _ = self.handler.sign_merkle(self.document)
+
+    def partial(self, members, **fields):
+        payload = {
+            SignatureFields.signature: self.signed[SignatureFields.signature],
+            SignatureFields.root: self.signed[SignatureFields.root],
+            SignatureFields.proofs: {key: self.signed[SignatureFields.proofs][key] for key in members},
+            SignatureFields.data: members
+        }
+        payload.update(fields)
+        return payload
+
+    def test_sign_merkle_returns_BADREQUEST_on_non_object(self):
+        _, status = self.handler.sign_merkle([1, 2])
+
+        self.assertEqual(status, HTTPStatus.BAD_REQUEST)
+
+    def test_merkle_signature_differs_from_plain_signature(self):
+        self.assertNotEqual(self.signed[SignatureFields.signature], self.handler.generate_signature(self.document))
+
+    def test_verify_merkle_verifies_whole_object(self):
+        payload = {SignatureFields.data: self.document,
+                   SignatureFields.signature: self.signed[SignatureFields.signature]}
+
+        self.assertEqual(self.handler.verify_merkle(payload)[1], HTTPStatus.NO_CONTENT)
+        payload[SignatureFields.data] = {**self.document, "age": 33}
+        self.assertEqual(self.handler.verify_merkle(payload)[1], HTTPStatus.BAD_REQUEST)
+
+    def test_verify_merkle_verifies_single_members(self):
+        for key, value in self.document.items():
+            self.assertEqual(self.handler.verify_merkle(self.partial({key: value}))[1], HTTPStatus.NO_CONTENT)
+
+    def test_verify_merkle_returns_BADREQUEST_on_tampered_member(self):
+        self.assertEqual(self.handler.verify_merkle(self.partial({"age": 33}))[1], HTTPStatus.BAD_REQUEST)
+
+    def test_verify_merkle_returns_BADREQUEST_on_forged_root(self):
+        payload = self.partial({"age": 33})
+        tree = MerkleTree({**self.document, "age": 33}, self.handler.codec)
+        payload.update({SignatureFields.root: tree.root.hex(), SignatureFields.proofs: {"age": tree.proof("age")}})
+
+        self.assertEqual(self.handler.verify_merkle(payload)[1], HTTPStatus.BAD_REQUEST)
+
+    def test_verify_merkle_returns_BADREQUEST_on_malformed_proofs(self):
+        for fields in ({SignatureFields.proofs: {}}, {SignatureFields.proofs: []}, {SignatureFields.root: "xyz"},
+                       {SignatureFields.data: {}}):
+            self.assertEqual(self.handler.verify_merkle(self.partial({"age": 32}, **fields))[1],
+                             HTTPStatus.BAD_REQUEST, fields)
+
+    def test_update_merkle_signs_same_root_as_full_signature(self):
+        updated, status = self.handler.update_merkle(self.partial({"age": 32}, update={"age": 33}))
+        expected, _ = self.handler.sign_merkle({**self.document, "age": 33})
+
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertEqual(updated[SignatureFields.root], expected[SignatureFields.root])
+        self.assertEqual(updated[SignatureFields.signature], expected[SignatureFields.signature])
+        self.assertEqual(updated[SignatureFields.proofs], {"age": expected[SignatureFields.proofs]["age"]})
+
+    def test_update_merkle_returns_BADREQUEST_on_invalid_previous_value(self):
+        _, status = self.handler.update_merkle(self.partial({"age": 31}, update={"age": 33}))
+
+        self.assertEqual(status, HTTPStatus.BAD_REQUEST)
+
+    def test_update_merkle_returns_BADREQUEST_unless_single_member(self):
+        for data, update in (({"age": 32}, {"name": "Bob"}), ({"age": 32, "id": 7}, {"age": 33, "id": 8}),
+                             ({"age": 32}, None)):
+            _, status = self.handler.update_merkle(self.partial(data, update=update))
+            self.assertEqual(status, HTTPStatus.BAD_REQUEST, update)
+
+
+class TestSignatureHandlerVerifiedIndex(TestCase):
+
+    def setUp(self):
+        self.keys = {"active": "k1", "keys": {"k1": "one"}}
+        self.signer = HMACSigner(keyring=KeyRing(keys=json.dumps(self.keys)))
+        self.index = VerifiedIndex(max_entries=16)
+        self.handler = SignatureHandler(signer=self.signer, verified_index=self.index)
+        self.payload = {SignatureFields.data: {"a": 1}, SignatureFields.signature: self.signer.signature('{"a":1}')}
+        self.body = json.dumps(self.payload).encode()
+
+    def test_verify_payload_records_verified_key(self):
+        key = self.handler.verified_key(self.body, "application/json")
+        self.assertFalse(self.handler.is_verified(key))
+
+        self.assertEqual(self.handler.verify_payload(self.payload, verified_key=key)[1], HTTPStatus.NO_CONTENT)
+
+        self.assertTrue(self.handler.is_verified(self.handler.verified_key(self.body, "application/json")))
+        self.assertFalse(self.handler.is_verified(self.handler.verified_key(self.body, "application/cbor")))
+
+    def test_verify_payload_does_not_record_invalid_pairs(self):
+        payload = {**self.payload, SignatureFields.signature: "k1:" + "0" * 64}
+        key = self.handler.verified_key(json.dumps(payload).encode(), "application/json")
+
+        self.assertEqual(self.handler.verify_payload(payload, verified_key=key)[1], HTTPStatus.BAD_REQUEST)
+        self.assertFalse(self.handler.is_verified(key))
+
+    def test_key_rotation_invalidates_index(self):
+        key = self.handler.verified_key(self.body, "application/json")
+        self.handler.verify_payload(self.payload, verified_key=key)
+
+        self.handler.signer = HMACSigner(keyring=KeyRing(keys=json.dumps({"active": "k2", "keys": {"k2": "two"}})))
+
+        self.assertFalse(self.handler.is_verified(self.handler.verified_key(self.body, "application/json")))
+
+    def test_verified_key_is_none_without_index(self):
+        handler = SignatureHandler(signer=self.signer)
+
+        self.assertIsNone(handler.verified_key(self.body, "application/json"))
+        self.assertFalse(handler.is_verified(None))
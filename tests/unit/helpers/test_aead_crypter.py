@@ -0,0 +1,113 @@
+from unittest import TestCase, skipUnless
+from base64 import b64decode, b64encode
+import os
+import pickle
+
+from api.controllers.encryption import EncryptionHandler
+from api.helpers.crypters import AEADCrypter, AESGCM, Base64Crypter, DecryptionError, get_crypter
+
+
+@skipUnless(AESGCM is not None, "cryptography is not installed")
+class TestAEADCrypter(TestCase):
+
+    def setUp(self):
+        self.key = os.urandom(AEADCrypter.KEY_SIZE)
+        self.crypter = AEADCrypter(key=self.key, key_id="k1")
+        self.large = {"text": "x" * (3 * AEADCrypter.SEGMENT_SIZE)}
+
+    def test_decrypt_successfully_decrypts_an_encrypted_value(self):
+        for algorithm in AEADCrypter.ALGORITHMS:
+            crypter = AEADCrypter(key=self.key, key_id="k1", algorithm=algorithm)
+            for value in ({"who": "A person with no name."}, self.large, None):
+                with self.subTest(algorithm=algorithm, size=len(str(value))):
+                    self.assertEqual(crypter.decrypt(crypter.encrypt(value)), value)
+                    self.assertEqual(crypter.decrypt_bytes(crypter.encrypt_bytes(value)), value)
+
+    def test_decrypt_handles_segment_boundaries(self):
+        chunk = AEADCrypter.SEGMENT_SIZE - AEADCrypter.TAG_SIZE
+        for size in (chunk - 3, chunk - 2, chunk - 1, 2 * chunk - 2):
+            with self.subTest(size=size):
+                value = "x" * size
+                self.assertEqual(self.crypter.decrypt(self.crypter.encrypt(value)), value)
+
+    def test_encrypt_is_not_deterministic(self):
+        self.assertNotEqual(self.crypter.encrypt("value"), self.crypter.encrypt("value"))
+
+    def test_ciphertext_header_describes_algorithm_and_key(self):
+        raw = self.crypter.encrypt_bytes("value")
+
+        self.assertEqual(raw[0], AEADCrypter.ALGORITHMS["aes-256-gcm"])
+        self.assertEqual(raw[2:2 + raw[1]], b"k1")
+        self.assertEqual(b64decode(self.crypter.encrypt("value"))[:4], raw[:4])
+
+    def test_decrypt_raises_DecryptionError_on_tampered_ciphertext(self):
+        raw = bytearray(self.crypter.encrypt_bytes(self.large))
+        header_size = 12
+        tampered = {
+            "flipped byte": bytes(raw[:-1]) + bytes([raw[-1] ^ 1]),
+            "dropped segment": bytes(raw[:header_size + AEADCrypter.SEGMENT_SIZE]),
+            "swapped segments": bytes(raw[:header_size] + raw[header_size + AEADCrypter.SEGMENT_SIZE:]
+                                      + raw[header_size:header_size + AEADCrypter.SEGMENT_SIZE]),
+            "other nonce": bytes(raw[:5]) + bytes([raw[5] ^ 1]) + bytes(raw[6:]),
+            "too short": bytes(raw[:header_size]),
+        }
+        for name, ciphertext in tampered.items():
+            with self.subTest(name):
+                with self.assertRaises(DecryptionError):
+                    self.crypter.decrypt_bytes(ciphertext)
+                with self.assertRaises((DecryptionError, ValueError)):
+                    self.crypter.decrypt(b64encode(ciphertext).decode("ascii"))
+
+    def test_decrypt_from_decrypts_large_value_at_offset(self):
+        encrypted = self.crypter.encrypt_prefixed(self.large, "prefix:")
+
+        self.assertTrue(encrypted.startswith("prefix:"))
+        self.assertEqual(self.crypter.decrypt_from(encrypted, len("prefix:")), self.large)
+
+    def test_decrypt_from_raises_DecryptionError_on_invalid_text(self):
+        encrypted = self.crypter.encrypt("value")
+        for name, text in (("non ascii", "§" * 4 + encrypted[4:]), ("padded header", "QQ==" + encrypted[4:]),
+                           ("not padded", encrypted[:-1]), ("empty", "")):
+            with self.subTest(name):
+                with self.assertRaises(DecryptionError):
+                    self.crypter.decrypt_from("p:" + text, 2)
+
+    def test_decrypt_raises_DecryptionError_on_other_key_or_algorithm(self):
+        others = {
+            "other key": AEADCrypter(key=os.urandom(AEADCrypter.KEY_SIZE), key_id="k1"),
+            "other key id": AEADCrypter(key=self.key, key_id="k2"),
+            "other algorithm": AEADCrypter(key=self.key, key_id="k1", algorithm="chacha20-poly1305"),
+        }
+        for name, crypter in others.items():
+            with self.subTest(name):
+                with self.assertRaises(DecryptionError):
+                    crypter.decrypt(self.crypter.encrypt("value"))
+
+    def test_crypter_is_picklable(self):
+        crypter = pickle.loads(pickle.dumps(self.crypter))
+
+        self.assertEqual(crypter.decrypt(self.crypter.encrypt("value")), "value")
+
+    def test_init_raises_ValueError_on_invalid_key(self):
+        with self.assertRaises(ValueError):
+            AEADCrypter(key=b"too short")
+
+    def test_handler_returns_BADREQUEST_on_tampered_value(self):
+        handler = EncryptionHandler(crypter=self.crypter)
+        encrypted, _ = handler.encrypt_payload({"key": "value"})
+
+        decrypted, _ = handler.decrypt_payload(encrypted)
+        self.assertDictEqual(decrypted, {"key": "value"})
+
+        _, status = handler.decrypt_payload({"key": encrypted["key"][:-8] + "AAAAAAAA"})
+        self.assertEqual(status, 400)
+
+
+class TestGetCrypter(TestCase):
+
+    def test_get_crypter_returns_crypter_by_name(self):
+        self.assertIsInstance(get_crypter("base64"), Base64Crypter)
+
+    def test_get_crypter_raises_ValueError_on_unknown_name(self):
+        with self.assertRaises(ValueError):
+            get_crypter("rot13")
@@ -1,4 +1,5 @@
 from unittest import TestCase
+from base64 import b64decode
 from binascii import Error as BinasciiError
 from json import JSONDecodeError
 
@@ -39,3 +40,39 @@ class TestBase64Crypter(TestCase):
             actual = self.crypter.decrypt(bs64_repr)
 
             self.assertDictEqual(actual, original)
+
+    def test_decrypt_keeps_integers_above_64_bits(self):
+        original = {"big": 123456789012345678901234567890, "negative": -2 ** 70}
+
+        actual = self.crypter.decrypt(self.crypter.encrypt(original))
+
+        self.assertEqual(repr(actual), repr(original))
+
+    def test_encrypt_bytes_is_the_raw_form_of_encrypt(self):
+        original = {"who": "A person with no name."}
+
+        raw = self.crypter.encrypt_bytes(original)
+
+        self.assertEqual(b64decode(self.crypter.encrypt(original)), raw)
+        self.assertDictEqual(self.crypter.decrypt_bytes(raw), original)
+
+    def test_encrypt_prefixed_prepends_prefix_to_encrypt_output(self):
+        original = {"who": "A person with no name."}
+
+        actual = self.crypter.encrypt_prefixed(original, "prefix:")
+
+        self.assertEqual(actual, "prefix:" + self.crypter.encrypt(original))
+
+    def test_decrypt_from_decrypts_value_at_offset(self):
+        original = {"who": "A person with no name."}
+
+        actual = self.crypter.decrypt_from("prefix:" + self.crypter.encrypt(original), len("prefix:"))
+
+        self.assertDictEqual(actual, original)
+
+    def test_decrypt_from_raises_errors_on_invalid_inputs(self):
+        invalid = (("p:Apple, banana", BinasciiError), ("p:§§", UnicodeEncodeError), ("p:YQ==YQ==", BinasciiError))
+        for value, error in invalid:
+            with self.subTest(value=value):
+                with self.assertRaises(error):
+                    self.crypter.decrypt_from(value, 2)
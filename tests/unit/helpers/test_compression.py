@@ -0,0 +1,151 @@
+import gzip
+from http import HTTPStatus
+import io
+from unittest import TestCase
+
+from flask import Flask, Response, request
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+from api.helpers.compression import ENCODINGS, CompressionMiddleware, DecompressingStream, brotli, zstandard
+
+AVAILABLE = [name for name, encoding in ENCODINGS.items() if encoding.available]
+
+
+def decompress(encoding: str, data: bytes) -> bytes:
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return brotli.decompress(data)
+
+
+def compress(encoding: str, data: bytes) -> bytes:
+    compressor = ENCODINGS[encoding].compressor()
+    return compressor.compress(data) + compressor.finish()
+
+
+class TestEncodings(TestCase):
+
+    def test_every_encoding_roundtrips_by_chunks(self):
+        data = b'{"name":"--- BEGIN CRYPTED MESSAGE ---IkFsaWNlIg=="}' * 5000
+        for name in AVAILABLE:
+            encoding = ENCODINGS[name]
+            with self.subTest(encoding=name):
+                compressor = encoding.compressor()
+                compressed = b"".join(compressor.compress(data[i:i + 4096]) + compressor.flush()
+                                      for i in range(0, len(data), 4096)) + compressor.finish()
+
+                reader = encoding.reader(io.BytesIO(compressed))
+                chunks = iter(lambda: reader.read(1000), b"")
+
+                self.assertEqual(decompress(name, compressed), data)
+                self.assertEqual(b"".join(chunks), data)
+                self.assertLess(len(compressed), len(data) / 10)
+
+
+class TestDecompressingStream(TestCase):
+
+    def test_read_raises_REQUESTENTITYTOOLARGE_above_max_size(self):
+        for name in AVAILABLE:
+            with self.subTest(encoding=name):
+                stream = DecompressingStream(io.BytesIO(compress(name, b"0" * 10 ** 6)), ENCODINGS[name], 1000)
+
+                with self.assertRaises(RequestEntityTooLarge):
+                    stream.read()
+
+    def test_read_raises_BADREQUEST_on_corrupt_or_truncated_body(self):
+        for name in AVAILABLE:
+            bodies = [b"not compressed at all"]
+            # The zstd stream reader ends silently on a truncated frame, the truncated document is rejected by parsing
+            if name != "zstd":
+                bodies.append(compress(name, bytes(range(256)) * 100)[:-20])
+            for body in bodies:
+                with self.subTest(encoding=name, body=body[:10]):
+                    stream = DecompressingStream(io.BytesIO(body), ENCODINGS[name], 10 ** 6)
+
+                    with self.assertRaises(BadRequest):
+                        stream.read()
+
+
+class TestCompressionMiddleware(TestCase):
+
+    def setUp(self):
+        app = Flask(__name__)
+
+        @app.route("/echo", methods=["POST"])
+        def echo():
+            return {"body": request.get_data(as_text=True)}
+
+        @app.route("/big")
+        def big():
+            return {"value": "x" * 5000}
+
+        @app.route("/small")
+        def small():
+            return {"value": "x"}
+
+        @app.route("/encoded")
+        def encoded():
+            return Response(gzip.compress(b'{"a":1}' * 1000), headers={"Content-Encoding": "gzip"},
+                            mimetype="application/json")
+
+        @app.route("/stream")
+        def stream():
+            return Response((f'{{"line":{index}}}\n' for index in range(1000)), mimetype="application/x-ndjson")
+
+        @app.route("/binary")
+        def binary():
+            return Response(b"\0" * 5000, mimetype="application/octet-stream")
+
+        app.wsgi_app = CompressionMiddleware(app.wsgi_app, min_size=1024, max_decompressed_size=10 ** 5)
+        self.client = app.test_client()
+
+    def test_response_is_compressed_with_preferred_accepted_encoding(self):
+        for accept, expected in (("gzip", "gzip"), ("gzip, br", "br"), ("gzip, br, zstd", "zstd"),
+                                 ("zstd;q=0.5, gzip", "gzip")):
+            if expected not in AVAILABLE:
+                continue
+            with self.subTest(accept=accept):
+                response = self.client.get("/big", headers={"Accept-Encoding": accept})
+
+                self.assertEqual(response.headers["Content-Encoding"], expected)
+                self.assertIn("Accept-Encoding", response.headers["Vary"])
+                self.assertNotIn("Content-Length", response.headers)
+                self.assertEqual(decompress(expected, response.get_data()), b'{"value":"' + b"x" * 5000 + b'"}\n')
+
+    def test_response_is_not_compressed_when_small_encoded_binary_or_not_accepted(self):
+        for path, headers in (("/small", {"Accept-Encoding": "gzip"}), ("/big", {}),
+                              ("/big", {"Accept-Encoding": "identity"}), ("/binary", {"Accept-Encoding": "gzip"})):
+            with self.subTest(path=path, headers=headers):
+                response = self.client.get(path, headers=headers)
+
+                self.assertNotIn("Content-Encoding", response.headers)
+
+        response = self.client.get("/encoded", headers={"Accept-Encoding": "br"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.get_data()), b'{"a":1}' * 1000)
+
+    def test_streamed_response_is_compressed_by_chunks(self):
+        response = self.client.get("/stream", headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        lines = gzip.decompress(response.get_data()).decode().splitlines()
+        self.assertEqual(len(lines), 1000)
+
+    def test_request_body_is_decompressed(self):
+        body = b"x" * 5000
+        for name in AVAILABLE:
+            with self.subTest(encoding=name):
+                response = self.client.post("/echo", data=compress(name, body), headers={"Content-Encoding": name})
+
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertEqual(response.get_json()["body"], body.decode())
+
+    def test_request_errors(self):
+        for body, encoding, status in ((compress("gzip", b"x" * 10 ** 6), "gzip", HTTPStatus.REQUEST_ENTITY_TOO_LARGE),
+                                       (b"not gzip", "gzip", HTTPStatus.BAD_REQUEST),
+                                       (b"x", "compress", HTTPStatus.UNSUPPORTED_MEDIA_TYPE)):
+            with self.subTest(encoding=encoding, status=status):
+                response = self.client.post("/echo", data=body, headers={"Content-Encoding": encoding})
+
+                self.assertEqual(response.status_code, status)
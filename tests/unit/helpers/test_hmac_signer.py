@@ -1,6 +1,8 @@
 from unittest import TestCase
+import json
 
-from api.helpers.signer import HMACSigner
+from api.helpers.keyring import KeyRing
+from api.helpers.signer import HMACSigner, UnknownKeyError
 
 
 class TestHMACSigner(TestCase):
@@ -25,3 +27,51 @@ class TestHMACSigner(TestCase):
         with self.subTest("Different messages provide different signatures"):
             signature3 = self.signer.signature(message2)
             self.assertNotEqual(signature1, signature3)
+
+    def test_signature_matches_reference_hmac_with_given_secret(self):
+        signer = HMACSigner(secret="key")
+        message = "The quick brown fox jumps over the lazy dog"
+
+        with self.subTest("First signature uses the pre-keyed HMAC"):
+            signature = signer.signature(message)
+            self.assertEqual(signature, "f7bc83f430538424b13298e6aa6fb143ef4d59a14946175997479dbc2d1a3cd8")
+
+        with self.subTest("Pre-keyed HMAC is not altered by previous signatures"):
+            self.assertEqual(signer.signature(message), signature)
+
+
+class TestHMACSignerKeyRing(TestCase):
+
+    def setUp(self):
+        keys = {"active": "k2", "keys": {"k1": "one", "k2": "two"}}
+        self.signer = HMACSigner(keyring=KeyRing(secret="key", keys=json.dumps(keys)))
+
+    def test_signature_is_prefixed_with_active_key_id(self):
+        signature = self.signer.signature("message")
+
+        self.assertTrue(signature.startswith("k2:"))
+        self.assertEqual(self.signer.split_signature(signature), ("k2", signature[3:]))
+
+    def test_signature_with_legacy_key_is_bare_hex_digest(self):
+        message = "The quick brown fox jumps over the lazy dog"
+
+        signature = self.signer.signature(message, key_id=KeyRing.LEGACY_KEY_ID)
+
+        self.assertEqual(signature, "f7bc83f430538424b13298e6aa6fb143ef4d59a14946175997479dbc2d1a3cd8")
+        self.assertEqual(self.signer.split_signature(signature), (KeyRing.LEGACY_KEY_ID, signature))
+
+    def test_signature_with_other_key_differs(self):
+        self.assertNotEqual(self.signer.signature("message", key_id="k1")[3:], self.signer.signature("message")[3:])
+
+    def test_signature_raises_UnknownKeyError_on_unknown_key(self):
+        with self.assertRaises(UnknownKeyError):
+            self.signer.signature("message", key_id="k3")
+
+    def test_signature_chunks_is_identical_to_signature(self):
+        message = "The quick brown fox jumps over the lazy dog"
+        chunks = [message[:10].encode(), message[10:].encode()]
+
+        for key_id in ("k1", None, KeyRing.LEGACY_KEY_ID):
+            with self.subTest(key_id=key_id):
+                self.assertEqual(self.signer.signature_chunks(iter(chunks), key_id=key_id),
+                                 self.signer.signature(message, key_id=key_id))
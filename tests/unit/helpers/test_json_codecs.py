@@ -0,0 +1,158 @@
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+from json import JSONDecodeError
+import random
+
+from api.helpers.codecs import OrjsonCodec, StdlibJSONCodec, get_codec, orjson
+
+
+PARITY_VALUES = [
+    {"b": 1, "a": 2, "A": 3, "": 4, "é": 5, "😀": 6, "￿": 7},
+    {"nested": {"z": [1, {"y": None, "x": True}], "a": False}},
+    {"escapes": "\"\\\n\t\b\f\r\x00\x1f\x7f  "},
+    {"unicode": "ça va 東京 😀"},
+    {"floats": [1.0, -0.0, 0.1, 1e16, 1e15, 1.5e-05, 0.0001, 1e-07, 1.7976931348623157e308, 5e-324]},
+    {"float in string": "1.5e-05", "dots": "a.b.c", "exponent": "1e7"},
+    {"ints": [0, -1, 2 ** 63 - 1, -2 ** 63, 2 ** 64, -2 ** 70]},
+    [],
+    {},
+    "string",
+    12,
+    None
+]
+
+
+def random_document(rng: random.Random, depth: int = 0):
+    """Build a random JSON document mixing all JSON types."""
+    kind = rng.randrange(7 if depth < 4 else 5)
+    if kind == 0:
+        return rng.randint(-2 ** 40, 2 ** 40)
+    if kind == 1:
+        return rng.choice([None, True, False])
+    if kind == 2:
+        return "".join(chr(rng.choice([rng.randrange(32, 127), rng.randrange(0x80, 0xd800)])) for _ in range(8))
+    if kind == 3:
+        return rng.random() * 10 ** rng.randint(-10, 20)
+    if kind == 4:
+        return "".join(rng.choice("abcAB\"\\\n") for _ in range(rng.randrange(5)))
+    if kind == 5:
+        return [random_document(rng, depth + 1) for _ in range(rng.randrange(5))]
+    return {str(random_document(rng, 4)): random_document(rng, depth + 1) for _ in range(rng.randrange(5))}
+
+
+@skipUnless(orjson, "orjson is not installed")
+class TestOrjsonCodecParity(TestCase):
+
+    def setUp(self):
+        self.reference = StdlibJSONCodec()
+        self.codec = OrjsonCodec()
+
+    def test_canonical_is_identical_to_stdlib(self):
+        for value in PARITY_VALUES:
+            with self.subTest(value=value):
+                self.assertEqual(self.codec.canonical(value), self.reference.canonical(value))
+
+    def test_canonical_is_identical_to_stdlib_for_non_finite_floats(self):
+        value = {"nan": float("nan"), "inf": [float("inf"), float("-inf")]}
+
+        self.assertEqual(self.codec.canonical(value), self.reference.canonical(value))
+
+    def test_canonical_does_not_fall_back_without_floats(self):
+        value = {"name": "Eve", "active": True, "deleted": False, "ids": [1, 2 ** 63 - 1], "version": "v1"}
+
+        with patch.object(StdlibJSONCodec, "canonical") as mo_canonical:
+            actual = self.codec.canonical(value)
+
+        mo_canonical.assert_not_called()
+        self.assertEqual(actual, self.reference.canonical(value))
+
+    def test_canonical_is_identical_to_stdlib_on_random_documents(self):
+        rng = random.Random(42)
+        for _ in range(500):
+            document = {"root": random_document(rng)}
+            self.assertEqual(self.codec.canonical(document), self.reference.canonical(document))
+
+    def test_encode_decode_roundtrip_matches_stdlib(self):
+        for value in PARITY_VALUES:
+            with self.subTest(value=value):
+                self.assertEqual(self.codec.decode(self.codec.encode(value)), value)
+                self.assertEqual(self.reference.decode(self.codec.encode(value)), value)
+
+    def test_decode_is_identical_to_stdlib(self):
+        for value in PARITY_VALUES + [{"big": 123456789012345678901234567890, "digits": "1234567890123456789"}]:
+            data = self.reference.encode(value)
+            for document in (data, data.decode("utf-8")):
+                with self.subTest(document=document):
+                    self.assertEqual(repr(self.codec.decode(document)), repr(self.reference.decode(document)))
+
+    def test_decode_keeps_integers_above_64_bits(self):
+        for data in (b"123456789012345678901234567890", b'{"a": [1, -9223372036854775809]}', b"[1.5, 2 ** 70]",
+                     b'{"a": 1e400, "b": 18446744073709551616}'):
+            with self.subTest(data=data):
+                try:
+                    expected = repr(self.reference.decode(data))
+                except ValueError:
+                    continue
+                self.assertEqual(repr(self.codec.decode(data)), expected)
+
+    def test_encode_decode_are_identical_to_stdlib_for_non_finite_floats(self):
+        data = b'{"nan": NaN, "inf": [Infinity, -Infinity], "none": null}'
+
+        self.assertEqual(repr(self.codec.decode(data)), repr(self.reference.decode(data)))
+        self.assertEqual(repr(self.codec.decode(data.decode("utf-8"))), repr(self.reference.decode(data)))
+        self.assertEqual(self.codec.encode(self.codec.decode(data)), self.reference.encode(self.reference.decode(data)))
+
+    def test_decode_is_identical_to_stdlib_on_random_documents(self):
+        rng = random.Random(42)
+        for _ in range(500):
+            data = self.reference.encode({"root": random_document(rng), "big": rng.randint(2 ** 63, 2 ** 80)})
+            self.assertEqual(repr(self.codec.decode(data)), repr(self.reference.decode(data)))
+
+    def test_decode_raises_JSONDecodeError_on_invalid_input(self):
+        for data in (b"{", b"\xff", "not json"):
+            with self.subTest(data=data):
+                with self.assertRaises(JSONDecodeError):
+                    self.codec.decode(data)
+
+
+class TestIterCanonical(TestCase):
+
+    def setUp(self):
+        self.codec = StdlibJSONCodec()
+
+    def test_iter_canonical_is_identical_to_canonical(self):
+        for value in PARITY_VALUES + [{"nan": float("nan"), "inf": [float("inf")]}]:
+            for chunk_size in (1, 7, 64 * 1024):
+                with self.subTest(value=value, chunk_size=chunk_size):
+                    chunks = self.codec.iter_canonical(value, chunk_size)
+                    self.assertEqual(b"".join(chunks), self.codec.canonical(value).encode("utf-8"))
+
+    def test_iter_canonical_is_identical_to_canonical_on_random_documents(self):
+        rng = random.Random(42)
+        for _ in range(200):
+            document = {"root": random_document(rng)}
+            self.assertEqual(b"".join(self.codec.iter_canonical(document, 16)),
+                             self.codec.canonical(document).encode("utf-8"))
+
+    def test_iter_canonical_yields_bounded_chunks(self):
+        document = {str(index): "x" * 100 for index in range(1000)}
+
+        sizes = [len(chunk) for chunk in self.codec.iter_canonical(document, 1024)]
+
+        self.assertGreater(len(sizes), 50)
+        self.assertLess(max(sizes), 1024 + 110)
+
+
+class TestGetCodec(TestCase):
+
+    def test_get_codec_returns_stdlib_codec(self):
+        self.assertIsInstance(get_codec("stdlib"), StdlibJSONCodec)
+
+    @skipUnless(orjson, "orjson is not installed")
+    def test_get_codec_returns_orjson_codec_when_available(self):
+        self.assertIsInstance(get_codec("auto"), OrjsonCodec)
+        self.assertIsInstance(get_codec("orjson"), OrjsonCodec)
+
+    def test_get_codec_raises_on_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_codec("pickle")
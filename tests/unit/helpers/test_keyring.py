@@ -0,0 +1,86 @@
+from unittest import TestCase
+import json
+import os
+import pickle
+from tempfile import TemporaryDirectory
+
+from api.helpers.keyring import KeyRing
+
+
+class TestKeyRing(TestCase):
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "keys.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_keys(self, document: dict, mtime: int):
+        with open(self.path, "w") as file:
+            json.dump(document, file)
+        os.utime(self.path, ns=(mtime, mtime))
+
+    def test_keyring_holds_inline_keys_and_legacy_secret(self):
+        keyring = KeyRing(secret="legacy", keys=json.dumps({"active": "k2", "keys": {"k1": "one", "k2": "two"}}))
+
+        self.assertEqual(keyring.active_id, "k2")
+        for key_id in ("k1", "k2", KeyRing.LEGACY_KEY_ID):
+            with self.subTest(key_id=key_id):
+                self.assertIsNotNone(keyring.get(key_id)[1])
+        self.assertEqual(keyring.get(), ("k2", keyring.get("k2")[1]))
+        self.assertIsNone(keyring.get("unknown")[1])
+
+    def test_keyring_defaults_to_legacy_secret(self):
+        keyring = KeyRing(secret="legacy")
+
+        self.assertEqual(keyring.active_id, KeyRing.LEGACY_KEY_ID)
+
+    def test_keyring_raises_ValueError_on_invalid_keys(self):
+        invalid = [
+            {"active": "k3", "keys": {"k1": "one"}},
+            {"active": "k:1", "keys": {"k:1": "one"}},
+            {"active": "k1", "keys": {"k1": ""}},
+            {"keys": {"k1": "one"}},
+        ]
+        for document in invalid:
+            with self.subTest(document=document):
+                with self.assertRaises(ValueError):
+                    KeyRing(keys=json.dumps(document))
+
+    def test_keyring_reloads_changed_file(self):
+        self.write_keys({"active": "k1", "keys": {"k1": "one"}}, mtime=1_000_000_000)
+        keyring = KeyRing(path=self.path, reload_interval=0)
+        fingerprint = keyring.fingerprint
+
+        self.write_keys({"active": "k2", "keys": {"k1": "one", "k2": "two"}}, mtime=2_000_000_000)
+
+        self.assertEqual(keyring.active_id, "k2")
+        self.assertNotEqual(keyring.fingerprint, fingerprint)
+        self.assertEqual(keyring.version, 2)
+
+    def test_keyring_waits_reload_interval_before_checking_file(self):
+        self.write_keys({"active": "k1", "keys": {"k1": "one"}}, mtime=1_000_000_000)
+        keyring = KeyRing(path=self.path, reload_interval=3600)
+
+        self.write_keys({"active": "k2", "keys": {"k1": "one", "k2": "two"}}, mtime=2_000_000_000)
+
+        self.assertEqual(keyring.active_id, "k1")
+
+    def test_keyring_keeps_current_keys_on_invalid_file(self):
+        self.write_keys({"active": "k1", "keys": {"k1": "one"}}, mtime=1_000_000_000)
+        keyring = KeyRing(path=self.path, reload_interval=0)
+
+        with open(self.path, "w") as file:
+            file.write("{not json")
+        with self.assertLogs("api.helpers.keyring", level="ERROR"):
+            self.assertEqual(keyring.active_id, "k1")
+        self.assertEqual(keyring.version, 1)
+
+    def test_keyring_is_picklable(self):
+        keyring = KeyRing(secret="legacy", keys=json.dumps({"active": "k1", "keys": {"k1": "one"}}))
+
+        copy = pickle.loads(pickle.dumps(keyring))
+
+        self.assertEqual(copy.active_id, "k1")
+        self.assertEqual(copy.fingerprint, keyring.fingerprint)
@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+from api.helpers.codecs import StdlibJSONCodec
+from api.helpers.merkle import MerkleTree, ProofError
+
+
+class TestMerkleTree(TestCase):
+
+    def setUp(self):
+        self.codec = StdlibJSONCodec()
+
+    def test_every_proof_leads_to_root(self):
+        for size in range(1, 10):
+            document = {f"key{index}": {"value": index} for index in range(size)}
+            tree = MerkleTree(document, self.codec)
+
+            for key, proof in tree.proofs().items():
+                leaf = MerkleTree.leaf_hash(self.codec, key, document[key])
+                self.assertEqual(MerkleTree.root_from_proof(leaf, proof), tree.root, (size, key))
+
+    def test_proof_length_is_logarithmic(self):
+        tree = MerkleTree({str(index): index for index in range(1000)}, self.codec)
+
+        self.assertLessEqual(max(len(proof) for proof in tree.proofs().values()), 10)
+
+    def test_root_does_not_depend_on_keys_order(self):
+        tree1 = MerkleTree({"a": 1, "b": [2, 3], "c": None}, self.codec)
+        tree2 = MerkleTree({"c": None, "b": [2, 3], "a": 1}, self.codec)
+
+        self.assertEqual(tree1.root, tree2.root)
+
+    def test_root_changes_with_any_member(self):
+        roots = {
+            MerkleTree({}, self.codec).root,
+            MerkleTree({"a": 1}, self.codec).root,
+            MerkleTree({"a": 2}, self.codec).root,
+            MerkleTree({"b": 1}, self.codec).root,
+            MerkleTree({"a": 1, "b": 1}, self.codec).root,
+        }
+
+        self.assertEqual(len(roots), 5)
+
+    def test_tampered_value_does_not_lead_to_root(self):
+        tree = MerkleTree({"a": 1, "b": 2, "c": 3}, self.codec)
+
+        leaf = MerkleTree.leaf_hash(self.codec, "b", 3)
+
+        self.assertNotEqual(MerkleTree.root_from_proof(leaf, tree.proof("b")), tree.root)
+
+    def test_root_from_proof_raises_on_malformed_proof(self):
+        leaf = MerkleTree.leaf_hash(self.codec, "a", 1)
+        for proof in (None, {}, [{"side": "up", "hash": "00" * 32}], [{"side": "left", "hash": "zz"}],
+                      [{"side": "left", "hash": "00"}], [{"side": "left"}], ["00" * 32]):
+            with self.assertRaises(ProofError, msg=repr(proof)):
+                MerkleTree.root_from_proof(leaf, proof)
@@ -0,0 +1,127 @@
+from unittest import TestCase
+from unittest.mock import patch
+import json
+import os
+from tempfile import TemporaryDirectory
+
+from api.helpers.metrics import Metrics
+
+
+class TestMetricsRecording(TestCase):
+
+    def test_disabled_metrics_record_nothing(self):
+        metrics = Metrics(enabled=False, directory="")
+
+        with metrics.timer("stage", route="encrypt"):
+            pass
+        metrics.increment("errors", route="encrypt")
+        metrics.observe_size("size", 10, route="encrypt")
+
+        self.assertDictEqual(metrics.snapshot(), {"histograms": [], "counters": [], "gauges": []})
+
+    def test_render_exposes_histograms_counters_and_gauges(self):
+        metrics = Metrics(enabled=True, directory="")
+        metrics.add_collector("cache", lambda: {"hits": 3, "entries": 2}, counters=("hits",))
+
+        with metrics.timer("stage", route="encrypt", stage="parse"):
+            pass
+        metrics.observe_size("size", 1000, route="encrypt")
+        metrics.increment("errors", route="decrypt", cause="BinasciiError")
+        rendered = metrics.render()
+
+        self.assertIn("# TYPE stage histogram", rendered)
+        self.assertIn('stage_bucket{route="encrypt",stage="parse",le="+Inf"} 1', rendered)
+        self.assertIn('stage_count{route="encrypt",stage="parse"} 1', rendered)
+        self.assertIn('size_bucket{route="encrypt",le="1024"} 1', rendered)
+        self.assertIn('size_bucket{route="encrypt",le="256"} 0', rendered)
+        self.assertIn('errors{cause="BinasciiError",route="decrypt"} 1', rendered)
+        self.assertIn("# TYPE cache_total counter", rendered)
+        self.assertIn('cache_total{type="hits"} 3', rendered)
+        self.assertIn("# TYPE cache gauge", rendered)
+        self.assertIn('cache{type="entries"} 2', rendered)
+
+
+class TestMetricsAggregation(TestCase):
+
+    def test_collect_merges_snapshots_of_other_processes(self):
+        with TemporaryDirectory() as directory:
+            metrics = Metrics(enabled=True, directory=directory)
+            metrics.increment("errors", route="verify")
+            metrics.flush()
+
+            # Another worker wrote its own snapshot
+            other = Metrics(enabled=True, directory="")
+            other.increment("errors", route="verify", amount=2)
+            with open(os.path.join(directory, "metrics-1.json"), "w") as snapshot_file:
+                json.dump(other.snapshot(), snapshot_file)
+
+            rendered = metrics.render()
+
+        self.assertIn('errors{route="verify"} 3', rendered)
+
+    @patch("api.helpers.metrics.process_exists", return_value=True)
+    def test_collect_sums_collected_counters_and_keeps_maximum_of_shared_gauges(self, _):
+        with TemporaryDirectory() as directory:
+            workers = [Metrics(enabled=True, directory=directory) for _ in range(4)]
+            for index, worker in enumerate(workers):
+                worker.add_collector("index", lambda: {"hits": 9, "misses": 1, "slots": 64},
+                                     counters=("hits", "misses"), shared=("slots",))
+                worker.add_collector("cache", lambda: {"entries": 5})
+                with open(os.path.join(directory, f"metrics-{index + 1}.json"), "w") as snapshot_file:
+                    json.dump(worker.snapshot(), snapshot_file)
+
+            rendered = Metrics(enabled=True, directory=directory).render()
+
+        self.assertIn('index_total{type="hits"} 36', rendered)
+        self.assertIn('index_total{type="misses"} 4', rendered)
+        self.assertIn('index{type="slots"} 64', rendered)
+        self.assertIn('cache{type="entries"} 20', rendered)
+
+    def test_collect_removes_snapshots_of_exited_processes(self):
+        with TemporaryDirectory() as directory:
+            metrics = Metrics(enabled=True, directory=directory)
+            other = Metrics(enabled=True, directory="")
+            other.increment("errors", route="verify", amount=2)
+            for pid in (1, 2):
+                with open(metrics.snapshot_path(pid), "w") as snapshot_file:
+                    json.dump(other.snapshot(), snapshot_file)
+
+            with patch("api.helpers.metrics.process_exists", side_effect=lambda pid: pid == 1):
+                rendered = metrics.render()
+
+            self.assertIn('errors{route="verify"} 2', rendered)
+            self.assertTrue(os.path.exists(metrics.snapshot_path(1)))
+            self.assertFalse(os.path.exists(metrics.snapshot_path(2)))
+
+    def test_remove_snapshot_removes_the_snapshot_of_a_process(self):
+        with TemporaryDirectory() as directory:
+            metrics = Metrics(enabled=True, directory=directory)
+            metrics.flush()
+
+            metrics.remove_snapshot(os.getpid())
+            metrics.remove_snapshot(os.getpid())
+
+            self.assertListEqual(os.listdir(directory), [])
+
+    def test_add_counters_adds_counts_of_other_processes(self):
+        metrics = Metrics(enabled=True, directory="")
+        metrics.increment("errors", route="decrypt")
+        other = Metrics(enabled=True, directory="")
+        other.increment("errors", route="decrypt", amount=2)
+        other.increment("errors", route="encrypt")
+
+        metrics.add_counters(other.counters())
+
+        self.assertDictEqual(metrics.counters(), {("errors", (("route", "decrypt"),)): 3,
+                                                  ("errors", (("route", "encrypt"),)): 1})
+
+    def test_maybe_flush_waits_for_flush_interval(self):
+        with TemporaryDirectory() as directory:
+            metrics = Metrics(enabled=True, directory=directory, flush_interval=3600)
+
+            metrics.maybe_flush()
+            self.assertFalse(os.path.exists(metrics.snapshot_path()))
+
+            metrics.flush_interval = 0
+            metrics.maybe_flush()
+            self.assertTrue(os.path.exists(metrics.snapshot_path()))
@@ -0,0 +1,73 @@
+from unittest import TestCase
+
+from api.helpers.selectors import SelectorError, Step, parse_selector, select, select_all
+
+
+class TestParseSelector(TestCase):
+
+    def test_parse_selector_supports_keys_indexes_and_wildcards(self):
+        steps = parse_selector("$.users[0]['full name'].*[*]")
+
+        self.assertTupleEqual(steps, (
+            (Step.key, "users"),
+            (Step.index, 0),
+            (Step.key, "full name"),
+            (Step.wildcard, None),
+            (Step.wildcard, None),
+        ))
+
+    def test_parse_selector_supports_descendants(self):
+        self.assertTupleEqual(parse_selector("$..secret"), ((Step.descendant, "secret"),))
+        self.assertTupleEqual(parse_selector("$..*"), ((Step.descendant, None),))
+
+    def test_parse_selector_accepts_selector_without_root(self):
+        self.assertTupleEqual(parse_selector("name"), parse_selector("$.name"))
+
+    def test_parse_selector_raises_on_invalid_selector(self):
+        for selector in ("$", "", "$.a[", "$.a[b]", "$.a..", "$.a[1.5]"):
+            with self.subTest(selector=selector):
+                with self.assertRaises(SelectorError):
+                    parse_selector(selector)
+
+
+class TestSelect(TestCase):
+
+    def setUp(self):
+        self.document = {
+            "users": [
+                {"name": "Alice", "password": "a", "profile": {"password": "nested"}},
+                {"name": "Bob", "password": "b"},
+            ],
+            "password": "root",
+        }
+
+    def values(self, matches):
+        return [container[key] for container, key in matches]
+
+    def test_select_matches_keys_and_wildcards(self):
+        self.assertListEqual(self.values(select(self.document, "$.users[*].password")), ["a", "b"])
+
+    def test_select_matches_negative_indexes(self):
+        self.assertListEqual(self.values(select(self.document, "$.users[-1].name")), ["Bob"])
+
+    def test_select_matches_descendants_at_any_depth(self):
+        self.assertCountEqual(self.values(select(self.document, "$..password")), ["root", "a", "b", "nested"])
+
+    def test_select_ignores_missing_paths_and_type_mismatches(self):
+        for selector in ("$.missing", "$.users.name", "$.password[0]", "$.users[5]"):
+            with self.subTest(selector=selector):
+                self.assertListEqual(select(self.document, selector), [])
+
+    def test_select_walks_deep_documents_without_recursion(self):
+        document = leaf = {}
+        for _ in range(10_000):
+            leaf["child"] = {}
+            leaf = leaf["child"]
+        leaf["secret"] = "value"
+
+        self.assertListEqual(self.values(select(document, "$..secret")), ["value"])
+
+    def test_select_all_deduplicates_and_sorts_shallowest_first(self):
+        matches = select_all(self.document, ["$.users[0].profile.password", "$.users[0]", "$.users[0]"])
+
+        self.assertListEqual([key for _, key in matches], [0, "password"])
@@ -0,0 +1,147 @@
+from unittest import TestCase
+from unittest.mock import patch
+from http import HTTPStatus
+import os
+import pickle
+
+from api.controllers.encryption import EncryptionHandler
+from api.controllers.signature import SignatureHandler
+from api.helpers.crypters import Base64Crypter
+from api.helpers.metrics import MetricNames, Metrics
+from api.helpers.offload import ProcessOffloader, balanced_chunks, estimate_size
+from api.helpers.signer import HMACSigner
+
+
+class TestProcessOffloaderThreshold(TestCase):
+
+    def test_should_offload_only_above_threshold(self):
+        offloader = ProcessOffloader(threshold=100)
+
+        self.assertFalse(offloader.should_offload(None))
+        self.assertFalse(offloader.should_offload(99))
+        self.assertTrue(offloader.should_offload(100))
+
+    def test_should_not_offload_when_disabled(self):
+        offloader = ProcessOffloader(threshold=0)
+
+        self.assertFalse(offloader.should_offload(10 ** 9))
+
+
+class TestProcessOffloaderRun(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.offloader = ProcessOffloader(threshold=10, max_workers=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.offloader.shutdown()
+
+    def test_offloaded_encryption_matches_inline_encryption(self):
+        handler = EncryptionHandler(crypter=Base64Crypter(), offloader=self.offloader)
+        payload = {"name": "Alice", "metadata": {"country": "FR"}}
+
+        offloaded = handler.encrypt_payload(payload, size_hint=1000)
+        inline = handler.encrypt_payload(payload)
+
+        self.assertEqual(offloaded, inline)
+        self.assertEqual(handler.decrypt_payload(offloaded[0], size_hint=1000), (payload, HTTPStatus.OK))
+
+    def test_offloaded_signature_matches_inline_signature(self):
+        handler = SignatureHandler(signer=HMACSigner(secret="key"), offloader=self.offloader)
+        payload = {"name": "Alice"}
+
+        self.assertEqual(handler.generate_signature(payload, size_hint=1000), handler.generate_signature(payload))
+
+
+class TestProcessOffloaderMetrics(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.offloader = ProcessOffloader(threshold=10, max_workers=1)
+        # Pool processes are spawned with the environment of the parent, and enable their metrics from it
+        with patch.dict(os.environ, METRICS_ENABLED="true"):
+            cls.offloader.get_executor().submit(os.getpid).result()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.offloader.shutdown()
+
+    def test_offloaded_decryption_errors_are_counted_by_the_calling_process(self):
+        handler = EncryptionHandler(crypter=Base64Crypter(), offloader=self.offloader)
+        payload = {"name": EncryptionHandler.SENTINEL + "not base64"}
+        metrics = Metrics(enabled=True, directory="")
+
+        with patch("api.helpers.offload.metrics", metrics):
+            _, status = handler.decrypt_payload(payload, size_hint=1000)
+            handler.decrypt_payload(payload, size_hint=1000)
+
+        self.assertEqual(status, HTTPStatus.BAD_REQUEST)
+        key = (MetricNames.errors_total, (("cause", "BinasciiError"), ("route", "decrypt")))
+        self.assertDictEqual(metrics.counters(), {key: 2})
+
+
+class TestProcessOffloaderParallelFields(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.offloader = ProcessOffloader(threshold=0, max_workers=2)
+        cls.handler = EncryptionHandler(crypter=Base64Crypter(), offloader=cls.offloader, parallel_threshold=10)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.offloader.shutdown()
+
+    def test_parallel_encryption_matches_inline_encryption_and_keeps_order(self):
+        payload = {f"key{index}": {"value": "x" * (index * 37 % 11)} for index in range(50)}
+
+        parallel = self.handler.encrypt_payload(payload, size_hint=1000)
+        inline = self.handler.encrypt_payload(payload)
+
+        self.assertEqual(parallel, inline)
+        self.assertListEqual(list(parallel[0]), list(payload))
+        decrypted = self.handler.decrypt_payload(parallel[0], size_hint=1000)
+        self.assertEqual(decrypted, (payload, HTTPStatus.OK))
+        self.assertListEqual(list(decrypted[0]), list(payload))
+
+    def test_parallel_decryption_returns_BADREQUEST_on_any_invalid_value(self):
+        payload, _ = self.handler.encrypt_payload({f"key{index}": index for index in range(10)})
+        payload["key7"] = EncryptionHandler.SENTINEL + "not base64"
+
+        _, status = self.handler.decrypt_payload(payload, size_hint=1000)
+
+        self.assertEqual(status, HTTPStatus.BAD_REQUEST)
+
+    def test_should_parallelise_only_above_threshold_with_several_items(self):
+        self.assertFalse(self.handler.should_parallelise({"a": 1, "b": 2}, None))
+        self.assertFalse(self.handler.should_parallelise({"a": 1, "b": 2}, 9))
+        self.assertFalse(self.handler.should_parallelise({"a": 1}, 1000))
+        self.assertTrue(self.handler.should_parallelise({"a": 1, "b": 2}, 10))
+
+
+class TestBalancedChunks(TestCase):
+
+    def test_chunks_hold_every_item_once_with_balanced_sizes(self):
+        payload = {"big": "x" * 1000, "medium": "x" * 600, "small": "x" * 400, "tiny": 1}
+
+        chunks = balanced_chunks(payload, 2)
+
+        self.assertEqual(len(chunks), 2)
+        self.assertDictEqual({key: value for chunk in chunks for key, value in chunk.items()}, payload)
+        self.assertCountEqual([set(chunk) for chunk in chunks], [{"big", "tiny"}, {"medium", "small"}])
+
+    def test_no_more_chunks_than_items(self):
+        self.assertEqual(len(balanced_chunks({"a": 1}, 8)), 1)
+
+    def test_estimate_size_walks_containers(self):
+        self.assertGreater(estimate_size({"a": ["x" * 100, {"b": "y" * 100}]}), 200)
+
+
+class TestHMACSignerPickling(TestCase):
+
+    def test_unpickled_signer_generates_same_signatures(self):
+        signer = HMACSigner(secret="key")
+
+        unpickled = pickle.loads(pickle.dumps(signer))
+
+        self.assertEqual(unpickled.signature("message"), signer.signature("message"))
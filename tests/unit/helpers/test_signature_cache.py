@@ -0,0 +1,94 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from api.helpers.cache import SignatureCache
+
+
+def digest(cache: SignatureCache, body: str) -> bytes:
+    return cache.digest(body.encode("utf-8"), "application/json")
+
+
+class TestSignatureCache(TestCase):
+
+    def setUp(self):
+        self.cache = SignatureCache(max_entries=2, max_bytes=1024)
+        self.cache.bind("key")
+
+    def test_get_returns_cached_signature_and_counts_hits_and_misses(self):
+        key = digest(self.cache, '{"a":1}')
+
+        with self.subTest("Missing entry"):
+            self.assertIsNone(self.cache.get(key, "key"))
+
+        with self.subTest("Cached entry"):
+            self.cache.set(key, "signature", "key")
+            self.assertEqual(self.cache.get(key, "key"), "signature")
+
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_digest_depends_on_body_and_media_type(self):
+        body = b'{"a":1}'
+
+        self.assertEqual(self.cache.digest(body, "application/json"), self.cache.digest(body, "application/json"))
+        self.assertNotEqual(self.cache.digest(body, "application/json"), self.cache.digest(body, "application/cbor"))
+        self.assertNotEqual(self.cache.digest(body, "application/json"), digest(self.cache, '{"a": 1}'))
+
+    def test_set_evicts_least_recently_used_entry_above_max_entries(self):
+        first, second, third = (digest(self.cache, str(i)) for i in range(3))
+        self.cache.set(first, "1", "key")
+        self.cache.set(second, "2", "key")
+        self.cache.get(first, "key")
+
+        self.cache.set(third, "3", "key")
+
+        self.assertEqual(self.cache.get(first, "key"), "1")
+        self.assertIsNone(self.cache.get(second, "key"))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_set_evicts_entries_above_max_bytes(self):
+        cache = SignatureCache(max_entries=10, max_bytes=2 * SignatureCache.DIGEST_SIZE + 2)
+        cache.bind("key")
+        first, second = digest(cache, "1"), digest(cache, "2")
+        cache.set(first, "1", "key")
+
+        cache.set(second, "22", "key")
+
+        self.assertIsNone(cache.get(first, "key"))
+        self.assertEqual(cache.get(second, "key"), "22")
+        self.assertLessEqual(cache.stats()["bytes"], cache.max_bytes)
+
+    @patch("api.helpers.cache.monotonic")
+    def test_get_ignores_expired_entries(self, mo_monotonic):
+        cache = SignatureCache(max_entries=10, max_bytes=1024, ttl=60)
+        cache.bind("key")
+        key = digest(cache, "1")
+        mo_monotonic.return_value = 1000
+        cache.set(key, "1", "key")
+
+        mo_monotonic.return_value = 1059
+        self.assertEqual(cache.get(key, "key"), "1")
+
+        mo_monotonic.return_value = 1061
+        self.assertIsNone(cache.get(key, "key"))
+
+    def test_get_empties_cache_when_generation_changes(self):
+        key = digest(self.cache, "1")
+        self.cache.set(key, "1", "key")
+
+        with self.subTest("Same generation keeps entries"):
+            self.assertEqual(self.cache.get(key, "key"), "1")
+
+        with self.subTest("New generation empties cache"):
+            self.assertIsNone(self.cache.get(key, "rotated key"))
+            self.assertEqual(self.cache.stats()["bytes"], 0)
+
+    def test_set_drops_signature_of_previous_generation(self):
+        key = digest(self.cache, "1")
+        # Keys rotated while signing: another lookup already bound the cache to the new generation
+        self.cache.get(digest(self.cache, "2"), "rotated key")
+
+        self.cache.set(key, "1", "key")
+
+        self.assertIsNone(self.cache.get(key, "rotated key"))
+        self.assertEqual(self.cache.stats()["entries"], 0)
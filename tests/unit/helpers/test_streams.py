@@ -0,0 +1,30 @@
+from unittest import TestCase
+import io
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from api.helpers.streams import CappedReader
+
+
+class TestCappedReader(TestCase):
+
+    def test_read_returns_body_up_to_limit(self):
+        stream = CappedReader(io.BytesIO(b"0" * 1000), 1000)
+
+        self.assertEqual(stream.read(), b"0" * 1000)
+        self.assertEqual(stream.size, 1000)
+
+    def test_read_raises_REQUESTENTITYTOOLARGE_above_limit(self):
+        stream = CappedReader(io.BytesIO(b"0" * 1001), 1000, error="Larger than {limit} bytes")
+
+        with self.assertRaises(RequestEntityTooLarge) as context:
+            stream.read()
+
+        self.assertIn("Larger than 1000 bytes", str(context.exception))
+
+    def test_read_source_transforms_read_bytes(self):
+        class UpperReader(CappedReader):
+            def read_source(self, size):
+                return self.stream.read(size).upper()
+
+        self.assertEqual(UpperReader(io.BytesIO(b"abc"), 10).read(), b"ABC")
@@ -0,0 +1,64 @@
+import os
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+from api.helpers.cache import VerifiedIndex
+
+
+class TestVerifiedIndex(TestCase):
+
+    def setUp(self):
+        self.index = VerifiedIndex(max_entries=64)
+
+    def test_contains_added_keys_and_counts_hits_and_misses(self):
+        key = self.index.key(b'{"a":1}', "application/json", "fingerprint")
+
+        self.assertFalse(self.index.contains(key))
+        self.index.add(key)
+        self.assertTrue(self.index.contains(key))
+
+        self.assertDictEqual(self.index.stats(), {"hits": 1, "misses": 1, "slots": 64})
+
+    def test_key_depends_on_body_mimetype_and_fingerprint(self):
+        keys = {
+            self.index.key(b'{"a":1}', "application/json", "fingerprint"),
+            self.index.key(b'{"a":2}', "application/json", "fingerprint"),
+            self.index.key(b'{"a":1}', "application/cbor", "fingerprint"),
+            self.index.key(b'{"a":1}', "application/json", "rotated"),
+        }
+
+        self.assertEqual(len(keys), 4)
+
+    def test_add_replaces_entry_of_same_slot(self):
+        index = VerifiedIndex(max_entries=1)
+        first, second = index.key(b"1", "m", "f"), index.key(b"2", "m", "f")
+
+        index.add(first)
+        index.add(second)
+
+        self.assertFalse(index.contains(first))
+        self.assertTrue(index.contains(second))
+
+    def test_entries_expire_after_ttl(self):
+        index = VerifiedIndex(max_entries=8, ttl=10)
+        key = index.key(b"1", "m", "f")
+
+        with patch("api.helpers.cache.monotonic", return_value=100):
+            index.add(key)
+        with patch("api.helpers.cache.monotonic", return_value=110):
+            self.assertTrue(index.contains(key))
+        with patch("api.helpers.cache.monotonic", return_value=111):
+            self.assertFalse(index.contains(key))
+
+    @skipUnless(hasattr(os, "fork"), "Requires fork")
+    def test_shared_index_is_visible_from_forked_processes(self):
+        index = VerifiedIndex(max_entries=8, shared=True)
+        key = index.key(b"1", "m", "f")
+
+        pid = os.fork()
+        if pid == 0:
+            index.add(key)
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        self.assertTrue(index.contains(key))
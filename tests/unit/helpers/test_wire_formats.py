@@ -0,0 +1,54 @@
+from unittest import TestCase, skipUnless
+
+from api.helpers.crypters import Ciphertext
+from api.helpers.formats import CBORFormat, MsgpackFormat, get_wire_format
+
+
+class WireFormatTests:
+    """Tests shared by all binary wire formats, run by the concrete test cases below."""
+    wire_format = None
+
+    def test_roundtrip_preserves_json_values(self):
+        document = {"str": "é", "int": 2 ** 40, "float": 1.5, "none": None, "bool": True, "list": [1, {"a": []}]}
+
+        self.assertEqual(self.wire_format.decode(self.wire_format.encode(document)), document)
+
+    def test_roundtrip_preserves_ciphertexts(self):
+        document = {"secret": Ciphertext(b"\x00raw bytes"), "list": [Ciphertext(b"")]}
+
+        decoded = self.wire_format.decode(self.wire_format.encode(document))
+
+        self.assertEqual(decoded, document)
+        self.assertIsInstance(decoded["secret"], Ciphertext)
+
+    def test_ciphertext_is_smaller_than_its_base64_text_form(self):
+        data = bytes(range(256)) * 4
+
+        binary = self.wire_format.encode({"secret": Ciphertext(data)})
+
+        self.assertLess(len(binary), len(data) * 4 / 3)
+
+    def test_encode_raises_TypeError_on_unknown_types(self):
+        with self.assertRaises(TypeError):
+            self.wire_format.encode({"object": object()})
+
+    def test_get_wire_format_returns_format_by_mimetype(self):
+        self.assertIs(get_wire_format(self.wire_format.mimetype), self.wire_format)
+
+
+@skipUnless(MsgpackFormat().available, "msgpack is not installed")
+class TestMsgpackFormat(WireFormatTests, TestCase):
+    wire_format = get_wire_format(MsgpackFormat.mimetype)
+
+
+@skipUnless(CBORFormat().available, "cbor2 is not installed")
+class TestCBORFormat(WireFormatTests, TestCase):
+    wire_format = get_wire_format(CBORFormat.mimetype)
+
+
+class TestGetWireFormat(TestCase):
+
+    def test_get_wire_format_returns_None_for_json_and_unknown_mimetypes(self):
+        for mimetype in ("application/json", "text/plain", ""):
+            with self.subTest(mimetype=mimetype):
+                self.assertIsNone(get_wire_format(mimetype))